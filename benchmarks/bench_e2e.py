@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+"""
+End-to-end load benchmark against local Strava/Poke stand-ins.
+
+Measures:
+  • webhook throughput (req/s) and ack latency (p50/p99) on POST /strava/webhook
+  • event → Poke delivery latency
+  • latency of every MCP tool registered in mcp_strava.app
+  • memory growth over a soak run (tracemalloc, RSS, webhook dedupe cache size)
+
+Usage:
+    python benchmarks/bench_e2e.py --out bench_results.json
+    python benchmarks/bench_e2e.py --out new.json --compare bench_results.json
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import platform
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from typing import Any, Dict, List
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path[:0] = [HERE, os.path.join(ROOT, "src")]
+
+from fakes import FakeUpstream  # noqa: E402
+
+# Arguments used when benchmarking each MCP tool; tools missing here are called without arguments
+TOOL_ARGS: Dict[str, Dict[str, Any]] = {
+    "get_recent_activities": {"limit": 10},
+    "get_weekly_summary": {"include_content": True},
+    "analyze_activity_by_id": {"activity_id": 10_000_000_001},
+    "analyze_activities": {"activity_ids": [10_000_000_000 + i for i in range(10)]},
+    "get_activities_by_date_range": {"date": datetime.now(timezone.utc).strftime("%Y-%m-%d")},
+    "start_strava_auth": {},
+    "export_activity_history": {"format": "csv", "sport": "run"},
+    "search_activities": {"sport": "ride", "min_distance_km": 50, "name": "ride"},
+    "find_activities_near": {"lat": 48.8566, "lng": 2.3522, "radius_m": 300},
+    "get_route_history": {},
+    "get_segment_history": {},
+    "check_strava_connection": {},
+}
+
+
+def pct(xs: List[float], p: float) -> float | None:
+    if not xs:
+        return None
+    xs = sorted(xs)
+    k = min(len(xs) - 1, max(0, int(round(p / 100.0 * (len(xs) - 1)))))
+    return xs[k]
+
+
+def stats_ms(xs: List[float]) -> Dict[str, Any]:
+    ms = [x * 1000.0 for x in xs]
+    return {
+        "n": len(ms),
+        "mean_ms": round(statistics.fmean(ms), 3) if ms else None,
+        "p50_ms": round(pct(ms, 50), 3) if ms else None,
+        "p90_ms": round(pct(ms, 90), 3) if ms else None,
+        "p99_ms": round(pct(ms, 99), 3) if ms else None,
+        "max_ms": round(max(ms), 3) if ms else None,
+    }
+
+
+def rss_bytes() -> int | None:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except Exception:
+        try:
+            import resource
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        except Exception:
+            return None
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def configure_env(upstream: FakeUpstream, workdir: str) -> None:
+    os.environ.update({
+        "STRAVA_CLIENT_ID": "bench",
+        "STRAVA_CLIENT_SECRET": "bench",
+        "STRAVA_ACCESS_TOKEN": "bench-access",
+        "STRAVA_REFRESH_TOKEN": "bench-refresh",
+        "STRAVA_EXPIRES_AT": str(int(time.time()) + 24 * 3600),
+        "STRAVA_API_URL": f"{upstream.url}/api/v3",
+        "STRAVA_OAUTH_URL": f"{upstream.url}/oauth",
+        "POKE_API_KEY": "bench",
+        "POKE_INBOUND_URL": f"{upstream.url}/poke",
+        "TOKEN_FILE": os.path.join(workdir, "tokens.json"),
+        "SNAPSHOT_FILE": os.path.join(workdir, "snapshot.bin"),
+        "DB_FILE": os.path.join(workdir, "strava.db"),
+        "PUBLIC_URL": "http://127.0.0.1",
+    })
+
+
+class ServerThread:
+    """Runs the real ASGI app (src/server.py) under uvicorn in a background thread"""
+
+    def __init__(self, app, port: int):
+        import uvicorn
+        self.port = port
+        self.server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", lifespan="on"))
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        deadline = time.time() + 15
+        while not self.server.started:
+            if time.time() > deadline:
+                raise RuntimeError("server did not start")
+            time.sleep(0.02)
+        return self
+
+    def __exit__(self, *exc):
+        self.server.should_exit = True
+        self.thread.join(timeout=10)
+
+
+async def fire_webhooks(base: str, ids: List[int], concurrency: int) -> Dict[str, Any]:
+    import httpx
+    sem = asyncio.Semaphore(concurrency)
+    lat: List[float] = []
+    sent: Dict[int, float] = {}
+    errors = 0
+
+    async with httpx.AsyncClient(base_url=base, timeout=60) as client:
+        async def one(act_id: int):
+            nonlocal errors
+            evt = {"object_type": "activity", "aspect_type": "create", "object_id": act_id, "owner_id": 42}
+            async with sem:
+                t0 = time.perf_counter()
+                sent.setdefault(act_id, t0)
+                try:
+                    r = await client.post("/strava/webhook", json=evt)
+                    if r.status_code >= 400:
+                        errors += 1
+                except Exception:
+                    errors += 1
+                lat.append(time.perf_counter() - t0)
+
+        t_start = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in ids))
+        wall = time.perf_counter() - t_start
+
+    return {"latencies": lat, "sent": sent, "errors": errors, "wall_s": wall}
+
+
+def event_to_poke(upstream: FakeUpstream, sent: Dict[int, float], wait_s: float = 5.0) -> List[float]:
+    deadline = time.time() + wait_s
+    while len(upstream.poke_received) < len(sent) and time.time() < deadline:
+        time.sleep(0.05)
+    out = []
+    for rec in list(upstream.poke_received):
+        m = re.search(r"bench-(\d+)", rec["body"])
+        if m and int(m.group(1)) in sent:
+            out.append(rec["t"] - sent[int(m.group(1))])
+    return out
+
+
+async def bench_tools(mcp, iterations: int) -> Dict[str, Any]:
+    from fastmcp import Client
+    results: Dict[str, Any] = {}
+    async with Client(mcp) as client:
+        tools = await client.list_tools()
+        for tool in tools:
+            args = TOOL_ARGS.get(tool.name, {})
+            lat, errors, last_error = [], 0, None
+            for _ in range(iterations):
+                t0 = time.perf_counter()
+                try:
+                    await client.call_tool(tool.name, args)
+                except Exception as e:
+                    errors += 1
+                    last_error = repr(e)[:200]
+                lat.append(time.perf_counter() - t0)
+            results[tool.name] = {**stats_ms(lat), "errors": errors, "last_error": last_error}
+    return results
+
+
+def soak(base: str, seconds: float, concurrency: int, id_space: int) -> Dict[str, Any]:
+    from mcp_strava.services import shared_state
+    samples = []
+    t_end = time.time() + seconds
+    next_id = 0
+    while time.time() < t_end:
+        # half the ids repeat so the dedupe path is exercised as well as the insert path
+        batch = [20_000_000_000 + ((next_id + i) % id_space if i % 2 else next_id + i) for i in range(concurrency * 4)]
+        next_id += len(batch)
+        asyncio.run(fire_webhooks(base, batch, concurrency))
+        cur, peak = tracemalloc.get_traced_memory()
+        samples.append({
+            "t": round(seconds - (t_end - time.time()), 2),
+            "events": next_id,
+            "traced_bytes": cur,
+            "traced_peak_bytes": peak,
+            "rss_bytes": rss_bytes(),
+            "dedupe_entries": shared_state.backend().stats().get("claims"),
+        })
+    growth = None
+    if len(samples) >= 2 and samples[-1]["events"] > samples[0]["events"]:
+        growth = (samples[-1]["traced_bytes"] - samples[0]["traced_bytes"]) / (samples[-1]["events"] - samples[0]["events"])
+    return {"samples": samples, "traced_bytes_per_event": round(growth, 2) if growth is not None else None}
+
+
+def git_rev() -> str | None:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+    except Exception:
+        return None
+
+
+def compare(new: Dict[str, Any], old: Dict[str, Any]) -> None:
+    def row(label, a, b):
+        if a is None or b is None:
+            return
+        delta = (a - b) / b * 100 if b else 0.0
+        print(f"  {label:<48} {b:>12.3f} → {a:>12.3f}  ({delta:+.1f}%)")
+
+    print(f"[BENCH] compare {old.get('meta', {}).get('git')} → {new.get('meta', {}).get('git')}")
+    row("webhook rps", new["webhook"]["rps"], old["webhook"]["rps"])
+    for k in ("p50_ms", "p99_ms"):
+        row(f"webhook ack {k}", new["webhook"][k], old["webhook"][k])
+        row(f"event→poke {k}", new["event_to_poke"][k], old["event_to_poke"][k])
+    for name, r in new["tools"].items():
+        o = old.get("tools", {}).get(name)
+        if o:
+            row(f"tool {name} p50_ms", r["p50_ms"], o["p50_ms"])
+    row("memory traced bytes/event", new["memory"]["traced_bytes_per_event"], old["memory"]["traced_bytes_per_event"])
+
+
+def main(argv: List[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--webhooks", type=int, default=500, help="webhook events for the throughput run")
+    ap.add_argument("--concurrency", type=int, default=16)
+    ap.add_argument("--tool-iterations", type=int, default=20)
+    ap.add_argument("--soak-seconds", type=float, default=10.0)
+    ap.add_argument("--latency-ms", type=float, default=0.0, help="artificial upstream latency")
+    ap.add_argument("--out", default="bench_results.json")
+    ap.add_argument("--compare", help="previous results file to diff against")
+    ap.add_argument("--verbose", action="store_true", help="keep server logs on stdout")
+    args = ap.parse_args(argv)
+
+    upstream = FakeUpstream(latency_ms=args.latency_ms).start()
+    workdir = tempfile.mkdtemp(prefix="mcp-strava-bench-")
+    configure_env(upstream, workdir)
+    tracemalloc.start()
+
+    sink = sys.stdout if args.verbose else io.StringIO()
+    with contextlib.redirect_stdout(sink):
+        t0 = time.perf_counter()
+        import server  # noqa: E402  (src/server.py, imported after env is configured)
+        import_s = time.perf_counter() - t0
+
+    port = free_port()
+    base = f"http://127.0.0.1:{port}"
+    with ServerThread(server.app, port):
+        with contextlib.redirect_stdout(sink):
+            ids = list(range(30_000_000_000, 30_000_000_000 + args.webhooks))
+            wh = asyncio.run(fire_webhooks(base, ids, args.concurrency))
+            e2e = event_to_poke(upstream, wh["sent"])
+            tools = asyncio.run(bench_tools(server.mcp_server, args.tool_iterations))
+            mem = soak(base, args.soak_seconds, args.concurrency, id_space=max(1, args.webhooks))
+            if isinstance(sink, io.StringIO):
+                sink.truncate(0)
+
+    upstream.stop()
+    results = {
+        "meta": {
+            "git": git_rev(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "args": vars(args),
+            "server_import_s": round(import_s, 4),
+            "upstream_requests": upstream.requests,
+        },
+        "webhook": {
+            "rps": round(len(wh["latencies"]) / wh["wall_s"], 2) if wh["wall_s"] else None,
+            "errors": wh["errors"],
+            **stats_ms(wh["latencies"]),
+        },
+        "event_to_poke": stats_ms(e2e),
+        "tools": tools,
+        "memory": mem,
+    }
+    with open(args.out, "w") as f:
+        json.dump(results, f, indent=2)
+
+    print(f"[BENCH] webhook: {results['webhook']['rps']} req/s, p50 {results['webhook']['p50_ms']} ms, p99 {results['webhook']['p99_ms']} ms, errors {wh['errors']}")
+    print(f"[BENCH] event→poke: p50 {results['event_to_poke']['p50_ms']} ms, p99 {results['event_to_poke']['p99_ms']} ms ({len(e2e)} delivered)")
+    for name, r in tools.items():
+        print(f"[BENCH] tool {name}: p50 {r['p50_ms']} ms, p99 {r['p99_ms']} ms, errors {r['errors']}")
+    print(f"[BENCH] memory: {mem['traced_bytes_per_event']} traced bytes/event over {len(mem['samples'])} samples")
+    print(f"[BENCH] results written to {args.out}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Microbenchmarks for the per-request transformations in metrics and tools.
+
+Every case runs on synthetic datasets (10 → 100k activities, all sport
+families) and records timing statistics (min/mean/median/stddev over
+auto-calibrated rounds) plus allocations (peak traced bytes and allocated
+blocks) for a single call.
+
+Usage:
+    python benchmarks/bench_metrics.py --out bench_metrics.json
+    python benchmarks/bench_metrics.py --sizes 10 1000 --only normalize summarize
+    python benchmarks/bench_metrics.py --out new.json --compare bench_metrics.json
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path[:0] = [HERE, os.path.join(ROOT, "src")]
+
+# tools import the Strava client, which needs credentials in the environment (never used here)
+os.environ.setdefault("STRAVA_CLIENT_ID", "bench")
+os.environ.setdefault("STRAVA_CLIENT_SECRET", "bench")
+_workdir = tempfile.mkdtemp(prefix="mcp-strava-bench-")
+os.environ.setdefault("TOKEN_FILE", os.path.join(_workdir, "tokens.json"))
+os.environ.setdefault("DB_FILE", os.path.join(_workdir, "strava.db"))
+
+from datasets import SIZES, make_activities  # noqa: E402
+from mcp_strava.services.metrics import normalize, summarize  # noqa: E402
+from mcp_strava.services import activity_store  # noqa: E402
+from mcp_strava.tools import weekly, date_activities  # noqa: E402
+
+DATE_INPUTS = ["2024-07-25", "25/07/2024", "25-07-2024", "2024-07-25 14:30", "25/07/2024 14:30"]
+
+
+def _cases(raw: List[Dict[str, Any]]) -> Dict[str, Callable[[], Any]]:
+    """Zero-arg callables over one dataset; inputs are prepared outside the timed region"""
+    norm = [normalize(a) for a in raw]
+    dates = [DATE_INPUTS[i % len(DATE_INPUTS)] for i in range(len(raw))]
+    return {
+        "normalize": lambda: [normalize(a) for a in raw],
+        "summarize": lambda: summarize(norm),
+        "weekly._by_sport": lambda: weekly._by_sport(norm),
+        "activity_store.local_day": lambda: [activity_store.local_day(a) for a in raw],
+        "date_activities.parse_date": lambda: [date_activities.parse_date(s) for s in dates],
+        "weekly._activity_row": lambda: [weekly._activity_row(a) for a in norm],
+        "date_activities.build_payload": lambda: date_activities.build_payload(norm, "from 2024-01-01 to 2024-12-31"),
+    }
+
+
+def time_case(fn: Callable[[], Any], min_time: float, min_rounds: int) -> Dict[str, Any]:
+    fn()  # warm-up
+    rounds: List[float] = []
+    gc_was = gc.isenabled()
+    gc.disable()
+    try:
+        t_end = time.perf_counter() + min_time
+        while len(rounds) < min_rounds or time.perf_counter() < t_end:
+            t0 = time.perf_counter()
+            fn()
+            rounds.append(time.perf_counter() - t0)
+    finally:
+        if gc_was:
+            gc.enable()
+    return {
+        "rounds": len(rounds),
+        "min_s": min(rounds),
+        "mean_s": statistics.fmean(rounds),
+        "median_s": statistics.median(rounds),
+        "stddev_s": statistics.stdev(rounds) if len(rounds) > 1 else 0.0,
+        "ops": 1.0 / statistics.fmean(rounds),
+    }
+
+
+def alloc_case(fn: Callable[[], Any]) -> Dict[str, Any]:
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        tracemalloc.reset_peak()
+        base, _ = tracemalloc.get_traced_memory()
+        result = fn()
+        _, peak = tracemalloc.get_traced_memory()
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    del result
+    blocks = sum(max(0, s.count_diff) for s in after.compare_to(before, "filename"))
+    return {"peak_bytes": peak - base, "alloc_blocks": blocks}
+
+
+def run(sizes: List[int], only: List[str] | None, min_time: float, min_rounds: int) -> Dict[str, Any]:
+    results: Dict[str, Any] = {}
+    for n in sizes:
+        raw = make_activities(n)
+        for name, fn in _cases(raw).items():
+            if only and name not in only:
+                continue
+            r = {**time_case(fn, min_time, min_rounds), **alloc_case(fn)}
+            r["per_item_us"] = r["median_s"] / n * 1e6
+            results.setdefault(name, {})[str(n)] = r
+            print(f"[BENCH] {name:<32} n={n:<7} median {r['median_s']*1e3:10.3f} ms  "
+                  f"{r['per_item_us']:8.3f} µs/item  peak {r['peak_bytes']/1024:10.1f} KiB  blocks {r['alloc_blocks']}")
+    return results
+
+
+def compare(new: Dict[str, Any], old: Dict[str, Any]) -> None:
+    print(f"[BENCH] compare {old.get('meta', {}).get('timestamp')} → {new.get('meta', {}).get('timestamp')}")
+    for name, by_size in new["results"].items():
+        for n, r in by_size.items():
+            o = old.get("results", {}).get(name, {}).get(n)
+            if not o:
+                continue
+            dt = (r["median_s"] - o["median_s"]) / o["median_s"] * 100 if o["median_s"] else 0.0
+            dm = (r["peak_bytes"] - o["peak_bytes"]) / o["peak_bytes"] * 100 if o["peak_bytes"] else 0.0
+            print(f"  {name:<32} n={n:<7} time {dt:+7.1f}%  peak mem {dm:+7.1f}%")
+
+
+def main(argv: List[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--sizes", type=int, nargs="+", default=SIZES)
+    ap.add_argument("--only", nargs="+", help="case names to run (default: all)")
+    ap.add_argument("--min-time", type=float, default=0.2, help="minimum timed seconds per case")
+    ap.add_argument("--min-rounds", type=int, default=5)
+    ap.add_argument("--out", default="bench_metrics.json")
+    ap.add_argument("--compare", help="previous results file to diff against")
+    args = ap.parse_args(argv)
+
+    results = run(args.sizes, args.only, args.min_time, args.min_rounds)
+    out = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "args": vars(args),
+        },
+        "results": results,
+    }
+    with open(args.out, "w") as f:
+        json.dump(out, f, indent=2)
+    print(f"[BENCH] results written to {args.out}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(out, json.load(f))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,106 @@
+"""Synthetic Strava activity payloads for benchmarks (shape of /athlete/activities items)"""
+import random
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List
+
+from mcp_strava.services.metrics import RUN_LIKE, RIDE_LIKE, SWIM_LIKE, ROW_LIKE, GYM_LIKE
+
+# (sport_types, distance range in m, speed range in m/s) per family
+FAMILIES = [
+    (sorted(RUN_LIKE),  (3_000, 42_000),  (2.5, 5.0)),
+    (sorted(RIDE_LIKE), (10_000, 180_000), (5.0, 11.0)),
+    (sorted(SWIM_LIKE), (500, 4_000),      (0.6, 1.6)),
+    (sorted(ROW_LIKE),  (2_000, 20_000),   (2.0, 4.5)),
+    (sorted(GYM_LIKE),  (0, 0),            (0.0, 0.0)),
+    (["Yoga", "Hike", "Walk"], (0, 15_000), (0.8, 1.6)),
+]
+
+SIZES = [10, 100, 1_000, 10_000, 100_000]
+
+# A handful of loops around Paris reused with GPS jitter, so route matching has repeats to find
+ROUTE_ORIGINS = [(48.8566, 2.3522), (48.8462, 2.3372), (48.8719, 2.3006), (48.8350, 2.4400), (48.8924, 2.2378)]
+
+
+def encode_polyline(points: List[tuple]) -> str:
+    out, plat, plng = [], 0, 0
+    for lat, lng in points:
+        ilat, ilng = round(lat * 1e5), round(lng * 1e5)
+        for d in (ilat - plat, ilng - plng):
+            v = ~(d << 1) if d < 0 else d << 1
+            while v >= 0x20:
+                out.append(chr((0x20 | (v & 0x1F)) + 63))
+                v >>= 5
+            out.append(chr(v + 63))
+        plat, plng = ilat, ilng
+    return "".join(out)
+
+
+def make_route(i: int, rng: random.Random, distance_m: float) -> List[tuple]:
+    """Closed loop of roughly distance_m around one of ROUTE_ORIGINS (variant = i % 3)"""
+    import math
+    lat0, lng0 = ROUTE_ORIGINS[(i // 6) % len(ROUTE_ORIGINS)]
+    r_deg = min(distance_m, 60_000) / (2 * math.pi) / 111_320
+    phase = (i % 3) * 2.1
+    pts = []
+    for k in range(41):
+        t = phase + 2 * math.pi * k / 40
+        lat = lat0 + r_deg * math.sin(t) + rng.gauss(0, 0.00005)
+        lng = lng0 + r_deg * math.cos(t) / math.cos(math.radians(lat0)) + rng.gauss(0, 0.00005)
+        pts.append((lat, lng))
+    return pts
+
+
+def make_activity(i: int, rng: random.Random, start: datetime) -> Dict[str, Any]:
+    sports, (dmin, dmax), (vmin, vmax) = FAMILIES[i % len(FAMILIES)]
+    sport = sports[rng.randrange(len(sports))]
+    distance = rng.uniform(dmin, dmax) if dmax else 0.0
+    moving = distance / rng.uniform(vmin, vmax) if distance else rng.uniform(1_200, 5_400)
+    started = start - timedelta(hours=7 * i, minutes=rng.randrange(60))
+    route = make_route(i, rng, distance) if distance else []
+    return {
+        "id": 10_000_000_000 + i,
+        "name": f"{sport} #{i}",
+        "type": sport,
+        "sport_type": sport,
+        "start_date": started.strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "start_date_local": (started + timedelta(hours=2)).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "timezone": "(GMT+01:00) Europe/Paris",
+        "distance": round(distance, 1),
+        "moving_time": int(moving),
+        "elapsed_time": int(moving * rng.uniform(1.0, 1.2)),
+        "total_elevation_gain": round(rng.uniform(0, distance / 50), 1) if distance else 0.0,
+        "average_heartrate": round(rng.uniform(110, 170), 1) if rng.random() < 0.8 else None,
+        "start_latlng": [round(route[0][0], 6), round(route[0][1], 6)] if route else [],
+        "end_latlng": [round(route[-1][0], 6), round(route[-1][1], 6)] if route else [],
+        "map": {"id": f"a{10_000_000_000 + i}", "summary_polyline": encode_polyline(route) if route else ""},
+    }
+
+
+def segment_efforts(a: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Detail-only segment_efforts: one 800 m segment per route origin and sport, ridden at the activity's pace"""
+    if not a.get("start_latlng") or not a.get("moving_time"):
+        return []
+    lat, lng = a["start_latlng"]
+    k = min(range(len(ROUTE_ORIGINS)), key=lambda j: (ROUTE_ORIGINS[j][0] - lat) ** 2 + (ROUTE_ORIGINS[j][1] - lng) ** 2)
+    speed = a["distance"] / a["moving_time"]
+    elapsed = int(800 / speed)
+    seg_id = 7_000_000 + k * 100 + sum(map(ord, a["sport_type"])) % 100
+    return [{
+        "id": a["id"] * 10 + 1,
+        "name": f"Segment {k}",
+        "elapsed_time": elapsed,
+        "moving_time": elapsed,
+        "start_date": a["start_date"],
+        "start_date_local": a["start_date_local"],
+        "distance": 800.0,
+        "average_heartrate": a.get("average_heartrate"),
+        "segment": {"id": seg_id, "name": f"{a['sport_type']} climb {k}", "activity_type": a["type"], "distance": 800.0,
+                    "average_grade": 4.2, "elevation_high": 80.0, "elevation_low": 46.4, "city": "Paris"},
+    }]
+
+
+def make_activities(n: int, seed: int = 42, start: datetime | None = None) -> List[Dict[str, Any]]:
+    """n activities, newest first, cycling through every sport family"""
+    rng = random.Random(seed)
+    start = start or datetime.now(timezone.utc)
+    return [make_activity(i, rng, start) for i in range(n)]
@@ -0,0 +1,119 @@
+"""Local stand-ins for the Strava API and the Poke inbound webhook"""
+import json
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+from urllib.parse import urlparse, parse_qs
+
+from datasets import make_activities, segment_efforts
+
+
+class FakeUpstream:
+    """
+    One HTTP server answering both Strava routes (/api/v3/*, /oauth/token)
+    and the Poke inbound route (/poke). Every Poke delivery is timestamped
+    so event-to-Poke latency can be measured by the caller.
+    """
+
+    def __init__(self, latency_ms: float = 0.0, n_activities: int = 200):
+        self.latency = latency_ms / 1000.0
+        self.activities = make_activities(n_activities)
+        self.by_id = {a["id"]: a for a in self.activities}
+        self.poke_received: List[Dict] = []
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._httpd.daemon_threads = True
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeUpstream":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def activity(self, activity_id: int) -> Dict:
+        a = self.by_id.get(activity_id) or self.activities[activity_id % len(self.activities)]
+        # the id is echoed in the name so Poke deliveries can be matched to their event
+        d = dict(a, id=activity_id, name=f"bench-{activity_id}")
+        d["segment_efforts"] = segment_efforts(d)
+        return d
+
+    @staticmethod
+    def epoch(a: Dict) -> int:
+        return int(datetime.strptime(a["start_date"], "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=timezone.utc).timestamp())
+
+    def _handler(self):
+        upstream = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True  # headers and body go out in separate writes
+
+            def log_message(self, *args):
+                pass
+
+            def _reply(self, status: int, body) -> None:
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _body(self) -> bytes:
+                n = int(self.headers.get("Content-Length") or 0)
+                return self.rfile.read(n) if n else b""
+
+            def do_GET(self):
+                with upstream._lock:
+                    upstream.requests += 1
+                if upstream.latency:
+                    time.sleep(upstream.latency)
+                u = urlparse(self.path)
+                q = parse_qs(u.query)
+                if u.path == "/api/v3/athlete":
+                    return self._reply(200, {"id": 42, "firstname": "Bench", "lastname": "Mark", "username": "bench"})
+                if u.path == "/api/v3/athlete/activities":
+                    per_page = int((q.get("per_page") or ["30"])[0])
+                    page = int((q.get("page") or ["1"])[0])
+                    lo = (page - 1) * per_page
+                    acts = upstream.activities
+                    if "before" in q or "after" in q:  # epoch bounds, exclusive, like Strava
+                        before = int(q.get("before", ["9" * 12])[0])
+                        after = int(q.get("after", ["0"])[0])
+                        acts = [a for a in acts if after < upstream.epoch(a) < before]
+                    return self._reply(200, acts[lo:lo + per_page])
+                if u.path.startswith("/api/v3/activities/"):
+                    return self._reply(200, upstream.activity(int(u.path.rsplit("/", 1)[1])))
+                if u.path == "/api/v3/push_subscriptions":
+                    return self._reply(200, [{"id": 1, "callback_url": "http://bench/strava/webhook", "created_at": "now"}])
+                return self._reply(404, {"message": "not found"})
+
+            def do_POST(self):
+                body = self._body()
+                u = urlparse(self.path)
+                if u.path == "/poke":
+                    with upstream._lock:
+                        upstream.poke_received.append({"t": time.perf_counter(), "body": body.decode(errors="replace")})
+                    return self._reply(200, {"ok": True})
+                if upstream.latency:
+                    time.sleep(upstream.latency)
+                if u.path == "/oauth/token":
+                    return self._reply(200, {
+                        "access_token": "bench-access", "refresh_token": "bench-refresh",
+                        "expires_at": int(time.time()) + 6 * 3600, "token_type": "Bearer",
+                        "athlete": {"id": 42, "firstname": "Bench", "lastname": "Mark"},
+                    })
+                return self._reply(404, {"message": "not found"})
+
+        return Handler
@@ -1,34 +1,63 @@
+import asyncio
 from fastmcp import FastMCP
 from mcp_strava.tools.recent import recent_activities
 from mcp_strava.tools.weekly import weekly_summary
 from mcp_strava.tools.analyze import analyze_activity
+from mcp_strava.tools.batch import analyze_batch
 from mcp_strava.tools.date_activities import get_activities_by_date
+from mcp_strava.tools.export import export_activities
+from mcp_strava.tools.query import query_activities
+from mcp_strava.tools.routes import activities_near, route_history
+from mcp_strava.tools.segments import segment_history
+from mcp_strava.tools.admin import memory_usage
+from mcp_strava.tools.digests import digest_schedule
 from mcp_strava.services.token_store import load_tokens
 from mcp_strava.services.strava_client import get_athlete
 from mcp_strava.settings import PUBLIC_URL
 
 mcp = FastMCP("Strava MCP")
 
+# List tools share: fields="id,name,…" (projection), compact=True (short rows),
+# cursor=<page.next_cursor> (next page of the same query, stable order)
+# Tools that may wait on SQLite or Strava are async and run their work with
+# asyncio.to_thread, so a slow call never blocks the event loop (webhooks, /healthz)
+
 @mcp.tool(description="Fetch recent Strava activities, normalized across sports")
-def get_recent_activities(limit: int = 5):
-    return recent_activities(limit=limit)
+async def get_recent_activities(limit: int = 5, fields: str = None, compact: bool = False, cursor: str = None):
+    return await asyncio.to_thread(recent_activities, limit=limit, fields=fields, compact=compact, cursor=cursor)
 
-@mcp.tool(description="Weekly summary for the current UTC calendar week (Monday→Sunday)")
-def get_weekly_summary(include_content: bool = False):
-    from mcp_strava.tools.weekly import weekly_summary as _weekly
-    return _weekly(include_content=include_content)
+@mcp.tool(description="Weekly summary for the current calendar week (Monday→Sunday) in the athlete's local time")
+async def get_weekly_summary(include_content: bool = False, limit: int = 50, fields: str = None, compact: bool = False, cursor: str = None):
+    return await asyncio.to_thread(weekly_summary, include_content=include_content, limit=limit, fields=fields, compact=compact, cursor=cursor)
 
 @mcp.tool(description="Analyze a specific Strava activity by ID with detailed metrics")
-def analyze_activity_by_id(activity_id: int):
+async def analyze_activity_by_id(activity_id: int):
     """Get detailed analysis of a Strava activity by its ID"""
-    return analyze_activity(activity_id=activity_id)
+    return await asyncio.to_thread(analyze_activity, activity_id=activity_id)
+
+@mcp.tool(description="Analyze and compare several Strava activities at once (by IDs or date range)")
+async def analyze_activities(activity_ids: list[int] = None, start_date: str = None, end_date: str = None,
+                             limit: int = 50, fields: str = None, compact: bool = False, cursor: str = None):
+    """
+    Per-activity analyses plus a comparison (longest, fastest, hilliest per sport).
 
-@mcp.tool(description="Get Strava activities for a specific date or date range")
-def get_activities_by_date_range(
+    - activity_ids: up to 50 IDs, or
+    - start_date / end_date: every activity on those local calendar days (YYYY-MM-DD, DD/MM/YYYY, DD-MM-YYYY)
+
+    The comparison covers every activity; `activities` come in pages of `limit` (oldest first).
+    """
+    return await analyze_batch(activity_ids=activity_ids, start_date=start_date, end_date=end_date,
+                               limit=limit, fields=fields, compact=compact, cursor=cursor)
+
+@mcp.tool(description="Get Strava activities for a specific date or date range (the athlete's local calendar days)")
+async def get_activities_by_date_range(
     date: str = None,
     start_date: str = None, 
     end_date: str = None,
-    limit: int = 30
+    limit: int = 30,
+    fields: str = None,
+    compact: bool = False,
+    cursor: str = None
 ):
     """
     Get activities for a specific date or date range.
@@ -39,14 +68,137 @@ def get_activities_by_date_range(
     - From date onwards: start_date="2024-07-25" (will get activities for that day only)
     
     Supported date formats: YYYY-MM-DD, DD/MM/YYYY, DD-MM-YYYY
+
+    Results come in pages of `limit`; pass page.next_cursor as `cursor` for the next one.
     """
-    return get_activities_by_date(
+    return await asyncio.to_thread(
+        get_activities_by_date,
         date=date,
         start_date=start_date,
         end_date=end_date,
-        limit=limit
+        limit=limit,
+        fields=fields,
+        compact=compact,
+        cursor=cursor
+    )
+
+@mcp.tool(description="Search the whole Strava history by sport, distance, duration, climbing, heart rate, weekday, time of day and name")
+async def search_activities(
+    sport: str = None,
+    min_distance_km: float = None,
+    max_distance_km: float = None,
+    min_duration_min: float = None,
+    max_duration_min: float = None,
+    min_elev_m: float = None,
+    max_elev_m: float = None,
+    min_hr: float = None,
+    max_hr: float = None,
+    weekday: str = None,
+    time_of_day: str = None,
+    name: str = None,
+    start_date: str = None,
+    end_date: str = None,
+    include_duplicates: bool = False,
+    sort: str = "recent",
+    limit: int = 20,
+    fields: str = None,
+    compact: bool = False,
+    cursor: str = None
+):
+    """
+    Query the local activity index (no Strava round-trip once indexed).
+
+    Examples:
+    - Long hilly rides: sport="ride", min_distance_km=80, min_elev_m=1000
+    - A named run: sport="run", name="parkrun"
+    - Weekend morning runs: sport="run", weekday="weekend", time_of_day="morning"
+
+    sport: family (run, ride, swim, row, gym, other) or exact type (TrailRun)
+    weekday: mon..sun, comma-separated, or "weekend" / "weekdays"
+    time_of_day: morning, afternoon, evening, night (local time)
+    start_date / end_date: the athlete's local calendar days, inclusive (YYYY-MM-DD, DD/MM/YYYY, DD-MM-YYYY)
+    sort: recent, oldest, distance, duration, elevation, hr
+    include_duplicates: also list second recordings of the same workout (flagged duplicate_of)
+    """
+    return await asyncio.to_thread(
+        query_activities,
+        sport=sport, min_distance_km=min_distance_km, max_distance_km=max_distance_km,
+        min_duration_min=min_duration_min, max_duration_min=max_duration_min,
+        min_elev_m=min_elev_m, max_elev_m=max_elev_m, min_hr=min_hr, max_hr=max_hr,
+        weekday=weekday, time_of_day=time_of_day, name=name,
+        start_date=start_date, end_date=end_date, include_duplicates=include_duplicates, sort=sort, limit=limit,
+        fields=fields, compact=compact, cursor=cursor
     )
 
+@mcp.tool(description="Find activities that passed (or started) near a GPS point")
+async def find_activities_near(
+    lat: float,
+    lng: float,
+    radius_m: float = 500,
+    sport: str = None,
+    start_only: bool = False,
+    limit: int = 20,
+    fields: str = None,
+    compact: bool = False,
+    cursor: str = None
+):
+    """
+    Activities whose route comes within radius_m of (lat, lng), newest first.
+
+    - "runs through this park": lat/lng of the park, radius_m ~ its size, sport="run"
+    - "rides starting from home": start_only=True
+    """
+    return await asyncio.to_thread(activities_near, lat=lat, lng=lng, radius_m=radius_m, sport=sport,
+                                   start_only=start_only, limit=limit, fields=fields, compact=compact, cursor=cursor)
+
+@mcp.tool(description="How often the athlete has done the same route as an activity (default: the latest one)")
+async def get_route_history(activity_id: int = None, min_similarity: float = 0.6, limit: int = 50,
+                      fields: str = None, compact: bool = False, cursor: str = None):
+    """Earlier activities on (mostly) the same route, with the fastest effort and the time trend"""
+    return await asyncio.to_thread(route_history, activity_id=activity_id, min_similarity=min_similarity, limit=limit,
+                                   fields=fields, compact=compact, cursor=cursor)
+
+@mcp.tool(description="Segment history: every effort on a segment with personal rank, PRs and trend (or list the athlete's segments)")
+async def get_segment_history(segment_id: int = None, name: str = None, limit: int = 50,
+                              fields: str = None, compact: bool = False, cursor: str = None):
+    """
+    - segment_id, or name (part of the segment name): efforts newest first, best time, trend
+    - neither: the athlete's segments, most frequent first
+    """
+    return await asyncio.to_thread(segment_history, segment_id=segment_id, name=name, limit=limit,
+                                   fields=fields, compact=compact, cursor=cursor)
+
+@mcp.tool(description="Export the full Strava activity history (NDJSON, CSV or Parquet) as a download link")
+async def export_activity_history(
+    format: str = "ndjson",
+    start_date: str = None,
+    end_date: str = None,
+    sport: str = None
+):
+    """
+    Get a signed link that streams every matching activity, newest first.
+
+    - format: ndjson (default), csv or parquet
+    - start_date / end_date: optional bounds (YYYY-MM-DD, DD/MM/YYYY, DD-MM-YYYY)
+    - sport: a family (run, ride, swim, row, gym, other) or an exact type (TrailRun)
+    """
+    return await asyncio.to_thread(export_activities, format=format, start_date=start_date, end_date=end_date, sport=sport)
+
+@mcp.tool(description="Show or change the athlete's scheduled weekly/monthly digests sent to Poke (optionally preview one)")
+async def set_digest_schedule(kind: str = None, enabled: bool = None, weekday: str = None, hour: int = None,
+                              preview: bool = False):
+    """
+    - kind: weekly or monthly (required to change a schedule)
+    - enabled / weekday (mon…sun, weekly only) / hour (0-23, athlete's local time)
+    - preview: render the digest kind would send next, without sending it
+    """
+    return await asyncio.to_thread(digest_schedule, kind=kind, enabled=enabled, weekday=weekday, hour=hour, preview=preview)
+
+@mcp.tool(description="Admin: memory used by the server's caches against the budget (optionally drop expired entries)")
+async def get_memory_usage(trim: bool = False):
+    """Approximate bytes per cache, budget, process RSS and eviction counts; trim=True drops expired entries"""
+    return await asyncio.to_thread(memory_usage, trim=trim)
+
 @mcp.tool(description="Start Strava authentication process - get authorization URL")
 def start_strava_auth():
     """
@@ -79,12 +231,15 @@ def start_strava_auth():
         }
 
 @mcp.tool(description="Check Strava connection status and user info")
-def check_strava_connection():
+async def check_strava_connection():
     """
     Check if Strava is properly connected and show user information.
     
     Returns connection status and athlete info if connected.
     """
+    return await asyncio.to_thread(_check_connection)
+
+def _check_connection():
     try:
         # Check if we have tokens
         tokens = load_tokens()
@@ -134,6 +289,6 @@ def check_strava_connection():
 
 # Optional: a MCP text resource to display directly in Poke
 @mcp.resource("weekly://summary")
-def weekly_resource() -> str:
-    w = weekly_summary()
+async def weekly_resource() -> str:
+    w = await asyncio.to_thread(weekly_summary)
     return w["content"]
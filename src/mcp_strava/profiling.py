@@ -0,0 +1,58 @@
+"""Startup profiling: `python src/server.py --profile-startup`"""
+import os
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+_PROBE = (
+    "import time; t0 = time.perf_counter(); import server; "
+    "print(f'__WALL__ {time.perf_counter() - t0:.6f}')"
+)
+
+def _parse_importtime(stderr: str) -> List[Tuple[str, int, int, int]]:
+    """Lines of `-X importtime` → (module, depth, self_us, cumulative_us)"""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        try:
+            self_us, cum_us, name = line[len("import time:"):].split("|", 2)
+            depth = (len(name) - len(name.lstrip())) // 2
+            rows.append((name.strip(), depth, int(self_us), int(cum_us)))
+        except ValueError:
+            continue  # header line
+    return rows
+
+def profile_startup(top: int = 25) -> int:
+    """Import the server in a fresh interpreter with -X importtime and print a breakdown"""
+    src = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [src, os.environ.get("PYTHONPATH")])))
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _PROBE],
+        cwd=src, env=env, capture_output=True, text=True,
+    )
+    rows = _parse_importtime(proc.stderr)
+    wall = next((l.split()[1] for l in proc.stdout.splitlines() if l.startswith("__WALL__")), None)
+    if proc.returncode != 0 or not rows:
+        print("[PROFILE] server import failed:")
+        print(proc.stderr[-2000:])
+        return 1
+
+    # Self time aggregated per top-level package, so nested imports are attributed to their owner
+    by_pkg: Dict[str, int] = {}
+    for name, _, self_us, _ in rows:
+        pkg = name.split(".")[0]
+        by_pkg[pkg] = by_pkg.get(pkg, 0) + self_us
+
+    total_us = sum(cum for _, depth, _, cum in rows if depth == 0)
+    print(f"[PROFILE] server import wall time: {float(wall) * 1000:.1f} ms" if wall else "[PROFILE] wall time unavailable")
+    print(f"[PROFILE] total import time: {total_us / 1000:.1f} ms across {len(rows)} modules\n")
+
+    print(f"{'package':<40}{'self ms':>10}")
+    for pkg, us in sorted(by_pkg.items(), key=lambda kv: -kv[1])[:top]:
+        print(f"{pkg:<40}{us / 1000:>10.1f}")
+
+    print(f"\n{'module (self time)':<60}{'self ms':>10}{'cum ms':>10}")
+    for name, _, self_us, cum in sorted(rows, key=lambda r: -r[2])[:top]:
+        print(f"{name:<60}{self_us / 1000:>10.1f}{cum / 1000:>10.1f}")
+    return 0
@@ -0,0 +1,513 @@
+"""
+Local index of every athlete's activities (SQLite, in DB_FILE).
+
+Summary fields are kept in one row per activity with secondary indexes on the
+columns the query tool filters on, plus an FTS5 index over names. The first
+query for an athlete walks their whole history once (a date-range query only
+walks back to its range and leaves the rest to the background); after that, webhooks
+upsert/delete single activities and a cheap incremental sync (newest pages
+only) runs in the background every INDEX_SYNC_INTERVAL seconds, so queries
+never wait on Strava. Each sync is followed by a background backfill of
+segment efforts for older activities (see segment_index), bounded by the
+Strava rate budget.
+"""
+import threading
+import time
+from datetime import date, datetime, timezone
+from zoneinfo import ZoneInfo
+from typing import Any, Dict, Iterable, List, Sequence, Tuple
+
+from mcp_strava.settings import INDEX_SYNC_INTERVAL, SEGMENT_BACKFILL_BATCH, SYNC_LOCK_WAIT
+from mcp_strava.services import db, duplicates, route_index, segment_index
+from mcp_strava.services.metrics import sport_family, SPORT_FAMILIES
+from mcp_strava.services.shared_state import backend, LockTimeout
+from mcp_strava.services.strava_client import (
+    iter_activities, start_epoch, as_athlete, get_activity, rate_budget, mark_stale, StravaUnavailable,
+)
+
+db.register_schema("""
+CREATE TABLE IF NOT EXISTS activities (
+    id           INTEGER PRIMARY KEY,
+    athlete_id   INTEGER NOT NULL,
+    name         TEXT,
+    sport        TEXT,
+    family       TEXT,
+    start_date   TEXT,
+    start_ts     INTEGER,
+    start_local  TEXT,
+    weekday      INTEGER,   -- local, 0 = Monday
+    local_minute INTEGER,   -- local minutes since midnight
+    distance_m   REAL,
+    moving_s     INTEGER,
+    elapsed_s    INTEGER,
+    elev_m       REAL,
+    avg_hr       REAL,
+    max_hr       REAL,
+    updated_at   INTEGER
+);
+CREATE INDEX IF NOT EXISTS activities_start    ON activities(athlete_id, start_ts);
+CREATE INDEX IF NOT EXISTS activities_family   ON activities(athlete_id, family, start_ts);
+CREATE INDEX IF NOT EXISTS activities_distance ON activities(athlete_id, family, distance_m);
+CREATE INDEX IF NOT EXISTS activities_moving   ON activities(athlete_id, moving_s);
+CREATE INDEX IF NOT EXISTS activities_elev     ON activities(athlete_id, elev_m);
+CREATE INDEX IF NOT EXISTS activities_hr       ON activities(athlete_id, avg_hr);
+CREATE INDEX IF NOT EXISTS activities_slot     ON activities(athlete_id, weekday, local_minute);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS activities_fts USING fts5(
+    name, content='activities', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS activities_fts_ai AFTER INSERT ON activities BEGIN
+    INSERT INTO activities_fts(rowid, name) VALUES (new.id, new.name);
+END;
+CREATE TRIGGER IF NOT EXISTS activities_fts_ad AFTER DELETE ON activities BEGIN
+    INSERT INTO activities_fts(activities_fts, rowid, name) VALUES ('delete', old.id, old.name);
+END;
+CREATE TRIGGER IF NOT EXISTS activities_fts_au AFTER UPDATE OF name ON activities BEGIN
+    INSERT INTO activities_fts(activities_fts, rowid, name) VALUES ('delete', old.id, old.name);
+    INSERT INTO activities_fts(rowid, name) VALUES (new.id, new.name);
+END;
+
+CREATE TABLE IF NOT EXISTS activity_sync (
+    athlete_id INTEGER PRIMARY KEY,
+    synced_at  INTEGER,
+    complete   INTEGER DEFAULT 0   -- 1 once the whole history has been walked
+);
+""")
+db.ensure_column("activity_sync", "geo", "INTEGER DEFAULT 0")  # 1 once routes were indexed too (older indexes re-walk once)
+# Local calendar day (from start_date_local) and Strava timezone, for exact day/week/month lookups
+db.ensure_column("activities", "local_day", "TEXT")
+# Rows indexed before then carry no timezone: re-walk the history once so every row gets Strava's
+db.ensure_column("activities", "tz", "TEXT", backfill=lambda conn: conn.execute("UPDATE activity_sync SET geo = 0"))
+db.register_schema("""
+UPDATE activities SET local_day = substr(start_local, 1, 10) WHERE local_day IS NULL AND start_local IS NOT NULL;
+CREATE INDEX IF NOT EXISTS activities_day ON activities(athlete_id, local_day, start_ts);
+""")
+# Duplicate recordings (watch + phone): the copy's primary activity id, NULL for originals (see duplicates.py)
+db.ensure_column("activities", "duplicate_of", "INTEGER")
+db.ensure_column("activity_sync", "dups", "INTEGER DEFAULT 0")  # 1 once the history was checked for copies
+db.register_schema("CREATE INDEX IF NOT EXISTS activities_dup ON activities(duplicate_of);")
+# Oldest start time a newest-first walk has reached while the history is not complete yet
+db.ensure_column("activity_sync", "walked_to", "INTEGER")
+
+_COLS = ("id", "athlete_id", "name", "sport", "family", "start_date", "start_ts", "start_local", "weekday",
+         "local_minute", "distance_m", "moving_s", "elapsed_s", "elev_m", "avg_hr", "max_hr", "updated_at",
+         "local_day", "tz")
+_UPSERT = (f"INSERT INTO activities ({', '.join(_COLS)}) VALUES ({', '.join('?' * len(_COLS))}) "
+           f"ON CONFLICT(id) DO UPDATE SET " + ", ".join(f"{c} = excluded.{c}" for c in _COLS[1:]))
+
+_syncing: set = set()
+_syncing_lock = threading.Lock()
+_backfilling: set = set()
+BACKFILL_RESERVE = 30  # Strava requests the segment backfill leaves to tools and webhooks (15-minute window)
+
+def _local(a: Dict[str, Any]) -> Tuple[int | None, int | None]:
+    """(weekday, minute of day) in the activity's local time (Strava suffixes local times with Z)"""
+    iso = a.get("start_date_local") or a.get("start_date")
+    if not iso:
+        return None, None
+    dt = datetime.fromisoformat(iso.replace("Z", "+00:00"))
+    return dt.weekday(), dt.hour * 60 + dt.minute
+
+def _values(athlete_id: int, a: Dict[str, Any], now: int) -> Tuple:
+    sport = a.get("sport_type") or a.get("type") or "Workout"
+    weekday, minute = _local(a)
+    return (
+        int(a["id"]), athlete_id, a.get("name"), sport, sport_family(sport),
+        a.get("start_date"), start_epoch(a), a.get("start_date_local"), weekday, minute,
+        float(a.get("distance") or 0.0), int(a.get("moving_time") or 0), int(a.get("elapsed_time") or 0),
+        float(a.get("total_elevation_gain") or 0.0), a.get("average_heartrate"), a.get("max_heartrate"), now,
+        local_day(a), a.get("timezone"),
+    )
+
+def local_day(a: Dict[str, Any]) -> str | None:
+    """Athlete's calendar day of an activity (YYYY-MM-DD), from Strava's start_date_local"""
+    iso = a.get("start_date_local") or a.get("start_date")
+    return iso[:10] if iso else None
+
+def _zone(tz: str | None):
+    """Strava '(GMT+01:00) Europe/Paris' → ZoneInfo (UTC when unknown)"""
+    name = (tz or "").rsplit(") ", 1)[-1].strip()
+    try:
+        return ZoneInfo(name) if name else timezone.utc
+    except Exception:
+        return timezone.utc
+
+def day_start_ts(day: str) -> int:
+    """Earliest instant a local calendar day (YYYY-MM-DD) can begin, in any timezone (UTC+14)"""
+    return int(datetime.fromisoformat(day).replace(tzinfo=timezone.utc).timestamp()) - 14 * 3600
+
+def athlete_zone(athlete_id: int) -> Tuple[Any, str | None]:
+    """The athlete's timezone (taken from their latest activity) as tzinfo, and Strava's name for it"""
+    row = db.connect().execute(
+        "SELECT tz FROM activities WHERE athlete_id = ? AND tz IS NOT NULL ORDER BY start_ts DESC LIMIT 1", (athlete_id,)
+    ).fetchone()
+    tz = row["tz"] if row else None
+    return _zone(tz), tz
+
+def local_today(athlete_id: int) -> Tuple[date, str | None]:
+    """Today in the athlete's timezone, and that timezone"""
+    zone, tz = athlete_zone(athlete_id)
+    return datetime.now(zone).date(), tz
+
+def upsert(athlete_id: int, activities: Iterable[Dict[str, Any]]) -> int:
+    """Insert or refresh activities (summary or detail payloads)"""
+    now = int(time.time())
+    activities = list(activities)
+    rows = [_values(athlete_id, a, now) for a in activities if a.get("id")]
+    if rows:
+        with db.transaction() as conn:
+            conn.executemany(_UPSERT, rows)
+            copies = duplicates.index(conn, athlete_id, activities)
+            route_index.index(conn, athlete_id, activities)
+            segment_index.exclude(conn, athlete_id, copies)  # older recordings just found to be copies
+            segment_index.index(conn, athlete_id, activities)
+    return len(rows)
+
+def delete(activity_id: int) -> None:
+    with db.transaction() as conn:
+        conn.execute("DELETE FROM activities WHERE id = ?", (int(activity_id),))
+        duplicates.delete(conn, int(activity_id))
+        route_index.delete(conn, int(activity_id))
+        segment_index.delete(conn, int(activity_id))
+
+def forget(athlete_id: int) -> None:
+    """Drop an athlete's index (deauthorization)"""
+    with db.transaction() as conn:
+        conn.execute("DELETE FROM activities WHERE athlete_id = ?", (athlete_id,))
+        conn.execute("DELETE FROM activity_sync WHERE athlete_id = ?", (athlete_id,))
+        route_index.forget(conn, athlete_id)
+        segment_index.forget(conn, athlete_id)
+
+def sync_state(athlete_id: int) -> Dict[str, Any]:
+    row = db.connect().execute("SELECT synced_at, complete, geo, dups, walked_to FROM activity_sync WHERE athlete_id = ?", (athlete_id,)).fetchone()
+    n = db.connect().execute("SELECT COUNT(*) FROM activities WHERE athlete_id = ?", (athlete_id,)).fetchone()[0]
+    return {"synced_at": row["synced_at"] if row else None, "complete": bool(row and row["complete"] and row["geo"]),
+            "dups_checked": bool(row and row["dups"]), "walked_to": row["walked_to"] if row else None, "activities": n}
+
+def _walked(athlete_id: int, oldest: int) -> None:
+    db.connect().execute(
+        "INSERT INTO activity_sync (athlete_id, walked_to) VALUES (?, ?) ON CONFLICT(athlete_id) DO UPDATE SET "
+        "walked_to = MIN(COALESCE(activity_sync.walked_to, excluded.walked_to), excluded.walked_to)",
+        (athlete_id, oldest),
+    )
+
+def sync(athlete_id: int, full: bool = False, wait: float = 300) -> int:
+    """
+    Pull activities from Strava into the index. Incremental (stops at the newest
+    indexed activity) once a full walk has completed; returns activities written.
+    Raises LockTimeout when another sync holds the lock for more than `wait` seconds.
+    """
+    with backend().lock(f"sync:{athlete_id}", timeout=wait, lease=600):
+        state = sync_state(athlete_id)
+        incremental = state["complete"] and not full
+        stop_ts = None
+        if incremental:
+            row = db.connect().execute("SELECT MAX(start_ts) FROM activities WHERE athlete_id = ?", (athlete_id,)).fetchone()
+            stop_ts = row[0]
+        t0 = time.perf_counter()
+        n = 0
+        with as_athlete(athlete_id):
+            for page in iter_activities():
+                n += upsert(athlete_id, page)
+                oldest = min(start_epoch(a) for a in page)
+                if stop_ts is not None and oldest <= stop_ts:
+                    break
+                if not incremental:
+                    _walked(athlete_id, oldest)  # lets date-range queries answer before the walk ends
+        db.connect().execute(
+            "INSERT INTO activity_sync (athlete_id, synced_at, complete, geo, dups) VALUES (?, ?, 1, 1, ?) "
+            "ON CONFLICT(athlete_id) DO UPDATE SET synced_at = excluded.synced_at, complete = 1, geo = 1, "
+            "dups = MAX(activity_sync.dups, excluded.dups)",
+            (athlete_id, int(time.time()), int(not incremental)),
+        )
+    print(f"[INDEX] athlete {athlete_id} {'incremental' if incremental else 'full'} sync: "
+          f"{n} activities in {(time.perf_counter() - t0) * 1000:.0f} ms")
+    backfill_in_background(athlete_id)
+    return n
+
+def sync_back_to(athlete_id: int, since: int) -> int:
+    """
+    Bounded first walk: index the newest activities back to `since` only. Takes
+    no sync lock (upserts are idempotent), so a query never waits behind the
+    full walk running in the background; returns activities written.
+    """
+    t0 = time.perf_counter()
+    n = 0
+    with as_athlete(athlete_id):
+        for page in iter_activities():
+            n += upsert(athlete_id, page)
+            oldest = min(start_epoch(a) for a in page)
+            if oldest < since:
+                break
+        else:
+            oldest = 0  # reached the first activity
+    _walked(athlete_id, oldest)
+    print(f"[INDEX] athlete {athlete_id} walked back to {oldest}: {n} activities in {(time.perf_counter() - t0) * 1000:.0f} ms")
+    return n
+
+def backfill_segments(athlete_id: int, limit: int = SEGMENT_BACKFILL_BATCH) -> int:
+    """
+    Read details (with segment efforts) of up to `limit` routed activities not
+    ingested yet, newest first, stopping before the rate budget runs low.
+    """
+    done = 0
+    with as_athlete(athlete_id):
+        for act_id in segment_index.pending(athlete_id, limit):
+            budget = rate_budget()
+            if min(budget["remaining_15m"], budget["remaining_day"]) <= BACKFILL_RESERVE:
+                print(f"[INDEX] segment backfill for athlete {athlete_id} paused: rate budget low")
+                break
+            upsert(athlete_id, [get_activity(act_id)])
+            done += 1
+    if done:
+        print(f"[INDEX] athlete {athlete_id}: segment efforts read from {done} activities")
+    return done
+
+def backfill_in_background(athlete_id: int) -> None:
+    """backfill_segments in a thread (at most one per athlete); returns at once"""
+    if not SEGMENT_BACKFILL_BATCH:
+        return
+    with _syncing_lock:
+        if athlete_id in _backfilling:
+            return
+        _backfilling.add(athlete_id)
+
+    def run():
+        try:
+            backfill_segments(athlete_id)
+        except Exception as e:
+            print(f"[INDEX] segment backfill for athlete {athlete_id} failed: {e!r}")
+        finally:
+            with _syncing_lock:
+                _backfilling.discard(athlete_id)
+
+    threading.Thread(target=run, name=f"segments-{athlete_id}", daemon=True).start()
+
+def _check_duplicates(athlete_id: int, wait: float = 300) -> None:
+    with backend().lock(f"sync:{athlete_id}", timeout=wait, lease=600):
+        if sync_state(athlete_id)["dups_checked"]:
+            return
+        t0 = time.perf_counter()
+        n = duplicates.scan(athlete_id)
+        with db.transaction() as conn:  # copies whose efforts were read before: out of the leaderboards
+            segment_index.exclude(conn, athlete_id, [r[0] for r in conn.execute(
+                "SELECT s.activity_id FROM segment_ingest s JOIN activities a ON a.id = s.activity_id "
+                "WHERE s.athlete_id = ? AND a.duplicate_of IS NOT NULL", (athlete_id,))])
+        db.connect().execute("UPDATE activity_sync SET dups = 1 WHERE athlete_id = ?", (athlete_id,))
+    print(f"[INDEX] athlete {athlete_id}: {n} duplicate recordings flagged in {(time.perf_counter() - t0) * 1000:.0f} ms")
+
+def _sync_in_background(athlete_id: int) -> None:
+    with _syncing_lock:
+        if athlete_id in _syncing:
+            return
+        _syncing.add(athlete_id)
+
+    def run():
+        try:
+            sync(athlete_id)
+        except LockTimeout:
+            pass  # another worker is syncing this athlete
+        except Exception as e:
+            print(f"[INDEX] background sync for athlete {athlete_id} failed: {e!r}")
+        finally:
+            with _syncing_lock:
+                _syncing.discard(athlete_id)
+
+    threading.Thread(target=run, name=f"index-sync-{athlete_id}", daemon=True).start()
+
+def ensure_synced(athlete_id: int, max_age: float | None = None, since: int | None = None,
+                  wait: float = 300) -> Dict[str, Any]:
+    """
+    Index the whole history on first use; afterwards refresh in the background
+    when due, or right away (incremental: usually one page) when older than max_age.
+    Callers that only need activities starting from `since` (epoch) get those
+    indexed in-request while the rest of the first walk runs in the background.
+    """
+    state = sync_state(athlete_id)
+    if not state["complete"] and since is not None:
+        if state["walked_to"] is None or state["walked_to"] > since:
+            sync_back_to(athlete_id, since)
+        _sync_in_background(athlete_id)
+        return sync_state(athlete_id)
+    if not state["complete"]:
+        sync(athlete_id, wait=wait)  # full walk; a concurrent caller finds it complete once the lock frees
+        return sync_state(athlete_id)
+    if not state["dups_checked"]:
+        _check_duplicates(athlete_id, wait)  # index built before duplicate detection: local pass, no Strava call
+    age = time.time() - (state["synced_at"] or 0)
+    if max_age is not None and age >= max_age:
+        sync(athlete_id, wait=wait)
+        return sync_state(athlete_id)
+    if age >= INDEX_SYNC_INTERVAL:
+        _sync_in_background(athlete_id)
+    return state
+
+def ready(athlete_id: int, max_age: float | None = None, since: int | None = None) -> Dict[str, Any]:
+    """
+    ensure_synced for tool calls: the whole history is never walked in-request.
+    Without `since`, the first walk runs in the background and the index answers
+    as it stands (state["partial"], see annotate_indexing). While Strava is
+    unavailable, or another sync holds the lock past SYNC_LOCK_WAIT, the index
+    answers marked stale as of the last successful sync.
+    """
+    state = sync_state(athlete_id)
+    if not state["complete"] and since is None:
+        _sync_in_background(athlete_id)
+        return {**state, "partial": True}
+    try:
+        state = ensure_synced(athlete_id, max_age, since, wait=SYNC_LOCK_WAIT)
+    except (StravaUnavailable, LockTimeout) as e:
+        state = sync_state(athlete_id)
+        if not state["activities"] and not state["complete"]:
+            raise
+        print(f"[INDEX] serving the index as it stands for athlete {athlete_id}: {e!r}")
+        as_of = state["synced_at"] or db.connect().execute(  # first walk never finished: its last write
+            "SELECT MAX(updated_at) FROM activities WHERE athlete_id = ?", (athlete_id,)).fetchone()[0]
+        mark_stale(as_of)
+    walked = state["walked_to"]
+    return {**state, "partial": not state["complete"] and (since is None or walked is None or walked > since)}
+
+def annotate_indexing(payload: Dict[str, Any], state: Dict[str, Any]) -> Dict[str, Any]:
+    """Add an 'indexing' marker (and a note in 'content') when ready() answered from a partial index"""
+    if state.get("partial"):
+        payload["indexing"] = {"complete": False, "activities_indexed": state["activities"]}
+        note = (f"⏳ Still indexing the Strava history ({state['activities']} activities so far): "
+                "older activities may be missing, ask again in a minute.")
+        payload["content"] = f"{note}\n{payload['content']}" if payload.get("content") else note
+    return payload
+
+def rows_by_id(athlete_id: int, ids: List[int]) -> Dict[int, Dict[str, Any]]:
+    out: Dict[int, Dict[str, Any]] = {}
+    conn = db.connect()
+    for k in range(0, len(ids), 500):
+        chunk = ids[k:k + 500]
+        for r in conn.execute(f"SELECT * FROM activities WHERE athlete_id = ? AND id IN ({', '.join('?' * len(chunk))})",
+                              [athlete_id, *chunk]):
+            out[r["id"]] = dict(r)
+    return out
+
+# ========= Query =========
+TIME_OF_DAY = {  # local minutes [from, to)
+    "morning": (5 * 60, 12 * 60),
+    "afternoon": (12 * 60, 17 * 60),
+    "evening": (17 * 60, 21 * 60),
+    "night": (21 * 60, 5 * 60),  # wraps past midnight
+}
+WEEKDAYS = ["mon", "tue", "wed", "thu", "fri", "sat", "sun"]
+
+def parse_weekdays(spec: str) -> List[int]:
+    """'sat,sun' | 'weekend' | 'weekdays' | 'monday' → [0..6]"""
+    days: set = set()
+    for part in (spec or "").lower().replace(" ", "").split(","):
+        if not part:
+            continue
+        if part == "weekend":
+            days |= {5, 6}
+        elif part in ("weekday", "weekdays"):
+            days |= {0, 1, 2, 3, 4}
+        elif part.isdigit() and int(part) < 7:
+            days.add(int(part))
+        elif part[:3] in WEEKDAYS:
+            days.add(WEEKDAYS.index(part[:3]))
+        else:
+            raise ValueError(f"unknown weekday {part!r}")
+    return sorted(days)
+
+def fts_query(text: str) -> str:
+    """Free text → FTS5 query: every word must match, as a prefix ('park' finds 'parkrun')"""
+    words = [w for w in "".join(c if c.isalnum() else " " for c in text).split() if w]
+    return " ".join(f'"{w}"*' for w in words)
+
+SORTS = {  # name -> (column, descending); ties are broken by id in the same direction
+    "recent": ("start_ts", True),
+    "oldest": ("start_ts", False),
+    "distance": ("distance_m", True),
+    "duration": ("moving_s", True),
+    "elevation": ("elev_m", True),
+    "hr": ("avg_hr", True),
+}
+
+def sort_key(sort: str, row: Dict[str, Any]) -> List[Any]:
+    """Keyset position of a row for `after_key` (missing values sort as -1)"""
+    v = row[SORTS[sort][0]]
+    return [-1 if v is None else v, row["id"]]
+
+def query(athlete_id: int, sport: str | None = None, min_distance_km: float | None = None,
+          max_distance_km: float | None = None, min_duration_min: float | None = None,
+          max_duration_min: float | None = None, min_elev_m: float | None = None, max_elev_m: float | None = None,
+          min_hr: float | None = None, max_hr: float | None = None, weekdays: List[int] | None = None,
+          time_of_day: str | None = None, text: str | None = None, after: int | None = None,
+          before: int | None = None, first_day: str | None = None, last_day: str | None = None,
+          duplicates: bool = False, sort: str = "recent", limit: int = 20,
+          after_key: Sequence[Any] | None = None) -> Tuple[List[Dict[str, Any]], int]:
+    """
+    Matching rows (newest first by default) after the keyset position after_key,
+    and the total number of matches. Duplicate recordings are left out unless
+    `duplicates` is set.
+    """
+    where, args = ["a.athlete_id = ?"], [athlete_id]
+    if not duplicates:
+        where.append("a.duplicate_of IS NULL")
+    if sport:
+        s = sport.strip().lower()
+        if s in SPORT_FAMILIES or s == "other":
+            where.append("a.family = ?"); args.append(s)
+        else:
+            where.append("LOWER(a.sport) = ?"); args.append(s)
+    for col, lo, hi, scale in (
+        ("a.distance_m", min_distance_km, max_distance_km, 1000.0),
+        ("a.moving_s", min_duration_min, max_duration_min, 60.0),
+        ("a.elev_m", min_elev_m, max_elev_m, 1.0),
+        ("a.avg_hr", min_hr, max_hr, 1.0),
+    ):
+        if lo is not None:
+            where.append(f"{col} >= ?"); args.append(lo * scale)
+        if hi is not None:
+            where.append(f"{col} <= ?"); args.append(hi * scale)
+    if after is not None:
+        where.append("a.start_ts >= ?"); args.append(after)
+    if before is not None:
+        where.append("a.start_ts < ?"); args.append(before)
+    if first_day is not None:  # local calendar days, inclusive (YYYY-MM-DD)
+        where.append("a.local_day >= ?"); args.append(first_day)
+    if last_day is not None:
+        where.append("a.local_day <= ?"); args.append(last_day)
+    if weekdays:
+        where.append(f"a.weekday IN ({', '.join('?' * len(weekdays))})"); args.extend(weekdays)
+    if time_of_day:
+        if time_of_day not in TIME_OF_DAY:
+            raise ValueError(f"time_of_day must be one of {', '.join(TIME_OF_DAY)}")
+        lo, hi = TIME_OF_DAY[time_of_day]
+        where.append("(a.local_minute >= ? AND a.local_minute < ?)" if lo < hi else "(a.local_minute >= ? OR a.local_minute < ?)")
+        args.extend([lo, hi])
+    if text:
+        match = fts_query(text)
+        if match:
+            # a subquery makes the full-text index drive the lookup (a join probes FTS once per row)
+            where.append("a.id IN (SELECT rowid FROM activities_fts WHERE activities_fts MATCH ?)"); args.append(match)
+    if sort not in SORTS:
+        raise ValueError(f"sort must be one of {', '.join(SORTS)}")
+
+    col, desc = SORTS[sort]
+    expr, op, d = f"COALESCE(a.{col}, -1)", "<" if desc else ">", "DESC" if desc else "ASC"
+
+    conn = db.connect()
+    cond = " AND ".join(where)
+    total = conn.execute(f"SELECT COUNT(*) FROM activities a WHERE {cond}", args).fetchone()[0]
+    if after_key is not None:
+        cond += f" AND ({expr} {op} ? OR ({expr} = ? AND a.id {op} ?))"
+        args = args + [after_key[0], after_key[0], after_key[1]]
+    rows = conn.execute(
+        f"SELECT a.* FROM activities a WHERE {cond} ORDER BY {expr} {d}, a.id {d} LIMIT ?",
+        args + [limit],
+    ).fetchall()
+    return [dict(r) for r in rows], total
+
+def as_activity(row: Dict[str, Any]) -> Dict[str, Any]:
+    """Index row → Strava-shaped summary payload (for metrics.normalize)"""
+    return {
+        "id": row["id"], "name": row["name"], "sport_type": row["sport"],
+        "start_date": row["start_date"], "start_date_local": row["start_local"], "timezone": row.get("tz"),
+        "distance": row["distance_m"], "moving_time": row["moving_s"], "elapsed_time": row["elapsed_s"],
+        "total_elevation_gain": row["elev_m"], "average_heartrate": row["avg_hr"], "max_heartrate": row["max_hr"],
+    }
@@ -0,0 +1,157 @@
+"""
+Admission control: per-route concurrency limits with a bounded waiting room.
+
+A gate admits up to `limit` requests at once. Up to `queue` more wait at most
+`wait` seconds for a slot. Anything beyond that is shed with Overloaded, so
+work cannot pile up without bound. Gates live on the event loop, so there is
+one set per worker process.
+"""
+import asyncio
+import json
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Deque, Dict, List
+
+from mcp_strava.settings import (
+    ADMISSION_MAX_WAIT, MCP_MAX_CONCURRENCY, MCP_MAX_QUEUE, MCP_OVERLOAD_STATUS,
+    WEBHOOK_MAX_CONCURRENCY, WEBHOOK_MAX_QUEUE,
+)
+
+class Overloaded(RuntimeError):
+    def __init__(self, name: str, retry_after: int):
+        super().__init__(f"{name} overloaded, retry in {retry_after}s")
+        self.retry_after = retry_after
+
+class Gate:
+    def __init__(self, name: str, limit: int, queue: int, wait: float):
+        self.name = name
+        self.limit = max(1, limit)
+        self.queue = max(0, queue)
+        self.wait = wait
+        self.in_flight = 0
+        self.admitted = 0
+        self.shed = 0
+        self.service_s = 0.0  # moving average of time spent holding a slot
+        self._waiters: Deque[asyncio.Future] = deque()
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    def free(self) -> int:
+        return 0 if self._waiters else max(0, self.limit - self.in_flight)
+
+    def retry_after(self) -> int:
+        """Seconds until the current backlog has likely drained (at least 1)"""
+        per_slot = self.service_s or 1.0
+        return max(1, math.ceil(per_slot * (self.queued + 1) / self.limit))
+
+    def _shed(self) -> Overloaded:
+        self.shed += 1
+        if self.shed == 1 or self.shed % 100 == 0:
+            print(f"[ADMISSION] {self.name} overloaded: {self.in_flight} in flight, {self.queued} queued, {self.shed} shed")
+        return Overloaded(self.name, self.retry_after())
+
+    async def acquire(self) -> None:
+        if self.in_flight < self.limit and not self._waiters:
+            self.in_flight += 1
+            self.admitted += 1
+            return
+        if len(self._waiters) >= self.queue:
+            raise self._shed()
+        fut = asyncio.get_running_loop().create_future()
+        self._waiters.append(fut)
+        try:
+            await asyncio.wait_for(fut, self.wait)
+        except BaseException as e:
+            if fut.done() and not fut.cancelled():
+                self.release()  # the slot was handed over just as we gave up
+            elif fut in self._waiters:
+                self._waiters.remove(fut)
+            if isinstance(e, asyncio.TimeoutError):
+                raise self._shed()
+            raise
+        self.admitted += 1
+
+    def release(self, held_s: float | None = None) -> None:
+        if held_s is not None:
+            self.service_s = held_s if not self.service_s else 0.8 * self.service_s + 0.2 * held_s
+        # hand the slot straight to the oldest waiter; in_flight stays the same
+        while self._waiters:
+            fut = self._waiters.popleft()
+            if not fut.done():
+                fut.set_result(None)
+                return
+        self.in_flight -= 1
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        await self.acquire()
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.release(time.perf_counter() - t0)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "limit": self.limit,
+            "queue": self.queue,
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "admitted": self.admitted,
+            "shed": self.shed,
+            "avg_service_ms": round(self.service_s * 1000, 1),
+        }
+
+GATES: Dict[str, Gate] = {
+    "mcp": Gate("mcp", MCP_MAX_CONCURRENCY, MCP_MAX_QUEUE, ADMISSION_MAX_WAIT),
+    "webhook": Gate("webhook", WEBHOOK_MAX_CONCURRENCY, WEBHOOK_MAX_QUEUE, ADMISSION_MAX_WAIT),
+}
+
+def gate(name: str) -> Gate:
+    return GATES[name]
+
+def stats() -> Dict[str, Any]:
+    return {name: g.stats() for name, g in GATES.items()}
+
+def metrics_lines() -> List[str]:
+    """Prometheus text exposition of stats()"""
+    lines = []
+    for metric, key, kind in (("in_flight", "in_flight", "gauge"), ("queued", "queued", "gauge"),
+                              ("admitted_total", "admitted", "counter"), ("shed_total", "shed", "counter")):
+        lines.append(f"# TYPE strava_mcp_admission_{metric} {kind}")
+        lines += [f'strava_mcp_admission_{metric}{{route="{name}"}} {g.stats()[key]}' for name, g in GATES.items()]
+    return lines
+
+class MCPAdmission:
+    """
+    ASGI middleware gating MCP requests (POSTs to the MCP endpoint; the
+    long-lived GET event stream is left alone). The slot is held until the
+    response is fully sent, streamed tool results included.
+    """
+
+    def __init__(self, app, path: str = "/mcp"):
+        self.app = app
+        self.path = path.rstrip("/")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"].rstrip("/") != self.path:
+            return await self.app(scope, receive, send)
+        try:
+            async with GATES["mcp"].slot():
+                await self.app(scope, receive, send)
+        except Overloaded as e:
+            body = json.dumps({"error": "overloaded", "retry_after": e.retry_after}).encode()
+            await send({
+                "type": "http.response.start",
+                "status": MCP_OVERLOAD_STATUS,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                    (b"retry-after", str(e.retry_after).encode()),
+                ],
+            })
+            await send({"type": "http.response.body", "body": body})
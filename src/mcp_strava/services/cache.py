@@ -0,0 +1,186 @@
+"""
+In-memory TTL caches, persisted across restarts through the snapshot.
+
+With a shared state backend (STATE_BACKEND=sqlite) each cache also reads
+through and writes through to it, so workers share what any of them fetched.
+
+Every cache is a memory account (see memory.py): entry sizes are estimated
+once on insert. A cache is held under its own CACHE_MEMORY_CAPS byte cap on
+insert, and gives entries back when the global budget is exceeded.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Iterable, Tuple
+
+from mcp_strava.services import memory, snapshot
+from mcp_strava.services.shared_state import backend
+from mcp_strava.settings import CACHE_MEMORY_CAPS
+
+def _caps(spec: str | None) -> Dict[str, int]:
+    """'activities=64,rollups=4' (MB) -> {name: bytes}"""
+    out = {}
+    for part in (spec or "").split(","):
+        name, _, mb = part.partition("=")
+        if name.strip() and mb.strip():
+            out[name.strip()] = int(float(mb) * 1024 * 1024)
+    return out
+
+_CAPS = _caps(CACHE_MEMORY_CAPS)
+
+# name -> cache, for snapshotting and invalidation by tag
+_registry: Dict[str, "TTLCache"] = {}
+
+class TTLCache:
+    """
+    Thread-safe LRU cache with per-entry expiry.
+
+    Expiry uses wall-clock time so entries stay meaningful after a
+    snapshot/restore. Expired entries are not returned by get() but are kept
+    (until evicted by LRU) so callers can fall back to stale data.
+    """
+
+    def __init__(self, name: str, ttl: float, maxsize: int = 1024, tags: Iterable[str] = ()):
+        self.name = name
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.tags = set(tags)
+        self._data: "OrderedDict[Hashable, Tuple[Any, float, float]]" = OrderedDict()  # key -> (value, stored_at, expires_at)
+        self._lock = threading.RLock()
+        self._restored = False
+        self.hits = self.misses = self.evictions = 0
+        self._sizes: Dict[Hashable, int] = {}
+        self.bytes = 0
+        self.max_bytes = _CAPS.get(name)
+        _registry[name] = self
+        snapshot.register(name, self.dump, self.load)
+        memory.register(name, lambda: self.bytes, self.evict, self.stats)
+
+    def _restore(self) -> None:
+        if not self._restored:
+            self._restored = True
+            snapshot.restore(self.name)
+
+    def get_entry(self, key: Hashable) -> Tuple[Any, float, float] | None:
+        """(value, stored_at, expires_at) even if expired, or None"""
+        self._restore()
+        with self._lock:
+            e = self._data.get(key)
+            if e is not None:
+                self._data.move_to_end(key)
+            return e
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        e = self.get_entry(key)
+        if e is None or e[2] < time.time():
+            shared = self._shared_get(key)
+            if shared is not None:
+                self.hits += 1
+                self._put(key, shared[0], shared[1], shared[2])
+                return shared[0]
+            self.misses += 1
+            return default
+        self.hits += 1
+        return e[0]
+
+    def _put(self, key: Hashable, value: Any, stored_at: float, expires_at: float) -> None:
+        size = memory.approx_size(key) + memory.approx_size(value) + 64  # + entry tuple
+        with self._lock:
+            self._data[key] = (value, stored_at, expires_at)
+            self._data.move_to_end(key)
+            self.bytes += size - self._sizes.get(key, 0)
+            self._sizes[key] = size
+            while len(self._data) > self.maxsize or (self.max_bytes and self.bytes > self.max_bytes and len(self._data) > 1):
+                self._drop_oldest()
+        memory.enforce()
+
+    def _drop_oldest(self) -> int:
+        k, _ = self._data.popitem(last=False)
+        size = self._sizes.pop(k, 0)
+        self.bytes -= size
+        self.evictions += 1
+        return size
+
+    def evict(self, nbytes: int, expired_only: bool = False) -> int:
+        """Free about nbytes: expired entries first (oldest first), then LRU unless expired_only"""
+        freed = 0
+        now = time.time()
+        with self._lock:
+            for k in [k for k, e in self._data.items() if e[2] < now]:
+                if freed >= nbytes:
+                    break
+                self._data.pop(k)
+                size = self._sizes.pop(k, 0)
+                self.bytes -= size
+                self.evictions += 1
+                freed += size
+            while not expired_only and freed < nbytes and self._data:
+                freed += self._drop_oldest()
+        return freed
+
+    def set(self, key: Hashable, value: Any, ttl: float | None = None) -> None:
+        self._restore()
+        now = time.time()
+        ttl = self.ttl if ttl is None else ttl
+        self._put(key, value, now, now + ttl)
+        b = backend()
+        if b.shared:
+            b.set(self.name, repr(key), (value, now, now + ttl), ttl)
+
+    def _shared_get(self, key: Hashable) -> Tuple[Any, float, float] | None:
+        b = backend()
+        return b.get(self.name, repr(key)) if b.shared else None
+
+    def pop(self, key: Hashable) -> Any:
+        self._restore()
+        with self._lock:
+            e = self._data.pop(key, None)
+            self.bytes -= self._sizes.pop(key, 0)
+        b = backend()
+        if b.shared:
+            b.delete(self.name, repr(key))
+        return e[0] if e else None
+
+    def clear(self) -> None:
+        self._restore()
+        with self._lock:
+            self._data.clear()
+            self._sizes.clear()
+            self.bytes = 0
+        b = backend()
+        if b.shared:
+            b.clear(self.name)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"entries": len(self), "max_entries": self.maxsize, "cap_bytes": self.max_bytes,
+                "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+    def dump(self) -> list:
+        with self._lock:
+            return [(k, v, s, x) for k, (v, s, x) in self._data.items()]
+
+    def load(self, items: list) -> None:
+        """Merge snapshot entries; entries written since boot win"""
+        with self._lock:
+            for k, v, s, x in reversed(items):  # keep snapshot LRU order, behind live entries
+                if k not in self._data:
+                    self._data[k] = (v, s, x)
+                    self._data.move_to_end(k, last=False)
+                    self._sizes[k] = size = memory.approx_size(k) + memory.approx_size(v) + 64
+                    self.bytes += size
+            while len(self._data) > self.maxsize or (self.max_bytes and self.bytes > self.max_bytes and len(self._data) > 1):
+                self._drop_oldest()
+        memory.enforce()
+
+def clear_tag(tag: str) -> None:
+    """Drop every cache carrying this tag (e.g. lists derived from the activity feed)"""
+    for c in list(_registry.values()):
+        if tag in c.tags:
+            c.clear()
+
+def caches() -> Dict[str, TTLCache]:
+    return dict(_registry)
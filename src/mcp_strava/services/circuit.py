@@ -0,0 +1,144 @@
+"""Circuit breaker and request hedging for upstream calls"""
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict
+
+class CircuitOpenError(RuntimeError):
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"{name} circuit open, retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+class CircuitBreaker:
+    """
+    closed → open after `failures` consecutive failures; open fails fast for
+    `recovery` seconds; then half-open lets `probes` calls through: a success
+    closes the circuit, a failure re-opens it.
+    """
+
+    def __init__(self, name: str, failures: int = 5, recovery: float = 30.0, probes: int = 1):
+        self.name = name
+        self.failures = failures
+        self.recovery = recovery
+        self.probes = probes
+        self.state = "closed"
+        self.consecutive = 0
+        self.opened_at = 0.0
+        self.in_flight_probes = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def before(self) -> None:
+        """Raise CircuitOpenError instead of calling upstream"""
+        with self._lock:
+            if self.state == "open":
+                wait_s = self.opened_at + self.recovery - time.time()
+                if wait_s > 0:
+                    self.rejected += 1
+                    raise CircuitOpenError(self.name, wait_s)
+                self.state = "half_open"
+                self.in_flight_probes = 0
+                print(f"[CIRCUIT] {self.name} half-open, probing")
+            if self.state == "half_open":
+                if self.in_flight_probes >= self.probes:
+                    self.rejected += 1
+                    raise CircuitOpenError(self.name, self.recovery)
+                self.in_flight_probes += 1
+
+    def success(self) -> None:
+        with self._lock:
+            if self.state != "closed":
+                print(f"[CIRCUIT] {self.name} closed")
+            self.state = "closed"
+            self.consecutive = 0
+            self.in_flight_probes = 0
+
+    def failure(self) -> None:
+        with self._lock:
+            self.consecutive += 1
+            if self.state == "half_open" or self.consecutive >= self.failures:
+                if self.state != "open":
+                    print(f"[CIRCUIT] {self.name} open after {self.consecutive} failures")
+                self.state = "open"
+                self.opened_at = time.time()
+                self.in_flight_probes = 0
+
+    def call(self, fn: Callable[[], Any], is_failure: Callable[[BaseException], bool] = lambda e: True) -> Any:
+        self.before()
+        try:
+            res = fn()
+        except BaseException as e:
+            if is_failure(e):
+                self.failure()
+            else:
+                self.success()
+            raise
+        self.success()
+        return res
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive,
+            "opened_at": self.opened_at or None,
+            "rejected": self.rejected,
+        }
+
+class Hedger:
+    """
+    Duplicate a slow idempotent call: if the first attempt has not finished by
+    the `percentile` latency of recent calls, start a second one and return
+    whichever finishes first.
+    """
+
+    def __init__(self, percentile: float, min_samples: int = 20, window: int = 200, workers: int = 8):
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.samples: deque = deque(maxlen=window)
+        self.hedged = 0
+        self.hedge_wins = 0
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="hedge") if percentile > 0 else None
+
+    def threshold(self) -> float | None:
+        if not self._pool or len(self.samples) < self.min_samples:
+            return None
+        xs = sorted(self.samples)
+        return xs[min(len(xs) - 1, int(len(xs) * self.percentile / 100.0))]
+
+    def call(self, fn: Callable[[], Any], allow: Callable[[], bool] = lambda: True) -> Any:
+        t0 = time.perf_counter()
+        limit = self.threshold()
+        if limit is None:
+            res = fn()
+            self.samples.append(time.perf_counter() - t0)
+            return res
+
+        first = self._pool.submit(fn)
+        done, _ = wait([first], timeout=limit)
+        if done or not allow():
+            res = first.result()
+            self.samples.append(time.perf_counter() - t0)
+            return res
+
+        self.hedged += 1
+        second = self._pool.submit(fn)
+        pending = {first, second}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for f in done:
+                if f.exception() is None or not pending:
+                    if f is second:
+                        self.hedge_wins += 1
+                    self.samples.append(time.perf_counter() - t0)
+                    return f.result()
+        raise RuntimeError("unreachable")
+
+    def stats(self) -> Dict[str, Any]:
+        t = self.threshold()
+        return {
+            "enabled": self._pool is not None,
+            "threshold_ms": round(t * 1000, 1) if t else None,
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+        }
@@ -0,0 +1,75 @@
+"""SQLite storage shared by the token store and other persistent services"""
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Callable, Iterator, List
+
+from mcp_strava.settings import DB_FILE
+
+_schemas: List[str | Callable[[sqlite3.Connection], None]] = []
+_local = threading.local()
+_init_lock = threading.Lock()
+_initialized = False
+
+def register_schema(sql: str | Callable[[sqlite3.Connection], None]) -> None:
+    """Add DDL (idempotent, e.g. CREATE TABLE IF NOT EXISTS) or a migration function applied on first connection"""
+    global _initialized
+    _schemas.append(sql)
+    if _initialized:
+        _apply(connect(), sql)
+
+def _apply(conn: sqlite3.Connection, sql) -> None:
+    if callable(sql):
+        sql(conn)
+    else:
+        conn.executescript(sql)
+
+def ensure_column(table: str, column: str, decl: str,
+                  backfill: Callable[[sqlite3.Connection], None] | None = None) -> None:
+    """
+    Add a column to a table created by an older release (applied with the
+    schemas); backfill(conn) runs once, right after the column is added
+    """
+    register_schema(lambda conn: _add_column(conn, table, column, decl, backfill))
+
+def _add_column(conn: sqlite3.Connection, table: str, column: str, decl: str, backfill=None) -> None:
+    if column not in {r["name"] for r in conn.execute(f"PRAGMA table_info({table})")}:
+        try:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+        except sqlite3.OperationalError as e:
+            if "duplicate column" not in str(e):  # another worker got there first
+                raise
+            return
+        if backfill is not None:
+            backfill(conn)
+
+def connect() -> sqlite3.Connection:
+    """Per-thread connection (autocommit; use transaction() for multi-statement writes)"""
+    global _initialized
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(DB_FILE, timeout=30, isolation_level=None, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=30000")
+        _local.conn = conn
+        with _init_lock:
+            if not _initialized:
+                for sql in _schemas:
+                    _apply(conn, sql)
+                _initialized = True
+    return conn
+
+@contextmanager
+def transaction() -> Iterator[sqlite3.Connection]:
+    """BEGIN IMMEDIATE … COMMIT: takes the write lock up front (serializes writers across processes)"""
+    conn = connect()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    else:
+        conn.execute("COMMIT")
@@ -0,0 +1,311 @@
+"""
+Scheduled weekly/monthly digests pushed to Poke.
+
+Each athlete has one schedule row per kind (weekly, monthly) with the local
+weekday/hour it goes out at. Athletes without their own settings get the
+DIGESTS defaults. Every athlete also gets a fixed offset in [0, DIGEST_JITTER)
+seconds, so a Monday 08:00 digest for many athletes is spread over an hour
+instead of firing at once.
+
+A due job rolls up the finished period from the activity index, renders the
+message once and stores it in digest_runs (one row per athlete, kind and
+period), then sends it. A failed send is retried from the stored message.
+Jobs are claimed with a compare-and-set on next_run_ts, so with several
+workers each digest still goes out once.
+"""
+import asyncio
+import time
+import zlib
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Tuple
+
+from mcp_strava.settings import DIGESTS, DIGEST_WEEKDAY, DIGEST_HOUR, DIGEST_JITTER, LIST_CACHE_TTL, POKE_API_KEY
+from mcp_strava.services import db, activity_store, token_store
+from mcp_strava.services.metrics import normalize, summarize
+from mcp_strava.services.poke import send_poke
+from mcp_strava.services.strava_client import StravaUnavailable, rate_budget
+
+KINDS = ("weekly", "monthly")
+WEEKDAYS = ("mon", "tue", "wed", "thu", "fri", "sat", "sun")
+RETRY_DELAY = 900   # s before re-sending a digest Poke refused
+MAX_ATTEMPTS = 3
+SYNC_RESERVE = 30   # Strava requests left in the window before a digest skips its catch-up sync
+POLL = 60           # s between scheduler checks at most
+
+db.register_schema("""
+CREATE TABLE IF NOT EXISTS digest_schedules (
+    athlete_id  INTEGER NOT NULL,
+    kind        TEXT NOT NULL,             -- weekly | monthly
+    enabled     INTEGER NOT NULL,
+    weekday     INTEGER NOT NULL,          -- 0 = Monday (weekly only)
+    hour        INTEGER NOT NULL,          -- local hour
+    next_run_ts INTEGER,
+    updated_at  INTEGER,
+    PRIMARY KEY (athlete_id, kind)
+);
+CREATE INDEX IF NOT EXISTS digest_schedules_due ON digest_schedules(enabled, next_run_ts);
+CREATE TABLE IF NOT EXISTS digest_runs (
+    athlete_id   INTEGER NOT NULL,
+    kind         TEXT NOT NULL,
+    period_start TEXT NOT NULL,            -- local day
+    period_end   TEXT NOT NULL,
+    message      TEXT NOT NULL,            -- rendered once, re-sent as is on retry
+    created_at   INTEGER,
+    sent_at      INTEGER,
+    attempts     INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (athlete_id, kind, period_start)
+);
+""")
+
+_counts = {"sent": 0, "failed": 0, "skipped": 0}
+
+def _default_kinds() -> List[str]:
+    return [k.strip() for k in (DIGESTS or "").split(",") if k.strip() in KINDS]
+
+def _jitter(athlete_id: int, kind: str) -> int:
+    """Fixed per-athlete offset (s), so everyone's digest doesn't fire on the same second"""
+    return zlib.crc32(f"{athlete_id}:{kind}".encode()) % DIGEST_JITTER if DIGEST_JITTER > 0 else 0
+
+def next_run(athlete_id: int, kind: str, weekday: int, hour: int, now: float | None = None) -> int:
+    """Next send time (epoch) after now: the athlete's local weekday/hour (1st of the month for monthly), plus jitter"""
+    now = time.time() if now is None else now
+    zone, _ = activity_store.athlete_zone(athlete_id)
+    today = datetime.fromtimestamp(now, zone).date()
+    offset = _jitter(athlete_id, kind)
+    for i in range(64):
+        d = today + timedelta(days=i)
+        if (kind == "weekly" and d.weekday() != weekday) or (kind == "monthly" and d.day != 1):
+            continue
+        at = datetime(d.year, d.month, d.day, hour, tzinfo=zone).timestamp() + offset
+        if at > now:
+            return int(at)
+    raise ValueError(f"no {kind} run found for weekday={weekday}")
+
+def period(kind: str, run_day: date) -> Tuple[date, date]:
+    """
+    Days a digest sent on run_day covers: the previous calendar month, or the
+    latest Monday→Sunday week (the current one when it goes out on a Sunday).
+    """
+    if kind == "monthly":
+        last = run_day.replace(day=1) - timedelta(days=1)
+        return last.replace(day=1), last
+    ref = run_day if run_day.weekday() == 6 else run_day - timedelta(days=run_day.weekday() + 1)
+    start = ref - timedelta(days=ref.weekday())
+    return start, start + timedelta(days=6)
+
+def previous(kind: str, first: date) -> Tuple[date, date]:
+    """The period a digest starting on `first` is compared with"""
+    if kind == "monthly":
+        last = first - timedelta(days=1)
+        return last.replace(day=1), last
+    return first - timedelta(days=7), first - timedelta(days=1)
+
+# ========= Schedules =========
+def _ensure_defaults() -> None:
+    """Give every registered athlete the default schedules they don't have yet"""
+    kinds = _default_kinds()
+    conn = db.connect()
+    have = {(r[0], r[1]) for r in conn.execute("SELECT athlete_id, kind FROM digest_schedules")}
+    now = int(time.time())
+    for a in token_store.list_athletes():
+        aid = a["athlete_id"]
+        if not token_store.may_notify(aid):
+            continue
+        for kind in KINDS:
+            if (aid, kind) in have:
+                continue
+            on = kind in kinds
+            conn.execute(
+                "INSERT OR IGNORE INTO digest_schedules (athlete_id, kind, enabled, weekday, hour, next_run_ts, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (aid, kind, int(on), DIGEST_WEEKDAY, DIGEST_HOUR,
+                 next_run(aid, kind, DIGEST_WEEKDAY, DIGEST_HOUR) if on else None, now),
+            )
+
+def schedules(athlete_id: int) -> List[Dict[str, Any]]:
+    _ensure_defaults()
+    rows = db.connect().execute(
+        "SELECT * FROM digest_schedules WHERE athlete_id = ? ORDER BY kind DESC", (athlete_id,)
+    ).fetchall()
+    return [dict(r) for r in rows]
+
+def configure(athlete_id: int, kind: str, enabled: bool | None = None, weekday: int | None = None,
+              hour: int | None = None) -> Dict[str, Any]:
+    """Change one of an athlete's digests; the next send time is recomputed"""
+    if kind not in KINDS:
+        raise ValueError(f"kind must be one of {', '.join(KINDS)}")
+    if weekday is not None and not 0 <= weekday <= 6:
+        raise ValueError("weekday must be 0 (Monday) to 6 (Sunday)")
+    if hour is not None and not 0 <= hour <= 23:
+        raise ValueError("hour must be 0 to 23")
+    cur = next((s for s in schedules(athlete_id) if s["kind"] == kind), None)
+    if cur is None:  # not signed in here, or not allowed to receive messages
+        raise ValueError(f"No digests for athlete {athlete_id}")
+    on = bool(cur["enabled"]) if enabled is None else enabled
+    wd = cur["weekday"] if weekday is None else weekday
+    hr = cur["hour"] if hour is None else hour
+    db.connect().execute(
+        "UPDATE digest_schedules SET enabled = ?, weekday = ?, hour = ?, next_run_ts = ?, updated_at = ? "
+        "WHERE athlete_id = ? AND kind = ?",
+        (int(on), wd, hr, next_run(athlete_id, kind, wd, hr) if on else None, int(time.time()), athlete_id, kind),
+    )
+    print(f"[DIGEST] athlete {athlete_id} {kind}: {'on' if on else 'off'} ({WEEKDAYS[wd]} {hr:02d}h)")
+    return next(s for s in schedules(athlete_id) if s["kind"] == kind)
+
+def _claim(job: Dict[str, Any], next_ts: int | None) -> bool:
+    """Move a due job to its next run; False when another worker got there first"""
+    cur = db.connect().execute(
+        "UPDATE digest_schedules SET next_run_ts = ? WHERE athlete_id = ? AND kind = ? AND next_run_ts = ?",
+        (next_ts, job["athlete_id"], job["kind"], job["next_run_ts"]),
+    )
+    return cur.rowcount == 1
+
+def _due(now: float) -> Tuple[List[Dict[str, Any]], int | None]:
+    """Due jobs (oldest first) and the time the next one is due"""
+    _ensure_defaults()
+    conn = db.connect()
+    # registered athletes whose messages may go to this Poke account (see token_store.may_notify)
+    ids = [a["athlete_id"] for a in token_store.list_athletes() if token_store.may_notify(a["athlete_id"])]
+    if not ids:
+        return [], None
+    who = f"athlete_id IN ({', '.join('?' * len(ids))})"
+    rows = conn.execute(
+        f"SELECT * FROM digest_schedules WHERE enabled = 1 AND next_run_ts <= ? AND {who} ORDER BY next_run_ts LIMIT 50",
+        (int(now), *ids),
+    ).fetchall()
+    nxt = conn.execute(
+        f"SELECT MIN(next_run_ts) FROM digest_schedules WHERE enabled = 1 AND next_run_ts > ? AND {who}", (int(now), *ids)
+    ).fetchone()[0]
+    return [dict(r) for r in rows], nxt
+
+# ========= Rendering =========
+def _fmt_min(m: float) -> str:
+    return f"{int(m // 60)}h{int(m % 60):02d}" if m >= 60 else f"{round(m)} min"
+
+def _totals(athlete_id: int, first: date, last: date) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    from mcp_strava.tools.weekly import _by_sport
+    rows, _ = activity_store.query(athlete_id, first_day=first.isoformat(), last_day=last.isoformat(), limit=5000)
+    acts = [normalize(activity_store.as_activity(r)) for r in rows]
+    return summarize(acts), _by_sport(acts)
+
+def build(athlete_id: int, kind: str, first: date, last: date) -> Dict[str, Any]:
+    """Digest payload for a period, compared with the period before it (index only, no Strava call)"""
+    stats, sports = _totals(athlete_id, first, last)
+    label = first.strftime("%B %Y") if kind == "monthly" else f"week of {first.isoformat()}"
+    prev, _ = _totals(athlete_id, *previous(kind, first))
+
+    lines = [f"{kind.capitalize()} digest, {label} ({first.isoformat()} → {last.isoformat()})"]
+    if not stats["count"]:
+        lines.append("- No activities")
+    else:
+        lines.append(f"- {stats['count']} activities • {stats['distance_km']} km • {_fmt_min(stats['moving_time_min'])}"
+                     f" • {stats['elev_gain_m']} m climbed")
+        for sport, s in sorted(sports.items(), key=lambda kv: -kv[1]["moving_time_min"]):
+            lines.append(f"- {sport}: {s['count']} × {s['distance_km']} km, {_fmt_min(s['moving_time_min'])}")
+        if stats["avg_pace_min_per_km"]:
+            lines.append(f"- Avg run pace: {stats['avg_pace_min_per_km']} min/km")
+    lines.append(f"- Previous {'month' if kind == 'monthly' else 'week'}: {prev['count']} activities, "
+                 f"{prev['distance_km']} km, {_fmt_min(prev['moving_time_min'])}")
+    prompt = (f"here's the user's {kind} strava digest. send it in casual poke style: the totals, what they did most, "
+              "and how it compares with the previous one. brief and encouraging, not a stats dump")
+    return {
+        "kind": kind,
+        "period": {"start_local": first.isoformat(), "end_local": last.isoformat()},
+        "summary": stats,
+        "breakdown_by_sport": sports,
+        "previous": prev,
+        "content": "\n".join(lines),
+        "poke_prompt": prompt,
+    }
+
+def render(payload: Dict[str, Any]) -> str:
+    """Poke message for a digest: prompt, then data (same shape as the webhook analyses)"""
+    return f"{payload['poke_prompt']}. Here's the data: {payload['content']}"
+
+# ========= Jobs =========
+def _catch_up(athlete_id: int) -> None:
+    """Pick up the last uploads before rolling up, unless the Strava budget is tight"""
+    budget = rate_budget()
+    if min(budget["remaining_15m"], budget["remaining_day"]) <= SYNC_RESERVE:
+        return
+    try:
+        activity_store.ensure_synced(athlete_id, max_age=LIST_CACHE_TTL)
+    except StravaUnavailable as e:
+        print(f"[DIGEST] athlete {athlete_id}: Strava unavailable, using the index as is ({e})")
+
+def run_job(job: Dict[str, Any]) -> str:
+    """Render (once) and send one due digest; returns what happened"""
+    from mcp_strava.services.strava_client import as_athlete
+
+    aid, kind = job["athlete_id"], job["kind"]
+    zone, _ = activity_store.athlete_zone(aid)
+    run_day = datetime.fromtimestamp(job["next_run_ts"], zone).date()
+    first, last = period(kind, run_day)
+    scheduled = next_run(aid, kind, job["weekday"], job["hour"], now=max(time.time(), job["next_run_ts"]))
+    if not _claim(job, scheduled):
+        return "claimed"
+
+    conn = db.connect()
+    run = conn.execute(
+        "SELECT * FROM digest_runs WHERE athlete_id = ? AND kind = ? AND period_start = ?", (aid, kind, first.isoformat())
+    ).fetchone()
+    if run is not None and run["sent_at"]:
+        _counts["skipped"] += 1
+        return "already_sent"
+    if run is None:
+        with as_athlete(aid):
+            _catch_up(aid)
+            message = render(build(aid, kind, first, last))
+        conn.execute(
+            "INSERT OR IGNORE INTO digest_runs (athlete_id, kind, period_start, period_end, message, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (aid, kind, first.isoformat(), last.isoformat(), message, int(time.time())),
+        )
+        run = conn.execute(
+            "SELECT * FROM digest_runs WHERE athlete_id = ? AND kind = ? AND period_start = ?", (aid, kind, first.isoformat())
+        ).fetchone()
+
+    res = send_poke(run["message"], aid)
+    attempts = run["attempts"] + 1
+    if res.get("ok"):
+        conn.execute("UPDATE digest_runs SET sent_at = ?, attempts = ? WHERE athlete_id = ? AND kind = ? AND period_start = ?",
+                     (int(time.time()), attempts, aid, kind, first.isoformat()))
+        _counts["sent"] += 1
+        print(f"[DIGEST] sent {kind} digest {first} → {last} to athlete {aid}")
+        return "sent"
+    conn.execute("UPDATE digest_runs SET attempts = ? WHERE athlete_id = ? AND kind = ? AND period_start = ?",
+                 (attempts, aid, kind, first.isoformat()))
+    _counts["failed"] += 1
+    if attempts < MAX_ATTEMPTS:
+        # retry the same period soon; the job keeps its original due time for period()
+        conn.execute("UPDATE digest_schedules SET next_run_ts = ? WHERE athlete_id = ? AND kind = ? AND next_run_ts = ?",
+                     (job["next_run_ts"] + RETRY_DELAY * attempts, aid, kind, scheduled))
+    print(f"[DIGEST] {kind} digest for athlete {aid} not delivered (attempt {attempts}/{MAX_ATTEMPTS}): {res}")
+    return "failed"
+
+def stats() -> Dict[str, Any]:
+    conn = db.connect()
+    enabled = conn.execute("SELECT kind, COUNT(*) FROM digest_schedules WHERE enabled = 1 GROUP BY kind").fetchall()
+    nxt = conn.execute("SELECT MIN(next_run_ts) FROM digest_schedules WHERE enabled = 1").fetchone()[0]
+    return {"enabled": {k: n for k, n in enabled}, "next_run_ts": nxt, **_counts}
+
+async def run_scheduler() -> None:
+    """Send due digests one at a time, then sleep until the next one is due (POLL at most)"""
+    if not POKE_API_KEY:
+        print("[DIGEST] scheduler off: missing POKE_API_KEY")
+        return
+    print(f"[DIGEST] scheduler started (defaults: {', '.join(_default_kinds()) or 'none'}, jitter {DIGEST_JITTER}s)")
+    while True:
+        wait = POLL
+        try:
+            jobs, nxt = await asyncio.to_thread(_due, time.time())
+            for job in jobs:
+                try:
+                    await asyncio.to_thread(run_job, job)
+                except Exception as e:
+                    print(f"[DIGEST] {job['kind']} digest for athlete {job['athlete_id']} failed: {e!r}")
+            if nxt is not None:
+                wait = min(POLL, max(1.0, nxt - time.time()))
+        except Exception as e:
+            print(f"[DIGEST] scheduler error: {e!r}")
+        await asyncio.sleep(wait)
@@ -0,0 +1,124 @@
+"""
+Duplicate recordings: the same workout saved twice (watch + phone app).
+
+Two activities are copies when they:
+- start within MAX_START_GAP of each other,
+- overlap in time for at least MIN_OVERLAP of the shorter one,
+- share a sport family,
+- and have distances within DISTANCE_TOLERANCE (or both have no GPS).
+
+Start times are the interval index. The range scan on (athlete, start_ts)
+only visits the few activities starting near the new one, so a check costs
+O(log n) however long the history. The most complete copy (heart rate, then
+distance, then first uploaded) stays primary. The others get duplicate_of set
+to its id and are left out of totals.
+"""
+import sqlite3
+from typing import Any, Dict, Iterable, List
+
+from mcp_strava.services import db
+
+MAX_START_GAP = 600         # s between the starts of two copies
+MIN_OVERLAP = 0.8           # share of the shorter copy's elapsed time both cover
+DISTANCE_TOLERANCE = 0.15   # relative distance difference (GPS tracks of one workout disagree a little)
+NO_GPS_M = 100              # below this, distances are not compared (gym, yoga, indoor)
+
+_COLS = "id, family, start_ts, elapsed_s, moving_s, distance_m, avg_hr, duplicate_of"
+
+def _end(r) -> int:
+    return r["start_ts"] + (r["elapsed_s"] or r["moving_s"] or 0)
+
+def similar(a, b) -> bool:
+    """Are two index rows copies of one workout?"""
+    if a["family"] != b["family"] or a["start_ts"] is None or b["start_ts"] is None:
+        return False
+    if abs(a["start_ts"] - b["start_ts"]) > MAX_START_GAP:
+        return False
+    shorter = min(_end(a) - a["start_ts"], _end(b) - b["start_ts"])
+    if shorter <= 0 or min(_end(a), _end(b)) - max(a["start_ts"], b["start_ts"]) < MIN_OVERLAP * shorter:
+        return False
+    da, dx = a["distance_m"] or 0.0, b["distance_m"] or 0.0
+    return max(da, dx) < NO_GPS_M or abs(da - dx) <= DISTANCE_TOLERANCE * max(da, dx)
+
+def _rank(r):
+    """Most complete copy first: heart rate, then distance, then the earliest upload"""
+    return (r["avg_hr"] is not None, r["distance_m"] or 0.0, -r["id"])
+
+def _row(conn: sqlite3.Connection, activity_id: int):
+    return conn.execute(f"SELECT {_COLS} FROM activities WHERE id = ?", (activity_id,)).fetchone()
+
+def _link(conn: sqlite3.Connection, athlete_id: int, activity_id: int) -> List[int]:
+    """Group an activity with the copies starting near it and (re)elect the primary; returns the new copies"""
+    row = _row(conn, activity_id)
+    if row is None or row["start_ts"] is None:
+        return []
+    near = conn.execute(
+        f"SELECT {_COLS} FROM activities WHERE athlete_id = ? AND start_ts BETWEEN ? AND ? AND id != ?",
+        (athlete_id, row["start_ts"] - MAX_START_GAP, row["start_ts"] + MAX_START_GAP, activity_id),
+    ).fetchall()
+    group = {row["id"]: row, **{c["id"]: c for c in near if similar(row, c)}}
+    if len(group) == 1:
+        if row["duplicate_of"] is not None:
+            conn.execute("UPDATE activities SET duplicate_of = NULL WHERE id = ?", (activity_id,))
+        return []
+    # copies already linked to a member belong to the same group
+    linked = {r["duplicate_of"] for r in group.values() if r["duplicate_of"]} | set(group)
+    marks = ", ".join("?" * len(linked))
+    for r in conn.execute(f"SELECT {_COLS} FROM activities WHERE id IN ({marks}) OR duplicate_of IN ({marks})",
+                          [*linked, *linked]):
+        group.setdefault(r["id"], r)
+    primary = max(group.values(), key=_rank)["id"]
+    changed = [(None if i == primary else primary, i) for i, r in group.items()
+               if r["duplicate_of"] != (None if i == primary else primary)]
+    if changed:
+        conn.executemany("UPDATE activities SET duplicate_of = ? WHERE id = ?", changed)
+    return [i for p, i in changed if p is not None and group[i]["duplicate_of"] is None]
+
+def _release(conn: sqlite3.Connection, activity_id: int) -> List[int]:
+    """Unlink the copies pointing at an activity; returns them for re-linking"""
+    ids = [r[0] for r in conn.execute("SELECT id FROM activities WHERE duplicate_of = ?", (activity_id,))]
+    if ids:
+        conn.execute("UPDATE activities SET duplicate_of = NULL WHERE duplicate_of = ?", (activity_id,))
+    return ids
+
+# ========= Writes (called inside the activity index transaction) =========
+def index(conn: sqlite3.Connection, athlete_id: int, activities: Iterable[Dict[str, Any]]) -> List[int]:
+    """
+    Check freshly upserted activities (an edit may change times or distance, so
+    links are redone); returns the activities that just became copies
+    """
+    copies: List[int] = []
+    for a in activities:
+        if not a.get("id"):
+            continue
+        act_id = int(a["id"])
+        released = _release(conn, act_id)
+        copies += _link(conn, athlete_id, act_id)
+        for i in released:
+            copies += _link(conn, athlete_id, i)
+    return copies
+
+def delete(conn: sqlite3.Connection, activity_id: int) -> None:
+    """After an activity is removed: its copies elect a new primary among themselves"""
+    copies = conn.execute("SELECT id, athlete_id FROM activities WHERE duplicate_of = ?", (activity_id,)).fetchall()
+    _release(conn, activity_id)
+    for r in copies:
+        _link(conn, r["athlete_id"], r["id"])
+
+def scan(athlete_id: int) -> int:
+    """Check a whole indexed history (indexes built before duplicate detection); returns the copies found"""
+    with db.transaction() as conn:
+        ids = [r[0] for r in conn.execute("SELECT id FROM activities WHERE athlete_id = ? ORDER BY start_ts", (athlete_id,))]
+        for i in ids:
+            _link(conn, athlete_id, i)
+    return count(athlete_id)
+
+# ========= Queries =========
+def primary_of(activity_id: int) -> int | None:
+    row = db.connect().execute("SELECT duplicate_of FROM activities WHERE id = ?", (int(activity_id),)).fetchone()
+    return row[0] if row else None
+
+def count(athlete_id: int) -> int:
+    return db.connect().execute(
+        "SELECT COUNT(*) FROM activities WHERE athlete_id = ? AND duplicate_of IS NOT NULL", (athlete_id,)
+    ).fetchone()[0]
@@ -0,0 +1,276 @@
+"""
+Streaming bulk export of an athlete's activities (NDJSON, CSV, Parquet).
+
+Activities are read from Strava one page at a time and written out as they
+arrive, so memory stays flat whatever the history size. Every row carries an
+opaque `cursor`: pass the cursor of the last row received as ?cursor= to
+resume an interrupted download (same filters, next activity onwards).
+
+Links are signed per athlete (HMAC with the Strava client secret) since the
+route is reachable without an MCP session.
+"""
+import asyncio
+import csv
+import hashlib
+import hmac
+import io
+import json
+import time
+from datetime import date
+from typing import Any, Dict, Iterator, List, Tuple
+from urllib.parse import urlencode
+
+from starlette.requests import Request
+from starlette.responses import JSONResponse, StreamingResponse
+
+from mcp_strava.settings import STRAVA_CLIENT_SECRET, PUBLIC_URL, EXPORT_LINK_TTL
+from mcp_strava.services.activity_store import day_start_ts, local_day
+from mcp_strava.services.metrics import normalize, sport_family, sport_matches
+from mcp_strava.services.paging import CursorError, encode_cursor, decode_cursor
+from mcp_strava.services.strava_client import (
+    iter_activities, start_epoch, as_athlete, StravaAuthError, StravaUnavailable,
+)
+
+FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+COLUMNS = [
+    "id", "name", "sport", "sport_family", "start_date", "start_date_local", "timezone",
+    "distance_km", "moving_time_min", "elapsed_time_min", "elev_gain_m",
+    "avg_hr", "max_hr", "avg_speed_kmh", "pace_min_per_km", "pace_per_100m", "cursor",
+]
+
+class ExportError(ValueError): pass
+
+# ========= Signed links & cursors =========
+def _sign(payload: str) -> str:
+    return hmac.new(STRAVA_CLIENT_SECRET.encode(), payload.encode(), hashlib.sha256).hexdigest()[:32]
+
+def make_token(athlete_id: int, ttl: int = EXPORT_LINK_TTL) -> str:
+    exp = int(time.time()) + ttl
+    return f"{athlete_id}.{exp}.{_sign(f'{athlete_id}.{exp}')}"
+
+def check_token(token: str | None) -> int:
+    """Athlete id of a valid, unexpired token"""
+    try:
+        aid, exp, sig = (token or "").split(".")
+        ok = hmac.compare_digest(sig, _sign(f"{aid}.{exp}")) and int(exp) >= time.time()
+    except ValueError:
+        ok = False
+    if not ok:
+        raise ExportError("invalid or expired export link")
+    return int(aid)
+
+def _position(cursor: str) -> Tuple[int, List[int]]:
+    """(before, skip ids) from a row cursor"""
+    state = decode_cursor(cursor)
+    try:
+        return int(state["b"]), [int(i) for i in state["s"]]
+    except (KeyError, TypeError, ValueError):
+        raise CursorError("invalid cursor")
+
+def export_url(athlete_id: int, fmt: str = "ndjson", after: int | None = None, before: int | None = None,
+               sport: str | None = None, first_day: str | None = None, last_day: str | None = None) -> str:
+    if fmt not in FORMATS:
+        raise ExportError(f"unknown format {fmt!r} (expected one of {', '.join(FORMATS)})")
+    q = {"format": fmt, "token": make_token(athlete_id)}
+    if after is not None:
+        q["after"] = after
+    if before is not None:
+        q["before"] = before
+    if first_day:
+        q["first_day"] = first_day
+    if last_day:
+        q["last_day"] = last_day
+    if sport:
+        q["sport"] = sport
+    return f"{PUBLIC_URL}/export/activities?{urlencode(q)}"
+
+# ========= Rows =========
+def _row(a: Dict[str, Any]) -> Dict[str, Any]:
+    n = normalize(a)
+    return {
+        "id": n["id"],
+        "name": n.get("name"),
+        "sport": n["sport"],
+        "sport_family": sport_family(n["sport"]),
+        "start_date": n.get("start_date"),
+        "start_date_local": a.get("start_date_local"),
+        "timezone": a.get("timezone"),
+        "distance_km": n["distance_km"],
+        "moving_time_min": n["moving_time_min"],
+        "elapsed_time_min": round(float(a.get("elapsed_time") or 0.0) / 60.0, 1),
+        "elev_gain_m": n["elev_gain_m"],
+        "avg_hr": n.get("avg_hr"),
+        "max_hr": a.get("max_heartrate"),
+        "avg_speed_kmh": n.get("avg_speed_kmh"),
+        "pace_min_per_km": n.get("pace_min_per_km"),
+        "pace_per_100m": n.get("pace_per_100m"),
+    }
+
+def iter_rows(athlete_id: int, after: int | None = None, before: int | None = None, sport: str | None = None,
+              skip: List[int] = (), first_day: str | None = None, last_day: str | None = None) -> Iterator[List[Dict[str, Any]]]:
+    """
+    Yield matching rows page by page (newest first), each with its resume cursor.
+    first_day/last_day are the athlete's local calendar days (YYYY-MM-DD, inclusive),
+    like the date-range tools: Strava is asked for a window wide enough for any
+    timezone and rows are kept by their local day.
+    """
+    if first_day:
+        after = day_start_ts(first_day) - 1 if after is None else max(after, day_start_ts(first_day) - 1)
+    if last_day:
+        day_end = day_start_ts(last_day) + 86400 + 26 * 3600  # local midnight after last_day, as late as UTC-12
+        before = min(before, day_end) if before is not None else day_end
+    pages = iter_activities(before=before, skip_ids=skip)
+    edge_ts, edge_ids = (before - 1, list(skip)) if before is not None else (None, [])
+    while True:
+        with as_athlete(athlete_id):  # entered and left within one next(): pages may run on different threads
+            page = next(pages, None)
+        if page is None:
+            return
+        rows, done = [], False
+        for a in page:
+            ts = start_epoch(a)
+            if after is not None and ts <= after:
+                done = True
+                continue
+            # the cursor resumes strictly after this activity: everything in its second already sent is skipped
+            edge_ids = edge_ids + [a["id"]] if ts == edge_ts else [a["id"]]
+            edge_ts = ts
+            if not sport_matches(a.get("sport_type") or a.get("type"), sport):
+                continue
+            day = local_day(a) or ""
+            if (first_day and day < first_day) or (last_day and day > last_day):
+                continue
+            r = _row(a)
+            r["cursor"] = encode_cursor({"b": ts + 1, "s": edge_ids})
+            rows.append(r)
+        if rows:
+            yield rows
+        if done:
+            return
+
+# ========= Encoders =========
+def _ndjson(pages: Iterator[List[Dict[str, Any]]]) -> Iterator[bytes]:
+    for rows in pages:
+        yield "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in rows).encode()
+
+def _csv(pages: Iterator[List[Dict[str, Any]]]) -> Iterator[bytes]:
+    buf = io.StringIO()
+    w = csv.DictWriter(buf, fieldnames=COLUMNS, extrasaction="ignore")
+    w.writeheader()
+    for rows in pages:
+        w.writerows(rows)
+        yield buf.getvalue().encode()
+        buf.seek(0); buf.truncate()
+    if buf.tell():
+        yield buf.getvalue().encode()
+
+class _Sink(io.RawIOBase):
+    """Write-only file that hands its bytes back between row groups"""
+    def __init__(self):
+        self.chunks: List[bytes] = []
+        self.pos = 0
+    def writable(self): return True
+    def write(self, b):
+        self.chunks.append(bytes(b)); self.pos += len(b)
+        return len(b)
+    def tell(self): return self.pos
+    def drain(self) -> bytes:
+        out = b"".join(self.chunks); self.chunks.clear()
+        return out
+
+def _parquet_schema():
+    import pyarrow as pa
+    types = {"id": pa.int64(), "distance_km": pa.float64(), "moving_time_min": pa.float64(),
+             "elapsed_time_min": pa.float64(), "elev_gain_m": pa.float64(), "avg_hr": pa.float64(),
+             "max_hr": pa.float64(), "avg_speed_kmh": pa.float64()}
+    return pa.schema([(c, types.get(c, pa.string())) for c in COLUMNS])
+
+def _parquet(pages: Iterator[List[Dict[str, Any]]]) -> Iterator[bytes]:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    schema = _parquet_schema()
+    sink = _Sink()
+    writer = pq.ParquetWriter(sink, schema, compression="zstd")
+    for rows in pages:  # one row group per Strava page
+        writer.write_table(pa.Table.from_pylist(rows, schema=schema))
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+def parquet_available() -> bool:
+    try:
+        import pyarrow.parquet  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+_ENCODERS = {"ndjson": _ndjson, "csv": _csv, "parquet": _parquet}
+
+# ========= Route =========
+def _day_param(q, name: str) -> str | None:
+    v = q.get(name)
+    if v in (None, ""):
+        return None
+    try:
+        return date.fromisoformat(v).isoformat()
+    except ValueError:
+        raise ExportError(f"{name} must be a date (YYYY-MM-DD)")
+
+def _int_param(q, name: str) -> int | None:
+    v = q.get(name)
+    if v in (None, ""):
+        return None
+    try:
+        return int(v)
+    except ValueError:
+        raise ExportError(f"{name} must be a unix timestamp")
+
+async def handle_export(request: Request):
+    q = request.query_params
+    fmt = (q.get("format") or "ndjson").lower()
+    try:
+        athlete_id = check_token(q.get("token"))
+        if fmt not in FORMATS:
+            raise ExportError(f"unknown format {fmt!r} (expected one of {', '.join(FORMATS)})")
+        if fmt == "parquet" and not parquet_available():
+            return JSONResponse({"error": "parquet export needs pyarrow (pip install pyarrow)"}, status_code=501)
+        before, skip = _int_param(q, "before"), []
+        if q.get("cursor"):
+            before, skip = _position(q["cursor"])  # the position only; after/sport come from the URL as before
+        pages = iter_rows(athlete_id, after=_int_param(q, "after"), before=before, sport=q.get("sport"), skip=skip,
+                          first_day=_day_param(q, "first_day"), last_day=_day_param(q, "last_day"))
+    except ExportError as e:
+        return JSONResponse({"error": str(e)}, status_code=403 if "link" in str(e) else 400)
+    except CursorError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+
+    body = _ENCODERS[fmt](pages)
+    # Pull the first chunk before answering so auth/upstream errors still get a proper status code
+    try:
+        first = await asyncio.to_thread(next, body, b"")
+    except StravaAuthError as e:
+        return JSONResponse({"error": str(e)}, status_code=401)
+    except StravaUnavailable as e:
+        return JSONResponse({"error": str(e)}, status_code=503, headers={"Retry-After": "30"})
+
+    def _stream() -> Iterator[bytes]:
+        n = len(first)
+        yield first
+        try:
+            for chunk in body:
+                n += len(chunk)
+                yield chunk
+        except Exception as e:
+            # Abort the response (no clean end of stream); the client resumes from its last row's cursor
+            print(f"[EXPORT] athlete {athlete_id} aborted after {n} bytes: {e!r}")
+            raise
+        print(f"[EXPORT] athlete {athlete_id} {fmt}: {n} bytes")
+
+    headers = {"Content-Disposition": f'attachment; filename="activities-{athlete_id}.{fmt}"',
+               "Cache-Control": "no-store"}
+    return StreamingResponse(_stream(), media_type=FORMATS[fmt], headers=headers)
@@ -0,0 +1,63 @@
+"""Startup/shutdown hooks and background tasks for the ASGI app"""
+import asyncio
+import inspect
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, List, Set
+
+_startup: List[Callable[[], Any]] = []
+_shutdown: List[Callable[[], Any]] = []
+_tasks: Set[asyncio.Task] = set()
+
+def on_startup(fn: Callable[[], Any]) -> Callable[[], Any]:
+    """Register a hook run once the app starts. Keep it short: spawn() slow work."""
+    _startup.append(fn)
+    return fn
+
+def on_shutdown(fn: Callable[[], Any]) -> Callable[[], Any]:
+    """Register a hook run when the app stops (reverse registration order)."""
+    _shutdown.append(fn)
+    return fn
+
+def spawn(coro: Awaitable, name: str | None = None) -> asyncio.Task:
+    """Run a coroutine in the background; the task is cancelled on shutdown."""
+    task = asyncio.ensure_future(coro)
+    if name:
+        task.set_name(name)
+    _tasks.add(task)
+    task.add_done_callback(_done)
+    return task
+
+def _done(task: asyncio.Task) -> None:
+    _tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        print(f"[LIFECYCLE] task {task.get_name()} failed: {task.exception()!r}")
+
+async def _call(fn: Callable[[], Any]) -> None:
+    try:
+        res = fn()
+        if inspect.isawaitable(res):
+            await res
+    except Exception as e:
+        print(f"[LIFECYCLE] hook {getattr(fn, '__name__', fn)} failed: {e!r}")
+
+def wrap_lifespan(app):
+    """Chain our hooks around the Starlette app's own lifespan (FastMCP session manager)."""
+    inner = app.router.lifespan_context
+
+    @asynccontextmanager
+    async def lifespan(a):
+        async with inner(a):
+            for fn in _startup:
+                await _call(fn)
+            try:
+                yield
+            finally:
+                for fn in reversed(_shutdown):
+                    await _call(fn)
+                for task in list(_tasks):
+                    task.cancel()
+                if _tasks:
+                    await asyncio.gather(*_tasks, return_exceptions=True)
+
+    app.router.lifespan_context = lifespan
+    return app
@@ -0,0 +1,127 @@
+"""
+Memory accounting for in-process state, with a global budget.
+
+Each cache or table of state registers an account: a function returning its
+approximate size in bytes and, when it can give memory back, an evict(nbytes,
+expired_only) function returning the bytes it freed. enforce() keeps the
+total under MEMORY_BUDGET_MB. It first drops expired entries everywhere, then
+least-recently-used entries from the account using the most memory, until
+usage is back to 90% of the budget.
+
+Sizes are estimates (sys.getsizeof over containers, computed once per entry),
+good enough to compare caches and size an instance, not exact RSS. enforce()
+runs on every cache insert, so each account's size function must be O(1): a
+running total the account keeps up to date, or entries × a per-entry estimate.
+"""
+import os
+import sys
+import threading
+from typing import Any, Callable, Dict, List, Tuple
+
+from mcp_strava.settings import MEMORY_BUDGET_MB
+
+BUDGET_BYTES = int(MEMORY_BUDGET_MB * 1024 * 1024)
+LOW_WATER = 0.9  # evict down to this fraction of the budget, so enforcement does not run on every insert
+
+# name -> (size_fn, evict_fn | None, stats_fn | None)
+_accounts: Dict[str, Tuple[Callable[[], int], Callable[[int, bool], int] | None, Callable[[], Dict[str, Any]] | None]] = {}
+_lock = threading.Lock()
+_counts = {"enforced": 0, "evicted_bytes": 0}
+
+def register(name: str, size: Callable[[], int], evict: Callable[[int, bool], int] | None = None,
+             stats: Callable[[], Dict[str, Any]] | None = None) -> None:
+    _accounts[name] = (size, evict, stats)
+
+def approx_size(obj: Any, _depth: int = 0) -> int:
+    """Deep size estimate of JSON-like data (dicts, lists, tuples, sets, scalars)"""
+    size = sys.getsizeof(obj)
+    if _depth > 32:
+        return size
+    if isinstance(obj, dict):
+        for k, v in obj.items():
+            size += approx_size(k, _depth + 1) + approx_size(v, _depth + 1)
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        for v in obj:
+            size += approx_size(v, _depth + 1)
+    return size
+
+def used_bytes() -> int:
+    return sum(size() for size, _, _ in _accounts.values())
+
+def enforce() -> int:
+    """Evict until usage is under the budget's low-water mark; returns bytes freed"""
+    if not BUDGET_BYTES or used_bytes() <= BUDGET_BYTES:
+        return 0
+    with _lock:
+        over = used_bytes() - int(BUDGET_BYTES * LOW_WATER)
+        freed = 0
+        evictable = [(name, size, evict) for name, (size, evict, _) in _accounts.items() if evict]
+        for _, _, evict in evictable:
+            if freed >= over:
+                break
+            freed += evict(over - freed, True)
+        while freed < over:
+            # largest consumer first, in slices so the others share the cost when sizes are close
+            want = max(64 * 1024, (over - freed) // 4)
+            got = 0
+            for _, size, evict in sorted(evictable, key=lambda a: -a[1]()):
+                got = evict(min(want, over - freed), False)
+                if got:
+                    break
+            if not got:
+                break
+            freed += got
+        _counts["enforced"] += 1
+        _counts["evicted_bytes"] += freed
+    print(f"[MEMORY] over budget ({BUDGET_BYTES // 1024 // 1024} MB): freed {freed // 1024} KB")
+    return freed
+
+def trim() -> int:
+    """Drop expired entries everywhere, whatever the budget; returns bytes freed"""
+    with _lock:
+        freed = sum(evict(1 << 62, True) for _, evict, _ in _accounts.values() if evict)
+        _counts["evicted_bytes"] += freed
+    return freed
+
+def rss_bytes() -> int | None:
+    """Resident set size of this process (Linux), or None"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except Exception:
+        return None
+
+def report() -> Dict[str, Any]:
+    accounts = {}
+    for name, (size, evict, stats) in sorted(_accounts.items()):
+        accounts[name] = {"bytes": size(), "evictable": evict is not None, **(stats() if stats else {})}
+    return {
+        "budget_bytes": BUDGET_BYTES or None,
+        "used_bytes": sum(a["bytes"] for a in accounts.values()),
+        "rss_bytes": rss_bytes(),
+        "enforced": _counts["enforced"],
+        "evicted_bytes": _counts["evicted_bytes"],
+        "accounts": accounts,
+    }
+
+def metrics_lines() -> List[str]:
+    """Prometheus text exposition of report()"""
+    r = report()
+    lines = [
+        "# TYPE strava_mcp_memory_used_bytes gauge",
+        f"strava_mcp_memory_used_bytes {r['used_bytes']}",
+        "# TYPE strava_mcp_memory_budget_bytes gauge",
+        f"strava_mcp_memory_budget_bytes {r['budget_bytes'] or 0}",
+        "# TYPE strava_mcp_memory_evicted_bytes_total counter",
+        f"strava_mcp_memory_evicted_bytes_total {r['evicted_bytes']}",
+    ]
+    if r["rss_bytes"] is not None:
+        lines += ["# TYPE process_resident_memory_bytes gauge", f"process_resident_memory_bytes {r['rss_bytes']}"]
+    for metric, key, kind in (("account_bytes", "bytes", "gauge"), ("account_entries", "entries", "gauge"),
+                              ("account_cap_bytes", "cap_bytes", "gauge"), ("cache_hits_total", "hits", "counter"),
+                              ("cache_misses_total", "misses", "counter"), ("cache_evictions_total", "evictions", "counter")):
+        rows = [(name, a[key]) for name, a in r["accounts"].items() if a.get(key) is not None]
+        if rows:
+            lines.append(f"# TYPE strava_mcp_{metric} {kind}")
+            lines += [f'strava_mcp_{metric}{{account="{name}"}} {v}' for name, v in rows]
+    return lines
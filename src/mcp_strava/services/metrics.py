@@ -7,6 +7,24 @@ SWIM_LIKE = {"Swim"}
 ROW_LIKE  = {"Rowing", "Canoeing", "Kayaking"}
 GYM_LIKE  = {"WeightTraining", "Elliptical", "StairStepper", "Workout", "HIIT"}
 
+SPORT_FAMILIES = {"run": RUN_LIKE, "ride": RIDE_LIKE, "swim": SWIM_LIKE, "row": ROW_LIKE, "gym": GYM_LIKE}
+
+def sport_family(sport: str | None) -> str:
+    """'run' | 'ride' | 'swim' | 'row' | 'gym' | 'other'"""
+    for fam, sports in SPORT_FAMILIES.items():
+        if sport in sports:
+            return fam
+    return "other"
+
+def sport_matches(sport: str | None, wanted: str | None) -> bool:
+    """wanted is a family name (run, ride, …) or an exact sport type (TrailRun); None matches all"""
+    if not wanted:
+        return True
+    w = wanted.strip().lower()
+    if w in SPORT_FAMILIES or w == "other":
+        return sport_family(sport) == w
+    return (sport or "").lower() == w
+
 def sec_to_mmss(sec: float) -> str:
     m = int(sec // 60); s = int(round(sec - m*60))
     return f"{m}:{s:02d}"
@@ -0,0 +1,103 @@
+"""
+Opaque cursors, bounded pages and field projection for list-returning tools.
+
+A cursor is base64url(JSON) holding the position to resume from plus a short
+hash of the query it belongs to ("q"), so a cursor replayed against different
+filters is rejected instead of silently returning the wrong page. Positions
+are keysets (last sort key + id), never offsets, so pages stay stable when
+activities are added in between.
+"""
+import base64
+import hashlib
+import json
+from typing import Any, Callable, Dict, Iterable, List, Sequence, Tuple
+
+from mcp_strava.services.strava_client import start_epoch
+
+MAX_PAGE = 200
+COMPACT_FIELDS = ("id", "name", "sport", "start_date", "start_date_utc", "start_date_local", "summary")
+COMPACT_FALLBACK = ("distance_km", "moving_time_min")  # rows without a one-line summary
+
+class CursorError(ValueError): pass
+
+def encode_cursor(state: Dict[str, Any]) -> str:
+    raw = json.dumps(state, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str, sig: str | None = None) -> Dict[str, Any]:
+    """Cursor state; with sig, also checks the cursor was issued for the same query"""
+    try:
+        state = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if not isinstance(state, dict):
+            raise ValueError
+    except Exception:
+        raise CursorError("invalid cursor")
+    if sig is not None and state.get("q") != sig:
+        raise CursorError("cursor belongs to a different query; start again without a cursor")
+    return state
+
+def query_sig(*parts: Any) -> str:
+    return hashlib.blake2s(json.dumps(parts, default=str, sort_keys=True).encode(), digest_size=6).hexdigest()
+
+def page_size(limit: int | None, default: int = 20) -> int:
+    return max(1, min(int(limit or default), MAX_PAGE))
+
+# ========= Projection =========
+def parse_fields(fields: str | Sequence[str] | None) -> List[str] | None:
+    if not fields:
+        return None
+    names = fields.split(",") if isinstance(fields, str) else list(fields)
+    out = [f.strip() for f in names if f and f.strip()]
+    return out or None
+
+def project(items: Iterable[Dict[str, Any]], fields: str | Sequence[str] | None = None,
+            compact: bool = False) -> List[Dict[str, Any]]:
+    """Keep only the requested keys (id always kept); compact = a short, fixed set per row"""
+    wanted = parse_fields(fields)
+    if wanted is None and not compact:
+        return list(items)
+    out = []
+    for a in items:
+        keys = wanted
+        if keys is None:
+            keys = list(COMPACT_FIELDS) + ([] if "summary" in a else list(COMPACT_FALLBACK))
+        row = {"id": a.get("id")}
+        row.update((k, a[k]) for k in keys if k in a)
+        out.append(row)
+    return out
+
+# ========= In-memory keyset pages =========
+def keyset_page(items: List[Dict[str, Any]], limit: int, cursor: str | None, sig: str,
+                key: Callable[[Dict[str, Any]], Tuple] = lambda a: (a.get("start_date") or "", a.get("id") or 0),
+                reverse: bool = True) -> Tuple[List[Dict[str, Any]], str | None]:
+    """
+    Sort items by key (newest first by default) and return the page after the
+    cursor's position plus the cursor of the next page (None on the last page).
+    """
+    ordered = sorted(items, key=key, reverse=reverse)
+    if cursor:
+        pos = tuple(decode_cursor(cursor, sig).get("k") or ())
+        ordered = [a for a in ordered if (key(a) < pos if reverse else key(a) > pos)]
+    page = ordered[:limit]
+    nxt = encode_cursor({"q": sig, "k": list(key(page[-1]))}) if len(ordered) > limit else None
+    return page, nxt
+
+# ========= Strava time pages =========
+def time_cursor(page: List[Dict[str, Any]], limit: int, sig: str, prev: Dict[str, Any] | None = None) -> str | None:
+    """
+    Cursor after the last activity of a newest-first Strava page: resume with
+    before = its start second + 1, skipping the ids already returned in that second.
+    """
+    if len(page) < limit:
+        return None
+    ts = start_epoch(page[-1])
+    ids = [a["id"] for a in page if start_epoch(a) == ts]
+    if prev and int(prev.get("b", 0)) - 1 == ts:
+        ids = list(prev.get("s") or []) + ids
+    return encode_cursor({"q": sig, "b": ts + 1, "s": ids})
+
+def page_info(next_cursor: str | None, count: int, total: int | None = None) -> Dict[str, Any]:
+    info: Dict[str, Any] = {"count": count, "has_more": next_cursor is not None, "next_cursor": next_cursor}
+    if total is not None:
+        info["total"] = total
+    return info
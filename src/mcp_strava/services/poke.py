@@ -1,15 +1,20 @@
 """Poke notification service"""
-import requests
 from typing import Dict
 from mcp_strava.settings import POKE_API_KEY, POKE_INBOUND_URL  
 
-def send_poke(message: str) -> Dict:
-    """Send a message via Poke API"""
+def send_poke(message: str, athlete_id: int | None = None) -> Dict:
+    """Send a message via Poke API (about athlete_id: only athletes allowed to reach the operator's Poke)"""
     if not POKE_API_KEY:
         print("[POKE] skipped: missing POKE_API_KEY")
         return {"ok": False, "error": "missing_api_key"}
+    if athlete_id is not None:
+        from mcp_strava.services.token_store import may_notify
+        if not may_notify(athlete_id):
+            print(f"[POKE] skipped: athlete {athlete_id} is not allowed to message this Poke account")
+            return {"ok": False, "error": "athlete_not_allowed"}
     
     try:
+        import requests
         r = requests.post(
             POKE_INBOUND_URL,
             headers={"Authorization": f"Bearer {POKE_API_KEY}", "Content-Type": "application/json"},
@@ -0,0 +1,241 @@
+"""
+Geospatial index of activity routes (SQLite, next to the activity index).
+
+Summary polylines are decoded once into int32 arrays of 1e-5 degree
+coordinates (8 bytes per point) and stored as BLOBs. Each route is also
+rasterized onto a fixed grid (CELL_E5 ≈ 550 m cells) into activity_cells,
+keyed (athlete, row, column), so "near a point" and "same route as" lookups
+are index range scans over a few cells; only the candidates' geometry is
+decoded for the exact distance check.
+"""
+import math
+import sqlite3
+from array import array
+from typing import Any, Dict, Iterable, List, Set, Tuple
+
+from mcp_strava.services import db
+
+CELL_E5 = 500          # grid cell edge in 1e-5 degrees (0.005° ≈ 555 m of latitude)
+EARTH_M = 6_371_000.0
+
+db.register_schema("""
+CREATE TABLE IF NOT EXISTS activity_geo (
+    id         INTEGER PRIMARY KEY,
+    athlete_id INTEGER NOT NULL,
+    start_lat  REAL,
+    start_lng  REAL,
+    end_lat    REAL,
+    end_lng    REAL,
+    n_points   INTEGER,
+    n_cells    INTEGER,
+    points     BLOB          -- array('i'): lat_e5, lng_e5, lat_e5, lng_e5, …
+);
+CREATE INDEX IF NOT EXISTS activity_geo_start ON activity_geo(athlete_id, start_lat, start_lng);
+CREATE TABLE IF NOT EXISTS activity_cells (
+    athlete_id  INTEGER NOT NULL,
+    cy          INTEGER NOT NULL,
+    cx          INTEGER NOT NULL,
+    activity_id INTEGER NOT NULL,
+    PRIMARY KEY (athlete_id, cy, cx, activity_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS activity_cells_activity ON activity_cells(activity_id);
+""")
+
+# ========= Geometry =========
+def decode_polyline(s: str) -> array:
+    """Google encoded polyline → flat array('i') of 1e-5 degree lat/lng pairs"""
+    out = array("i")
+    i = lat = lng = 0
+    n = len(s)
+    while i < n:
+        for which in (0, 1):
+            shift = result = 0
+            while True:
+                b = ord(s[i]) - 63
+                i += 1
+                result |= (b & 0x1F) << shift
+                shift += 5
+                if b < 0x20:
+                    break
+            d = ~(result >> 1) if result & 1 else result >> 1
+            if which == 0:
+                lat += d
+            else:
+                lng += d
+        out.append(lat)
+        out.append(lng)
+    return out
+
+def haversine_m(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp, dl = p2 - p1, math.radians(lng2 - lng1)
+    h = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * EARTH_M * math.asin(math.sqrt(min(1.0, h)))
+
+def cells(points: array) -> Set[Tuple[int, int]]:
+    """Grid cells a route passes through (segments are sampled every half cell so none are skipped)"""
+    out: Set[Tuple[int, int]] = set()
+    step = CELL_E5 / 2
+    for k in range(0, len(points), 2):
+        y, x = points[k], points[k + 1]
+        out.add((y // CELL_E5, x // CELL_E5))
+        if k >= 2:
+            py, px = points[k - 2], points[k - 1]
+            n = int(max(abs(y - py), abs(x - px)) // step)
+            for j in range(1, n):
+                out.add(((py + (y - py) * j // n) // CELL_E5, (px + (x - px) * j // n) // CELL_E5))
+    return out
+
+def min_distance_m(points: array, lat: float, lng: float) -> float:
+    """Distance (m) from (lat, lng) to a route, segments included (local equirectangular projection)"""
+    m_per_e5 = 1.11320
+    kx = math.cos(math.radians(lat)) * m_per_e5
+    ty, tx = lat * 1e5, lng * 1e5
+    best = float("inf")
+    py = px = None
+    for k in range(0, len(points), 2):
+        y, x = (points[k] - ty) * m_per_e5, (points[k + 1] - tx) * kx
+        if py is None:
+            d = y * y + x * x
+        else:
+            sy, sx = y - py, x - px
+            seg = sy * sy + sx * sx
+            t = 0.0 if seg == 0 else max(0.0, min(1.0, -(py * sy + px * sx) / seg))
+            cy, cx = py + t * sy, px + t * sx
+            d = cy * cy + cx * cx
+        if d < best:
+            best = d
+        py, px = y, x
+    return math.sqrt(best)
+
+def _latlng(v: Any) -> Tuple[float | None, float | None]:
+    if isinstance(v, (list, tuple)) and len(v) == 2:
+        return float(v[0]), float(v[1])
+    return None, None
+
+# ========= Writes (called inside the activity index transaction) =========
+def index(conn: sqlite3.Connection, athlete_id: int, activities: Iterable[Dict[str, Any]]) -> None:
+    for a in activities:
+        aid = int(a["id"])
+        poly = (a.get("map") or {}).get("summary_polyline")
+        if poly is None and "map" not in a:
+            continue  # payload without map data: keep whatever is indexed
+        conn.execute("DELETE FROM activity_cells WHERE activity_id = ?", (aid,))
+        if not poly:
+            conn.execute("DELETE FROM activity_geo WHERE id = ?", (aid,))
+            continue
+        pts = decode_polyline(poly)
+        cs = cells(pts)
+        slat, slng = _latlng(a.get("start_latlng"))
+        elat, elng = _latlng(a.get("end_latlng"))
+        if slat is None and pts:
+            slat, slng = pts[0] / 1e5, pts[1] / 1e5
+        if elat is None and pts:
+            elat, elng = pts[-2] / 1e5, pts[-1] / 1e5
+        conn.execute(
+            "INSERT OR REPLACE INTO activity_geo (id, athlete_id, start_lat, start_lng, end_lat, end_lng, n_points, n_cells, points) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (aid, athlete_id, slat, slng, elat, elng, len(pts) // 2, len(cs), pts.tobytes()),
+        )
+        conn.executemany(
+            "INSERT OR IGNORE INTO activity_cells (athlete_id, cy, cx, activity_id) VALUES (?, ?, ?, ?)",
+            [(athlete_id, cy, cx, aid) for cy, cx in cs],
+        )
+
+def delete(conn: sqlite3.Connection, activity_id: int) -> None:
+    conn.execute("DELETE FROM activity_cells WHERE activity_id = ?", (activity_id,))
+    conn.execute("DELETE FROM activity_geo WHERE id = ?", (activity_id,))
+
+def forget(conn: sqlite3.Connection, athlete_id: int) -> None:
+    conn.execute("DELETE FROM activity_cells WHERE athlete_id = ?", (athlete_id,))
+    conn.execute("DELETE FROM activity_geo WHERE athlete_id = ?", (athlete_id,))
+
+# ========= Queries =========
+def _points(blob: bytes) -> array:
+    pts = array("i")
+    pts.frombytes(blob)
+    return pts
+
+def near(athlete_id: int, lat: float, lng: float, radius_m: float, start_only: bool = False) -> List[Tuple[int, float]]:
+    """
+    (activity id, distance m) for routes passing (or starting) within radius_m
+    of a point, closest first; second recordings of a workout are left out
+    """
+    conn = db.connect()
+    if start_only:
+        dlat = radius_m / 111_320.0
+        dlng = dlat / max(0.01, math.cos(math.radians(lat)))
+        rows = conn.execute(
+            "SELECT g.id, g.start_lat, g.start_lng FROM activity_geo g JOIN activities a ON a.id = g.id "
+            "WHERE g.athlete_id = ? AND g.start_lat BETWEEN ? AND ? AND g.start_lng BETWEEN ? AND ? "
+            "AND a.duplicate_of IS NULL",
+            (athlete_id, lat - dlat, lat + dlat, lng - dlng, lng + dlng),
+        ).fetchall()
+        hits = [(r["id"], haversine_m(lat, lng, r["start_lat"], r["start_lng"])) for r in rows]
+        return sorted((h for h in hits if h[1] <= radius_m), key=lambda h: h[1])
+
+    # cells covering the circle's bounding box, then the exact check on candidates only
+    dy = math.ceil(radius_m / 1.11320 / CELL_E5) + 1
+    dx = math.ceil(dy / max(0.01, math.cos(math.radians(lat))))
+    cy, cx = math.floor(lat * 1e5) // CELL_E5, math.floor(lng * 1e5) // CELL_E5
+    cand = conn.execute(
+        "SELECT DISTINCT c.activity_id FROM activity_cells c JOIN activities a ON a.id = c.activity_id "
+        "WHERE c.athlete_id = ? AND c.cy BETWEEN ? AND ? AND c.cx BETWEEN ? AND ? AND a.duplicate_of IS NULL",
+        (athlete_id, cy - dy, cy + dy, cx - dx, cx + dx),
+    ).fetchall()
+    hits = []
+    for (aid,) in cand:
+        row = conn.execute("SELECT points FROM activity_geo WHERE id = ?", (aid,)).fetchone()
+        if row is None:
+            continue
+        d = min_distance_m(_points(row["points"]), lat, lng)
+        if d <= radius_m:
+            hits.append((aid, d))
+    return sorted(hits, key=lambda h: h[1])
+
+def similar(athlete_id: int, activity_id: int, min_similarity: float = 0.6) -> List[Tuple[int, float]]:
+    """
+    (activity id, similarity) for routes sharing most grid cells with this one:
+    Jaccard overlap of the cell sets, counted in SQL over the cell index.
+    Second recordings of a workout are left out.
+    """
+    conn = db.connect()
+    me = conn.execute("SELECT n_cells FROM activity_geo WHERE id = ?", (activity_id,)).fetchone()
+    if me is None or not me["n_cells"]:
+        return []
+    n_me = me["n_cells"]
+    rows = conn.execute(
+        """
+        SELECT o.activity_id AS id, COUNT(*) AS shared, g.n_cells AS n_other
+        FROM activity_cells m
+        JOIN activity_cells o ON o.athlete_id = m.athlete_id AND o.cy = m.cy AND o.cx = m.cx
+        JOIN activity_geo g ON g.id = o.activity_id
+        JOIN activities a ON a.id = o.activity_id
+        WHERE m.activity_id = ? AND m.athlete_id = ? AND a.duplicate_of IS NULL
+        GROUP BY o.activity_id
+        HAVING shared >= ?
+        """,
+        (activity_id, athlete_id, math.ceil(n_me * min_similarity)),
+    ).fetchall()
+    out = []
+    for r in rows:
+        j = r["shared"] / (n_me + r["n_other"] - r["shared"])
+        if j >= min_similarity:
+            out.append((r["id"], round(j, 3)))
+    return sorted(out, key=lambda h: -h[1])
+
+def latest(athlete_id: int) -> int | None:
+    """Most recent activity that has a route (copies aside)"""
+    row = db.connect().execute(
+        "SELECT g.id FROM activity_geo g JOIN activities a ON a.id = g.id WHERE g.athlete_id = ? AND a.duplicate_of IS NULL "
+        "ORDER BY a.start_ts DESC LIMIT 1",
+        (athlete_id,),
+    ).fetchone()
+    return row["id"] if row else None
+
+def stats(athlete_id: int) -> Dict[str, Any]:
+    conn = db.connect()
+    return {
+        "routes": conn.execute("SELECT COUNT(*) FROM activity_geo WHERE athlete_id = ?", (athlete_id,)).fetchone()[0],
+        "cells": conn.execute("SELECT COUNT(*) FROM activity_cells WHERE athlete_id = ?", (athlete_id,)).fetchone()[0],
+    }
@@ -0,0 +1,224 @@
+"""
+Segment efforts and personal leaderboards (SQLite, next to the activity index).
+
+Efforts come from activity details (include_all_efforts), fed in by webhooks
+and by a budgeted backfill of older activities after each index sync. They are stored once
+per effort, ordered by (athlete, segment, start) for history and by
+(athlete, segment, elapsed) for ranks. The per-segment row (count, best,
+first/last) is updated as efforts arrive, so leaderboards never re-read past
+activities.
+"""
+import sqlite3
+import time
+from typing import Any, Dict, Iterable, List, Sequence
+
+from mcp_strava.services import db
+from mcp_strava.services.strava_client import start_epoch
+
+db.register_schema("""
+CREATE TABLE IF NOT EXISTS segment_efforts (
+    id          INTEGER PRIMARY KEY,       -- Strava effort id
+    athlete_id  INTEGER NOT NULL,
+    segment_id  INTEGER NOT NULL,
+    activity_id INTEGER NOT NULL,
+    start_ts    INTEGER,
+    start_local TEXT,
+    elapsed_s   INTEGER,
+    moving_s    INTEGER,
+    avg_hr      REAL,
+    avg_watts   REAL
+);
+CREATE INDEX IF NOT EXISTS segment_efforts_time     ON segment_efforts(athlete_id, segment_id, start_ts);
+CREATE INDEX IF NOT EXISTS segment_efforts_rank     ON segment_efforts(athlete_id, segment_id, elapsed_s);
+CREATE INDEX IF NOT EXISTS segment_efforts_activity ON segment_efforts(activity_id);
+CREATE TABLE IF NOT EXISTS segments (
+    athlete_id     INTEGER NOT NULL,
+    segment_id     INTEGER NOT NULL,
+    name           TEXT,
+    activity_type  TEXT,
+    distance_m     REAL,
+    avg_grade      REAL,
+    elev_m         REAL,
+    city           TEXT,
+    efforts        INTEGER NOT NULL DEFAULT 0,
+    best_elapsed_s INTEGER,
+    best_effort_id INTEGER,
+    best_ts        INTEGER,
+    first_ts       INTEGER,
+    last_ts        INTEGER,
+    PRIMARY KEY (athlete_id, segment_id)
+);
+CREATE INDEX IF NOT EXISTS segments_efforts ON segments(athlete_id, efforts);
+CREATE TABLE IF NOT EXISTS segment_ingest (
+    activity_id INTEGER PRIMARY KEY,       -- details already read, efforts or not
+    athlete_id  INTEGER NOT NULL,
+    efforts     INTEGER,
+    ingested_at INTEGER
+);
+""")
+
+_SEGMENT_UPSERT = """
+INSERT INTO segments (athlete_id, segment_id, name, activity_type, distance_m, avg_grade, elev_m, city,
+                      efforts, best_elapsed_s, best_effort_id, best_ts, first_ts, last_ts)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, 1, ?, ?, ?, ?, ?)
+ON CONFLICT(athlete_id, segment_id) DO UPDATE SET
+    name           = COALESCE(excluded.name, segments.name),
+    activity_type  = COALESCE(excluded.activity_type, segments.activity_type),
+    distance_m     = COALESCE(excluded.distance_m, segments.distance_m),
+    avg_grade      = COALESCE(excluded.avg_grade, segments.avg_grade),
+    elev_m         = COALESCE(excluded.elev_m, segments.elev_m),
+    city           = COALESCE(excluded.city, segments.city),
+    efforts        = segments.efforts + 1,
+    best_effort_id = CASE WHEN segments.best_elapsed_s IS NULL OR excluded.best_elapsed_s < segments.best_elapsed_s
+                          THEN excluded.best_effort_id ELSE segments.best_effort_id END,
+    best_ts        = CASE WHEN segments.best_elapsed_s IS NULL OR excluded.best_elapsed_s < segments.best_elapsed_s
+                          THEN excluded.best_ts ELSE segments.best_ts END,
+    best_elapsed_s = MIN(COALESCE(segments.best_elapsed_s, excluded.best_elapsed_s), excluded.best_elapsed_s),
+    first_ts       = MIN(segments.first_ts, excluded.first_ts),
+    last_ts        = MAX(segments.last_ts, excluded.last_ts)
+"""
+
+def _elev(seg: Dict[str, Any]) -> float | None:
+    hi, lo = seg.get("elevation_high"), seg.get("elevation_low")
+    return round(hi - lo, 1) if hi is not None and lo is not None else None
+
+# ========= Writes (called inside the activity index transaction) =========
+def index(conn: sqlite3.Connection, athlete_id: int, activities: Iterable[Dict[str, Any]]) -> None:
+    """
+    Ingest the efforts of detail payloads; summaries (no segment_efforts key)
+    and second recordings of a workout (see duplicates.py) are skipped
+    """
+    for a in activities:
+        if "segment_efforts" not in a:
+            continue
+        act_id = int(a["id"])
+        if conn.execute("SELECT duplicate_of FROM activities WHERE id = ?", (act_id,)).fetchone()["duplicate_of"]:
+            exclude(conn, athlete_id, [act_id])
+            continue
+        stale = _drop(conn, act_id)
+        efforts = [e for e in a.get("segment_efforts") or []
+                   if e.get("id") and (e.get("segment") or {}).get("id") and e.get("elapsed_time") is not None]
+        for e in efforts:
+            seg = e["segment"]
+            ts = start_epoch(e)
+            conn.execute(
+                "INSERT OR REPLACE INTO segment_efforts (id, athlete_id, segment_id, activity_id, start_ts, start_local, "
+                "elapsed_s, moving_s, avg_hr, avg_watts) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (int(e["id"]), athlete_id, int(seg["id"]), act_id, ts, e.get("start_date_local"),
+                 e.get("elapsed_time"), e.get("moving_time"), e.get("average_heartrate"), e.get("average_watts")),
+            )
+            if int(seg["id"]) in stale:
+                continue  # recounted below
+            conn.execute(_SEGMENT_UPSERT, (
+                athlete_id, int(seg["id"]), seg.get("name"), seg.get("activity_type"), seg.get("distance"),
+                seg.get("average_grade"), _elev(seg), seg.get("city"),
+                e.get("elapsed_time"), int(e["id"]), ts, ts, ts,
+            ))
+        _recount(conn, athlete_id, stale)
+        conn.execute(
+            "INSERT OR REPLACE INTO segment_ingest (activity_id, athlete_id, efforts, ingested_at) VALUES (?, ?, ?, ?)",
+            (act_id, athlete_id, len(efforts), int(time.time())),
+        )
+
+def _drop(conn: sqlite3.Connection, activity_id: int) -> set:
+    """Remove an activity's efforts; returns the segments whose stats must be recounted"""
+    segs = {r[0] for r in conn.execute("SELECT DISTINCT segment_id FROM segment_efforts WHERE activity_id = ?", (activity_id,))}
+    if segs:
+        conn.execute("DELETE FROM segment_efforts WHERE activity_id = ?", (activity_id,))
+    return segs
+
+def _recount(conn: sqlite3.Connection, athlete_id: int, segment_ids: Iterable[int]) -> None:
+    """Rebuild a segment's stats from its efforts (after a delete or a re-ingested activity)"""
+    for sid in segment_ids:
+        agg = conn.execute(
+            "SELECT COUNT(*) AS n, MIN(start_ts) AS first_ts, MAX(start_ts) AS last_ts FROM segment_efforts "
+            "WHERE athlete_id = ? AND segment_id = ?", (athlete_id, sid),
+        ).fetchone()
+        if not agg["n"]:
+            conn.execute("DELETE FROM segments WHERE athlete_id = ? AND segment_id = ?", (athlete_id, sid))
+            continue
+        best = conn.execute(
+            "SELECT id, elapsed_s, start_ts FROM segment_efforts WHERE athlete_id = ? AND segment_id = ? "
+            "ORDER BY elapsed_s, start_ts LIMIT 1", (athlete_id, sid),
+        ).fetchone()
+        conn.execute(
+            "UPDATE segments SET efforts = ?, first_ts = ?, last_ts = ?, best_elapsed_s = ?, best_effort_id = ?, best_ts = ? "
+            "WHERE athlete_id = ? AND segment_id = ?",
+            (agg["n"], agg["first_ts"], agg["last_ts"], best["elapsed_s"], best["id"], best["start_ts"], athlete_id, sid),
+        )
+
+def exclude(conn: sqlite3.Connection, athlete_id: int, activity_ids: Iterable[int]) -> None:
+    """
+    Take copies out of the leaderboards. Their ingest mark goes too, so a copy
+    promoted to primary later is read again by the backfill.
+    """
+    for act_id in activity_ids:
+        _recount(conn, athlete_id, _drop(conn, act_id))
+        conn.execute("DELETE FROM segment_ingest WHERE activity_id = ?", (act_id,))
+
+def delete(conn: sqlite3.Connection, activity_id: int) -> None:
+    row = conn.execute("SELECT athlete_id FROM segment_ingest WHERE activity_id = ?", (activity_id,)).fetchone()
+    if row is None:
+        return
+    _recount(conn, row["athlete_id"], _drop(conn, activity_id))
+    conn.execute("DELETE FROM segment_ingest WHERE activity_id = ?", (activity_id,))
+
+def forget(conn: sqlite3.Connection, athlete_id: int) -> None:
+    for table in ("segment_efforts", "segments", "segment_ingest"):
+        conn.execute(f"DELETE FROM {table} WHERE athlete_id = ?", (athlete_id,))
+
+# ========= Queries =========
+def pending(athlete_id: int, limit: int) -> List[int]:
+    """Activities with a GPS route whose efforts were never read (copies aside), newest first"""
+    rows = db.connect().execute(
+        "SELECT a.id FROM activities a JOIN activity_geo g ON g.id = a.id "
+        "WHERE a.athlete_id = ? AND a.duplicate_of IS NULL AND a.id NOT IN (SELECT activity_id FROM segment_ingest WHERE athlete_id = ?) "
+        "ORDER BY a.start_ts DESC LIMIT ?",
+        (athlete_id, athlete_id, limit),
+    ).fetchall()
+    return [r[0] for r in rows]
+
+def coverage(athlete_id: int) -> Dict[str, int]:
+    conn = db.connect()
+    routes = conn.execute("SELECT COUNT(*) FROM activity_geo WHERE athlete_id = ?", (athlete_id,)).fetchone()[0]
+    done = conn.execute(
+        "SELECT COUNT(*) FROM segment_ingest s JOIN activity_geo g ON g.id = s.activity_id WHERE s.athlete_id = ?",
+        (athlete_id,),
+    ).fetchone()[0]
+    return {"activities_with_routes": routes, "activities_ingested": done, "pending": max(0, routes - done)}
+
+def segment(athlete_id: int, segment_id: int) -> Dict[str, Any] | None:
+    row = db.connect().execute(
+        "SELECT * FROM segments WHERE athlete_id = ? AND segment_id = ?", (athlete_id, segment_id)
+    ).fetchone()
+    return dict(row) if row else None
+
+def find(athlete_id: int, name: str, limit: int = 5) -> List[Dict[str, Any]]:
+    """Segments whose name contains `name`, most ridden/run first"""
+    rows = db.connect().execute(
+        "SELECT * FROM segments WHERE athlete_id = ? AND name LIKE ? ESCAPE '\\' ORDER BY efforts DESC, segment_id LIMIT ?",
+        (athlete_id, "%" + name.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%", limit),
+    ).fetchall()
+    return [dict(r) for r in rows]
+
+def top(athlete_id: int, limit: int, after: Sequence[int] | None = None) -> List[Dict[str, Any]]:
+    """Segments by effort count (desc), keyset-paged on (efforts, segment_id)"""
+    sql = "SELECT * FROM segments WHERE athlete_id = ?"
+    args: List[Any] = [athlete_id]
+    if after:
+        sql += " AND (efforts < ? OR (efforts = ? AND segment_id > ?))"
+        args += [after[0], after[0], after[1]]
+    sql += " ORDER BY efforts DESC, segment_id LIMIT ?"
+    return [dict(r) for r in db.connect().execute(sql, args + [limit]).fetchall()]
+
+def count(athlete_id: int) -> int:
+    return db.connect().execute("SELECT COUNT(*) FROM segments WHERE athlete_id = ?", (athlete_id,)).fetchone()[0]
+
+def efforts(athlete_id: int, segment_id: int) -> List[Dict[str, Any]]:
+    """Every effort on a segment, oldest first (time-ordered index scan)"""
+    rows = db.connect().execute(
+        "SELECT e.*, a.name AS activity_name FROM segment_efforts e LEFT JOIN activities a ON a.id = e.activity_id "
+        "WHERE e.athlete_id = ? AND e.segment_id = ? ORDER BY e.start_ts, e.id",
+        (athlete_id, segment_id),
+    ).fetchall()
+    return [dict(r) for r in rows]
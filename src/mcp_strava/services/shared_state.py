@@ -0,0 +1,248 @@
+"""
+State shared between workers: webhook dedupe claims, cache entries, the
+rate-limit budget and single-flight locks.
+
+STATE_BACKEND=memory keeps everything process-local (single worker).
+STATE_BACKEND=sqlite stores it in DB_FILE so `uvicorn --workers N` still sends
+each Poke notification once and refreshes each athlete's token once.
+"""
+import pickle
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Any, ContextManager, Dict, Iterator, Tuple
+
+from mcp_strava.settings import STATE_BACKEND
+from mcp_strava.services import db, memory, snapshot
+
+class LockTimeout(RuntimeError): pass
+
+class StateBackend(ABC):
+    """Interface; values must be picklable"""
+    shared = False  # True when other processes see the same state
+
+    @abstractmethod
+    def claim(self, key: str, ttl: float) -> bool:
+        """Atomically mark key as seen for ttl seconds; False if it was already claimed"""
+
+    @abstractmethod
+    def get(self, namespace: str, key: str) -> Any: ...
+
+    @abstractmethod
+    def set(self, namespace: str, key: str, value: Any, ttl: float) -> None: ...
+
+    @abstractmethod
+    def delete(self, namespace: str, key: str) -> None: ...
+
+    @abstractmethod
+    def clear(self, namespace: str) -> None: ...
+
+    @abstractmethod
+    def lock(self, name: str, timeout: float = 30.0, lease: float = 60.0) -> ContextManager[None]:
+        """Single-flight lock held across workers; raises LockTimeout after `timeout` seconds"""
+
+    def stats(self) -> Dict[str, Any]:
+        return {}
+
+CLAIM_BYTES = 160  # dedupe key string + expiry float + dict slot
+KV_BYTES = 512     # rough size of one memory-backend value (rate budget, small lookups)
+
+class MemoryBackend(StateBackend):
+    """Process-local state; dedupe claims are carried across restarts by the snapshot"""
+
+    def __init__(self):
+        self._claims: Dict[str, float] = {}  # key -> expires_at
+        self._purged_at = 0.0
+        self._kv: Dict[Tuple[str, str], Tuple[Any, float]] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._mu = threading.Lock()
+        snapshot.register("dedupe", lambda: dict(self._claims), self._load_claims)
+        # sizes are per-entry estimates: enforce() asks for them on every cache insert
+        memory.register("dedupe", lambda: CLAIM_BYTES * len(self._claims), self._evict_claims,
+                        lambda: {"entries": len(self._claims)})
+        memory.register("state_kv", lambda: KV_BYTES * len(self._kv), self._evict_kv,
+                        lambda: {"entries": len(self._kv)})
+
+    def _evict_claims(self, nbytes: int, expired_only: bool) -> int:
+        """Only expired claims can go: dropping a live one would let a duplicate event through"""
+        now = time.time()
+        with self._mu:
+            gone = [k for k, exp in self._claims.items() if exp < now]
+            for k in gone:
+                self._claims.pop(k, None)
+            self._purged_at = now
+        return CLAIM_BYTES * len(gone)
+
+    def _evict_kv(self, nbytes: int, expired_only: bool) -> int:
+        now = time.time()
+        with self._mu:
+            gone = [k for k, e in self._kv.items() if e[1] < now]
+            for k in gone:
+                self._kv.pop(k, None)
+        return KV_BYTES * len(gone)
+
+    def _load_claims(self, d: Dict[str, float]) -> None:
+        with self._mu:
+            for k, exp in d.items():
+                self._claims.setdefault(k, exp)
+
+    def claim(self, key: str, ttl: float) -> bool:
+        snapshot.restore("dedupe")
+        now = time.time()
+        with self._mu:
+            # Clean expired entries (at most once a second)
+            if now - self._purged_at >= 1.0:
+                for k, exp in list(self._claims.items()):
+                    if exp < now:
+                        self._claims.pop(k, None)
+                self._purged_at = now
+            exp = self._claims.get(key)
+            if exp is not None and exp >= now:
+                return False
+            self._claims[key] = now + ttl
+            return True
+
+    def get(self, namespace: str, key: str) -> Any:
+        e = self._kv.get((namespace, key))
+        if e is None or e[1] < time.time():
+            return None
+        return e[0]
+
+    def set(self, namespace: str, key: str, value: Any, ttl: float) -> None:
+        self._kv[(namespace, key)] = (value, time.time() + ttl)
+
+    def delete(self, namespace: str, key: str) -> None:
+        self._kv.pop((namespace, key), None)
+
+    def clear(self, namespace: str) -> None:
+        with self._mu:
+            for k in [k for k in self._kv if k[0] == namespace]:
+                self._kv.pop(k, None)
+
+    @contextmanager
+    def lock(self, name: str, timeout: float = 30.0, lease: float = 60.0) -> Iterator[None]:
+        with self._mu:
+            lk = self._locks.setdefault(name, threading.Lock())
+        if not lk.acquire(timeout=timeout):
+            raise LockTimeout(name)
+        try:
+            yield
+        finally:
+            lk.release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": "memory", "claims": len(self._claims), "kv": len(self._kv)}
+
+db.register_schema("""
+CREATE TABLE IF NOT EXISTS state_claims (
+    key        TEXT PRIMARY KEY,
+    expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS state_claims_exp ON state_claims(expires_at);
+CREATE TABLE IF NOT EXISTS state_kv (
+    namespace  TEXT NOT NULL,
+    key        TEXT NOT NULL,
+    value      BLOB,
+    expires_at REAL NOT NULL,
+    PRIMARY KEY (namespace, key)
+);
+CREATE TABLE IF NOT EXISTS state_locks (
+    name       TEXT PRIMARY KEY,
+    owner      TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+""")
+
+class SQLiteBackend(StateBackend):
+    """Shared through DB_FILE; every write is a short IMMEDIATE transaction"""
+    shared = True
+
+    def __init__(self):
+        self._owner = uuid.uuid4().hex
+        self._claims_since_purge = 0
+        self._local_locks: Dict[str, threading.Lock] = {}
+        self._mu = threading.Lock()
+
+    def claim(self, key: str, ttl: float) -> bool:
+        now = time.time()
+        with db.transaction() as conn:
+            self._claims_since_purge += 1
+            if self._claims_since_purge >= 256:
+                conn.execute("DELETE FROM state_claims WHERE expires_at < ?", (now,))
+                self._claims_since_purge = 0
+            row = conn.execute("SELECT expires_at FROM state_claims WHERE key = ?", (key,)).fetchone()
+            if row is not None and row["expires_at"] >= now:
+                return False
+            conn.execute("INSERT OR REPLACE INTO state_claims (key, expires_at) VALUES (?, ?)", (key, now + ttl))
+            return True
+
+    def get(self, namespace: str, key: str) -> Any:
+        row = db.connect().execute(
+            "SELECT value FROM state_kv WHERE namespace = ? AND key = ? AND expires_at >= ?",
+            (namespace, key, time.time()),
+        ).fetchone()
+        return pickle.loads(row["value"]) if row else None
+
+    def set(self, namespace: str, key: str, value: Any, ttl: float) -> None:
+        db.connect().execute(
+            "INSERT OR REPLACE INTO state_kv (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+            (namespace, key, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), time.time() + ttl),
+        )
+
+    def delete(self, namespace: str, key: str) -> None:
+        db.connect().execute("DELETE FROM state_kv WHERE namespace = ? AND key = ?", (namespace, key))
+
+    def clear(self, namespace: str) -> None:
+        db.connect().execute("DELETE FROM state_kv WHERE namespace = ?", (namespace,))
+
+    @contextmanager
+    def lock(self, name: str, timeout: float = 30.0, lease: float = 60.0) -> Iterator[None]:
+        # Threads of this process queue on a local lock; processes race on a leased row
+        with self._mu:
+            lk = self._local_locks.setdefault(name, threading.Lock())
+        if not lk.acquire(timeout=timeout):
+            raise LockTimeout(name)
+        try:
+            deadline = time.time() + timeout
+            while True:
+                now = time.time()
+                with db.transaction() as conn:
+                    row = conn.execute("SELECT owner, expires_at FROM state_locks WHERE name = ?", (name,)).fetchone()
+                    if row is None or row["expires_at"] < now:
+                        conn.execute("INSERT OR REPLACE INTO state_locks (name, owner, expires_at) VALUES (?, ?, ?)",
+                                     (name, self._owner, now + lease))
+                        break
+                if now > deadline:
+                    raise LockTimeout(name)
+                time.sleep(0.05)
+            try:
+                yield
+            finally:
+                db.connect().execute("DELETE FROM state_locks WHERE name = ? AND owner = ?", (name, self._owner))
+        finally:
+            lk.release()
+
+    def stats(self) -> Dict[str, Any]:
+        conn = db.connect()
+        return {
+            "backend": "sqlite",
+            "claims": conn.execute("SELECT COUNT(*) FROM state_claims").fetchone()[0],
+            "kv": conn.execute("SELECT COUNT(*) FROM state_kv").fetchone()[0],
+        }
+
+_BACKENDS = {"memory": MemoryBackend, "sqlite": SQLiteBackend}
+_backend: StateBackend | None = None
+_backend_lock = threading.Lock()
+
+def backend() -> StateBackend:
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                name = (STATE_BACKEND or "memory").lower()
+                if name not in _BACKENDS:
+                    raise RuntimeError(f"Unknown STATE_BACKEND: {name} (expected one of {', '.join(_BACKENDS)})")
+                _backend = _BACKENDS[name]()
+    return _backend
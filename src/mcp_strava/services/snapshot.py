@@ -0,0 +1,148 @@
+"""
+Warm-start snapshot of in-memory state.
+
+Each cache registers a dump/load pair under a section name. save() writes all
+sections to one compact binary file (atomically); on boot the file is mmapped
+and a section is only decoded when its owner first touches it (restore()), so
+a cold start pays for nothing it does not use.
+
+The file only ever holds caches, dedupe keys and the rate budget (tokens stay
+in the token store). It is written owner-only (0600) and read back with an
+unpickler that refuses every class or function reference, so a tampered file
+cannot run code: sections are plain data (dict, list, tuple, set, str, numbers).
+
+File layout: MAGIC | u32 header length | JSON header {name: [offset, length]} | zlib(pickle) sections
+"""
+import asyncio
+import io
+import json
+import mmap
+import os
+import pickle
+import struct
+import threading
+import time
+import zlib
+from typing import Any, Callable, Dict, Tuple
+
+from mcp_strava.settings import SNAPSHOT_FILE, SNAPSHOT_INTERVAL
+
+MAGIC = b"MSS1"
+RETIRED = {"tokens"}  # sections older releases wrote: dropped on the next save instead of carried over
+
+_providers: Dict[str, Tuple[Callable[[], Any], Callable[[Any], None]]] = {}
+_restored: set = set()
+_lock = threading.RLock()
+_map: mmap.mmap | None = None
+_index: Dict[str, Tuple[int, int]] | None = None
+
+def register(name: str, dump: Callable[[], Any], load: Callable[[Any], None]) -> None:
+    """Register a section; dump() must return plain data (no class instances), load(data) merges it back"""
+    _providers[name] = (dump, load)
+
+class _DataUnpickler(pickle.Unpickler):
+    def find_class(self, module: str, name: str):
+        raise pickle.UnpicklingError(f"snapshot sections are plain data, refusing {module}.{name}")
+
+def _loads(blob: bytes) -> Any:
+    return _DataUnpickler(io.BytesIO(zlib.decompress(blob))).load()
+
+def _open() -> None:
+    """mmap the snapshot file and parse its header (sections stay undecoded)"""
+    global _map, _index
+    if _index is not None:
+        return
+    _index = {}
+    if not SNAPSHOT_FILE or not os.path.exists(SNAPSHOT_FILE):
+        return
+    try:
+        with open(SNAPSHOT_FILE, "rb") as f:
+            m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if m[:4] != MAGIC:
+            print(f"[SNAPSHOT] ignoring {SNAPSHOT_FILE}: bad magic")
+            m.close()
+            return
+        (hlen,) = struct.unpack(">I", m[4:8])
+        header = json.loads(m[8:8 + hlen])
+        base = 8 + hlen
+        _index = {name: (base + off, length) for name, (off, length) in header.items()}
+        _map = m
+        print(f"[SNAPSHOT] opened {SNAPSHOT_FILE} ({len(m)} bytes, sections: {', '.join(_index)})")
+    except Exception as e:
+        print(f"[SNAPSHOT] could not open {SNAPSHOT_FILE}: {e!r}")
+        _index = {}
+
+def _section(name: str) -> bytes | None:
+    if not _index or name not in _index or _map is None:
+        return None
+    off, length = _index[name]
+    return _map[off:off + length]
+
+def restore(name: str) -> bool:
+    """Load one section into its owner, once. Returns True if data was restored."""
+    with _lock:
+        if name in _restored:
+            return False
+        _restored.add(name)
+        _open()
+        raw = _section(name)
+        provider = _providers.get(name)
+    if raw is None or provider is None:
+        return False
+    try:
+        provider[1](_loads(raw))
+        return True
+    except Exception as e:
+        print(f"[SNAPSHOT] could not restore {name}: {e!r}")
+        return False
+
+def save() -> Dict[str, Any]:
+    """Write every registered section to SNAPSHOT_FILE (tmp file + rename)"""
+    if not SNAPSHOT_FILE:
+        return {"ok": False, "error": "disabled"}
+    t0 = time.perf_counter()
+    with _lock:
+        _open()
+        blobs: Dict[str, bytes] = {}
+        for name in list(_providers) + [n for n in (_index or {}) if n not in _providers and n not in RETIRED]:
+            if (name not in _restored or name not in _providers) and _section(name) is not None:
+                # never touched since boot (or owner not loaded): carry the old bytes over without decoding them
+                blobs[name] = bytes(_section(name))
+                continue
+            if name not in _providers:
+                continue
+            try:
+                blobs[name] = zlib.compress(pickle.dumps(_providers[name][0](), protocol=pickle.HIGHEST_PROTOCOL), 6)
+            except Exception as e:
+                print(f"[SNAPSHOT] could not dump {name}: {e!r}")
+
+        header, off = {}, 0
+        for name, blob in blobs.items():
+            header[name] = [off, len(blob)]
+            off += len(blob)
+        hbytes = json.dumps(header).encode()
+
+        tmp = f"{SNAPSHOT_FILE}.{os.getpid()}.tmp"  # workers may save concurrently; the rename is atomic
+        with os.fdopen(os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "wb") as f:
+            f.write(MAGIC)
+            f.write(struct.pack(">I", len(hbytes)))
+            f.write(hbytes)
+            for blob in blobs.values():
+                f.write(blob)
+        os.replace(tmp, SNAPSHOT_FILE)  # the old mapping stays valid for sections not yet restored
+
+    size = 8 + len(hbytes) + off
+    ms = (time.perf_counter() - t0) * 1000
+    print(f"[SNAPSHOT] saved {len(blobs)} sections, {size} bytes in {ms:.1f} ms")
+    return {"ok": True, "bytes": size, "sections": list(blobs), "ms": round(ms, 1)}
+
+async def run_periodic() -> None:
+    """Background task: save every SNAPSHOT_INTERVAL seconds"""
+    if not SNAPSHOT_FILE or SNAPSHOT_INTERVAL <= 0:
+        return
+    while True:
+        await asyncio.sleep(SNAPSHOT_INTERVAL)
+        try:
+            await asyncio.to_thread(save)
+        except Exception as e:
+            print(f"[SNAPSHOT] periodic save failed: {e!r}")
@@ -1,153 +1,433 @@
-import time, requests
-from typing import Any, Dict, List
-from mcp_strava.settings import STRAVA_CLIENT_ID, STRAVA_CLIENT_SECRET, STRAVA_ACCESS_TOKEN, STRAVA_REFRESH_TOKEN, STRAVA_EXPIRES_AT
-
-# Initialize tokens from env vars as fallback, but prefer JSON file
-_tokens = {
-    "access_token": STRAVA_ACCESS_TOKEN,
-    "refresh_token": STRAVA_REFRESH_TOKEN,
-    "expires_at": STRAVA_EXPIRES_AT or int(time.time()) + 60,  # safe default
-}
-
-def _load_tokens_from_file():
-    """Load tokens from JSON file if available, otherwise use env vars"""
+import time, threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, Iterator, List
+from mcp_strava.settings import STRAVA_CLIENT_ID, STRAVA_CLIENT_SECRET, STRAVA_ACCESS_TOKEN, STRAVA_REFRESH_TOKEN, STRAVA_EXPIRES_AT, STRAVA_API_URL, STRAVA_OAUTH_URL
+from mcp_strava.settings import ACTIVITY_CACHE_TTL, LIST_CACHE_TTL
+from mcp_strava.settings import STRAVA_TIMEOUT, BREAKER_FAILURES, BREAKER_RECOVERY, BREAKER_PROBES, HEDGE_PERCENTILE
+from mcp_strava.services import memory, snapshot
+from mcp_strava.services.cache import TTLCache, clear_tag
+from mcp_strava.services.shared_state import backend
+from mcp_strava.services.circuit import CircuitBreaker, CircuitOpenError, Hedger
+from mcp_strava.services.token_store import LEGACY_ATHLETE_ID, load_tokens, save_tokens, default_athlete_id, is_registered
+
+current_athlete: ContextVar[int | None] = ContextVar("current_athlete", default=None)
+# Oldest cache timestamp served instead of live data during the current request (see annotate_stale)
+_stale_since: ContextVar[float | None] = ContextVar("strava_stale_since", default=None)
+
+# Fail fast while Strava is down; optionally hedge slow GETs (HEDGE_PERCENTILE=0 disables)
+_breaker = CircuitBreaker("strava", failures=BREAKER_FAILURES, recovery=BREAKER_RECOVERY, probes=BREAKER_PROBES)
+_hedger = Hedger(HEDGE_PERCENTILE)
+HEDGE_RESERVE = 20  # never hedge when fewer requests than this remain in the 15-minute window
+
+_http = None
+
+# Response caches, keyed by athlete: activity details are immutable until an update webhook, lists go stale fast
+_details = TTLCache("activities", ttl=ACTIVITY_CACHE_TTL, maxsize=2000)
+_lists = TTLCache("activity_lists", ttl=LIST_CACHE_TTL, maxsize=64, tags=("activity_lists",))
+
+# Strava rate-limit budget (per application), from X-RateLimit-* headers (15-minute and daily windows)
+_rate: Dict[str, Any] = {"limit_15m": 100, "usage_15m": 0, "limit_day": 1000, "usage_day": 0, "updated_at": 0}
+
+# One client per athlete, created on first use and kept in memory (no per-request store reads)
+_clients: Dict[int, "AthleteClient"] = {}
+_clients_lock = threading.Lock()
+
+def _session():
+    """Shared keep-alive HTTP session; requests is imported on first use to keep cold start cheap"""
+    global _http
+    if _http is None:
+        import requests
+        _http = requests.Session()
+    return _http
+
+class StravaAuthError(RuntimeError):
+    def __init__(self, message: str, status: int | None = None):
+        super().__init__(message)
+        self.status = status  # HTTP status of a refused token refresh
+
+class StravaUnavailable(RuntimeError):
+    """Strava is down, timing out or rate limiting us (or the circuit is open)"""
+
+def _is_upstream_failure(e: BaseException) -> bool:
+    import requests
+    if isinstance(e, (requests.ConnectionError, requests.Timeout)):
+        return True
+    if isinstance(e, requests.HTTPError) and e.response is not None:
+        return e.response.status_code >= 500 or e.response.status_code == 429
+    return False
+
+class AthleteClient:
+    """Token cache and refresh for one athlete"""
+
+    def __init__(self, athlete_id: int):
+        self.athlete_id = athlete_id
+        self.tokens: Dict[str, Any] = {"access_token": None, "refresh_token": None, "expires_at": 0}
+        if athlete_id == LEGACY_ATHLETE_ID:
+            # Initialize tokens from env vars as fallback, but prefer the token store
+            self.tokens.update({
+                "access_token": STRAVA_ACCESS_TOKEN,
+                "refresh_token": STRAVA_REFRESH_TOKEN,
+                "expires_at": STRAVA_EXPIRES_AT or int(time.time()) + 60,  # safe default
+            })
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def load(self) -> None:
+        """Load tokens from the store if available, otherwise keep what we have"""
+        try:
+            stored = load_tokens(self.athlete_id)
+            if stored:
+                for k in ("access_token", "refresh_token", "expires_at"):
+                    if stored.get(k):
+                        self.tokens[k] = stored[k]
+            elif not self.tokens["access_token"]:
+                print(f"[STRAVA_CLIENT] No tokens for athlete {self.athlete_id}")
+        except Exception as e:
+            print(f"[STRAVA_CLIENT] Error loading tokens for athlete {self.athlete_id}: {e}")
+        self._loaded = True
+
+    def ensure_loaded(self) -> None:
+        if self._loaded:
+            return
+        with self._lock:
+            if not self._loaded:
+                self.load()
+
+    def reload(self) -> None:
+        with self._lock:
+            self.load()
+
+    def refresh(self, stale_token: str | None = None) -> None:
+        """
+        Refresh once across threads and workers: under the athlete's lock, first
+        adopt a token another worker may already have refreshed into the store.
+        """
+        stale_token = stale_token or self.tokens["access_token"]
+        with backend().lock(f"refresh:{self.athlete_id}"):
+            if backend().shared or self.tokens["access_token"] != stale_token:
+                self.load()
+                if self.tokens["access_token"] != stale_token and self.tokens["expires_at"] - int(time.time()) >= 60:
+                    return
+            self._refresh_now()
+
+    def _refresh_now(self) -> None:
+        if not self.tokens["refresh_token"]:
+            raise StravaAuthError("Missing STRAVA_REFRESH_TOKEN for refresh")
+
+        print(f"[STRAVA_CLIENT] Refreshing tokens for athlete {self.athlete_id}...")
+        r = _session().post(f"{STRAVA_OAUTH_URL}/token", data={
+            "client_id": STRAVA_CLIENT_ID,
+            "client_secret": STRAVA_CLIENT_SECRET,
+            "grant_type": "refresh_token",
+            "refresh_token": self.tokens["refresh_token"]
+        }, timeout=30)
+        if r.status_code >= 400:
+            raise StravaAuthError(f"Refresh failed {r.status_code} {r.text}", status=r.status_code)
+
+        d = r.json()
+        self.tokens.update({
+            "access_token": d["access_token"],
+            "refresh_token": d.get("refresh_token", self.tokens["refresh_token"]),
+            "expires_at": d.get("expires_at", int(time.time()) + 6*3600),
+        })
+
+        try:
+            save_tokens({**self.tokens, "token_type": "Bearer", "scope": d.get("scope")}, athlete_id=self.athlete_id)
+            print(f"[STRAVA_CLIENT] Tokens refreshed and saved for athlete {self.athlete_id}")
+        except Exception as e:
+            print(f"[STRAVA_CLIENT] Warning: Could not save refreshed tokens: {e}")
+
+    def auth_header(self) -> Dict[str, str]:
+        self.ensure_loaded()
+
+        # If no access token, try to reload from the store first
+        if not self.tokens["access_token"]:
+            print(f"[STRAVA_CLIENT] No access token for athlete {self.athlete_id}, trying to reload...")
+            self.reload()
+
+        # Still no token? Error
+        if not self.tokens["access_token"]:
+            raise StravaAuthError("Missing STRAVA_ACCESS_TOKEN - please authenticate first")
+
+        # Check if token is expired
+        if self.tokens["expires_at"] - int(time.time()) < 60:
+            self.refresh()
+
+        return {"Authorization": f"Bearer {self.tokens['access_token']}"}
+
+    def get(self, path: str, params: Dict[str, Any] | None = None) -> Any:
+        """GET an API path through the circuit breaker, refreshing the token once on 401"""
+        url = f"{STRAVA_API_URL}{path}"
+
+        def send(headers):
+            once = lambda: _session().get(url, headers=headers, params=params, timeout=(3.05, STRAVA_TIMEOUT))
+            return _hedger.call(once, allow=lambda: rate_budget()["remaining_15m"] > HEDGE_RESERVE)
+
+        def attempt():
+            headers = self.auth_header()
+            r = send(headers)
+            if r.status_code == 401:
+                self.refresh(stale_token=headers["Authorization"][len("Bearer "):])
+                r = send(self.auth_header())
+            _track_rate(r.headers)
+            if r.status_code >= 500 or r.status_code == 429:
+                r.raise_for_status()
+            return r
+
+        try:
+            r = _breaker.call(attempt, is_failure=_is_upstream_failure)
+        except CircuitOpenError as e:
+            raise StravaUnavailable(str(e)) from e
+        except Exception as e:
+            if _is_upstream_failure(e):
+                raise StravaUnavailable(f"Strava unavailable: {e}") from e
+            raise
+        r.raise_for_status()
+        return r.json()
+
+def for_athlete(athlete_id: int) -> AthleteClient:
+    c = _clients.get(athlete_id)
+    if c is None:
+        with _clients_lock:
+            c = _clients.setdefault(athlete_id, AthleteClient(athlete_id))
+    return c
+
+def current_athlete_id() -> int:
+    aid = current_athlete.get()
+    return default_athlete_id() if aid is None else aid
+
+def client() -> AthleteClient:
+    """Client for the athlete of the current request (webhook owner) or the default athlete"""
+    return for_athlete(current_athlete_id())
+
+@contextmanager
+def as_athlete(athlete_id: int):
+    """Route Strava calls made inside the block to this athlete"""
+    token = current_athlete.set(int(athlete_id))
     try:
-        from mcp_strava.services.token_store import load_tokens
-        file_tokens = load_tokens()
-        if file_tokens:
-            print(f"[STRAVA_CLIENT] Loading tokens from file")
-            # Only update if file has valid tokens
-            if file_tokens.get("access_token"):
-                _tokens["access_token"] = file_tokens["access_token"]
-            if file_tokens.get("refresh_token"):
-                _tokens["refresh_token"] = file_tokens["refresh_token"]
-            if file_tokens.get("expires_at"):
-                _tokens["expires_at"] = file_tokens["expires_at"]
-        else:
-            print(f"[STRAVA_CLIENT] No tokens file found")
-            # If env vars are empty/None, set them to empty string to be clear
-            if not _tokens["access_token"]:
-                print(f"[STRAVA_CLIENT] No access token in env vars either")
-    except Exception as e:
-        print(f"[STRAVA_CLIENT] Error loading tokens from file: {e}")
-
-# Load tokens from file on import
-_load_tokens_from_file()
-
-class StravaAuthError(RuntimeError): pass
-
-def reload_tokens():
-    """Reload tokens from file - useful after OAuth callback"""
-    _load_tokens_from_file()
-
-def _refresh() -> None:
-    if not _tokens["refresh_token"]:
-        raise StravaAuthError("Missing STRAVA_REFRESH_TOKEN for refresh")
-    
-    print(f"[STRAVA_CLIENT] Refreshing tokens...")
-    r = requests.post("https://www.strava.com/oauth/token", data={
-        "client_id": STRAVA_CLIENT_ID,
-        "client_secret": STRAVA_CLIENT_SECRET,
-        "grant_type": "refresh_token",
-        "refresh_token": _tokens["refresh_token"]
-    }, timeout=30)
-    if r.status_code >= 400:
-        raise StravaAuthError(f"Refresh failed {r.status_code} {r.text}")
-    
-    d = r.json()
-    _tokens.update({
-        "access_token": d["access_token"],
-        "refresh_token": d.get("refresh_token", _tokens["refresh_token"]),
-        "expires_at": d.get("expires_at", int(time.time()) + 6*3600),
-    })
-    
-    # Save refreshed tokens to file
+        yield for_athlete(int(athlete_id))
+    finally:
+        current_athlete.reset(token)
+
+def resolve_owner(owner_id: Any, exact: bool = False) -> int | None:
+    """
+    Athlete to use for a webhook's owner_id, or None if that athlete never signed
+    in here. Unless exact, unknown owners map to the legacy single-user slot.
+    """
     try:
-        from mcp_strava.services.token_store import save_tokens
-        save_tokens({
-            "access_token": _tokens["access_token"],
-            "refresh_token": _tokens["refresh_token"],
-            "expires_at": _tokens["expires_at"],
-            "token_type": "Bearer",
-            "scope": d.get("scope", "read,activity:read_all")
-        })
-        print(f"[STRAVA_CLIENT] Tokens refreshed and saved to file")
+        aid = int(owner_id)
+    except (TypeError, ValueError):
+        aid = None
+    if aid is not None and (aid in _clients or is_registered(aid)):
+        return aid
+    # Single-user setups whose tokens carry no athlete id still get their webhooks
+    if not exact and default_athlete_id() == LEGACY_ATHLETE_ID:
+        return LEGACY_ATHLETE_ID
+    return None
+
+def confirm_revoked(athlete_id: int) -> bool | None:
+    """
+    Ask Strava whether an athlete really revoked access (webhooks are not
+    signed): True when a token refresh is refused, False when it succeeds,
+    None when Strava could not be asked.
+    """
+    c = for_athlete(athlete_id)
+    c.ensure_loaded()
+    try:
+        with backend().lock(f"refresh:{athlete_id}"):
+            c._refresh_now()
+        return False
+    except StravaAuthError as e:
+        return True if e.status in (400, 401) else None
     except Exception as e:
-        print(f"[STRAVA_CLIENT] Warning: Could not save refreshed tokens: {e}")
-
-def _auth_header() -> Dict[str, str]:
-    # If no access token, try to reload from file first
-    if not _tokens["access_token"]:
-        print("[STRAVA_CLIENT] No access token, trying to reload from file...")
-        _load_tokens_from_file()
-    
-    # Still no token? Error
-    if not _tokens["access_token"]:
-        raise StravaAuthError("Missing STRAVA_ACCESS_TOKEN - please authenticate first")
-    
-    # Check if token is expired
-    if _tokens["expires_at"] - int(time.time()) < 60:
-        _refresh()
-    
-    return {"Authorization": f"Bearer {_tokens['access_token']}"}
+        print(f"[STRAVA_CLIENT] could not confirm deauthorization of athlete {athlete_id}: {e!r}")
+        return None
+
+def expire_tokens(athlete_id: int) -> None:
+    """Mark an athlete's access token expired: the next call refreshes it (and finds out if access was revoked)"""
+    from mcp_strava.services.token_store import expire_tokens as expire_stored
+    expire_stored(athlete_id)
+    c = _clients.get(int(athlete_id))
+    if c is not None:
+        c.tokens["expires_at"] = 0
+
+def forget_athlete(athlete_id: int) -> None:
+    """Drop an athlete's tokens and client (deauthorization)"""
+    from mcp_strava.services.token_store import delete_athlete
+    delete_athlete(athlete_id)
+    with _clients_lock:
+        _clients.pop(int(athlete_id), None)
+
+def ensure_tokens_loaded():
+    """Load the default athlete's tokens; used by the startup warm-up"""
+    client().ensure_loaded()
+
+def reload_tokens(athlete_id: int | None = None):
+    """Reload tokens from the store - useful after OAuth callback"""
+    for_athlete(current_athlete_id() if athlete_id is None else int(athlete_id)).reload()
+
+def _track_rate(headers) -> None:
+    """Record Strava's 'limit_15m,limit_day' / 'usage_15m,usage_day' headers"""
+    try:
+        limit = headers.get("X-RateLimit-Limit")
+        usage = headers.get("X-RateLimit-Usage")
+        if limit and usage:
+            l15, lday = (int(x) for x in limit.split(",")[:2])
+            u15, uday = (int(x) for x in usage.split(",")[:2])
+            _rate.update(limit_15m=l15, limit_day=lday, usage_15m=u15, usage_day=uday, updated_at=int(time.time()))
+            if backend().shared:
+                backend().set("rate_limit", "strava", dict(_rate), 86400)
+    except Exception:
+        pass
+
+def rate_budget() -> Dict[str, Any]:
+    """Remaining requests in the current 15-minute and daily windows"""
+    snapshot.restore("rate_limit")
+    if backend().shared:
+        _load_rate(backend().get("rate_limit", "strava") or {})
+    now = datetime.now(timezone.utc)
+    seen = datetime.fromtimestamp(_rate["updated_at"], timezone.utc)
+    quarter = lambda d: (d.date(), d.hour, d.minute // 15)
+    u15 = _rate["usage_15m"] if quarter(seen) == quarter(now) else 0
+    uday = _rate["usage_day"] if seen.date() == now.date() else 0
+    return {
+        "remaining_15m": max(0, _rate["limit_15m"] - u15),
+        "remaining_day": max(0, _rate["limit_day"] - uday),
+        **_rate,
+    }
+
+def _get(path: str, params: Dict[str, Any] | None = None) -> Any:
+    return client().get(path, params)
+
+def _cached(cache: TTLCache, key, fetch):
+    """Fresh cache hit, else fetch; if Strava is unavailable, serve the last cached value (marked stale)"""
+    hit = cache.get(key)
+    if hit is not None:
+        return hit
+    try:
+        value = fetch()
+    except StravaUnavailable:
+        entry = cache.get_entry(key)
+        if entry is None:
+            raise
+        print(f"[STRAVA_CLIENT] Strava unavailable, serving {cache.name} cached at {entry[1]:.0f}")
+        mark_stale(entry[1])
+        return entry[0]
+    cache.set(key, value)
+    return value
+
+def reset_stale() -> None:
+    """Start of a tool call: forget staleness recorded by earlier calls in this context"""
+    _stale_since.set(None)
+
+def mark_stale(as_of: float) -> None:
+    """Data fetched at `as_of` was served in place of Strava (the oldest such time wins)"""
+    since = _stale_since.get()
+    _stale_since.set(as_of if since is None else min(since, as_of))
+
+def stale_as_of() -> str | None:
+    """ISO time of the oldest cached data served in place of Strava during this request"""
+    since = _stale_since.get()
+    return datetime.fromtimestamp(since, timezone.utc).isoformat().replace("+00:00", "Z") if since else None
+
+def annotate_stale(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Add a 'stale_as_of' marker (and a note in 'content') when cached data was served"""
+    as_of = stale_as_of()
+    if as_of:
+        payload["stale_as_of"] = as_of
+        note = f"⚠️ Strava is unavailable or still syncing; showing data cached at {as_of}."
+        payload["content"] = f"{note}\n{payload['content']}" if payload.get("content") else note
+    return payload
+
+def circuit_status() -> Dict[str, Any]:
+    return {**_breaker.stats(), "hedging": _hedger.stats()}
+
+def _get_list(params: Dict[str, Any]) -> List[Dict[str, Any]]:
+    key = (current_athlete_id(), tuple(sorted(params.items())))
+    return _cached(_lists, key, lambda: _get("/athlete/activities", params))
+
+def invalidate_activity(activity_id: int | None = None) -> None:
+    """Forget a cached activity and every cached list/rollup (new, updated or deleted activity)"""
+    if activity_id is not None:
+        _details.pop((current_athlete_id(), int(activity_id)))
+    clear_tag("activity_lists")
 
 def get_athlete() -> Dict[str, Any]:
-    r = requests.get("https://www.strava.com/api/v3/athlete", headers=_auth_header(), timeout=30)
-    if r.status_code == 401:
-        _refresh(); r = requests.get("https://www.strava.com/api/v3/athlete", headers=_auth_header(), timeout=30)
-    r.raise_for_status()
-    return r.json()
+    return _get("/athlete")
 
 def get_recent_activities(per_page: int = 5) -> List[Dict[str, Any]]:
-    r = requests.get("https://www.strava.com/api/v3/athlete/activities",
-                     headers=_auth_header(),
-                     params={"per_page": max(1, min(per_page, 100))},
-                     timeout=30)
-    if r.status_code == 401:
-        _refresh(); r = requests.get("https://www.strava.com/api/v3/athlete/activities",
-                                     headers=_auth_header(),
-                                     params={"per_page": per_page}, timeout=30)
-    r.raise_for_status()
-    return r.json()
-
-def get_activities_list(limit: int = 30, after: int = None, before: int = None) -> List[Dict[str, Any]]:
+    return _get_list({"per_page": max(1, min(per_page, 100))})
+
+def get_activities_list(limit: int = 30, after: int = None, before: int = None, page: int = 1) -> List[Dict[str, Any]]:
     """
     Get activities with optional date filtering
-    
+
     Args:
         limit: Number of activities to return (max 200)
         after: Unix timestamp - return activities after this date
         before: Unix timestamp - return activities before this date
+        page: Strava page number (pages of `limit` activities)
     """
     params = {"per_page": max(1, min(limit, 200))}
-    
+    if page > 1:
+        params["page"] = page
+
     if after is not None:
         params["after"] = after
     if before is not None:
         params["before"] = before
-    
-    r = requests.get("https://www.strava.com/api/v3/athlete/activities",
-                     headers=_auth_header(),
-                     params=params,
-                     timeout=30)
-    if r.status_code == 401:
-        _refresh()
-        r = requests.get("https://www.strava.com/api/v3/athlete/activities",
-                         headers=_auth_header(),
-                         params=params, 
-                         timeout=30)
-    r.raise_for_status()
-    return r.json()
+
+    return _get_list(params)
+
+def iter_activities(before: int | None = None, skip_ids: Iterable[int] = (), per_page: int = 200) -> Iterator[List[Dict[str, Any]]]:
+    """
+    Yield the athlete's activities page by page, newest first, uncached.
+
+    Pages slide on the `before` timestamp (not page numbers) so the walk stays
+    stable while new activities arrive; skip_ids are activities already seen
+    in the second just below `before`.
+    """
+    skip = set(skip_ids)
+    while True:
+        params = {"per_page": per_page, "page": 1}
+        if before is not None:
+            params["before"] = before
+        page = _get("/athlete/activities", params)
+        fresh = [a for a in page if a.get("id") not in skip]
+        if not fresh:
+            return
+        yield fresh
+        oldest = min(start_epoch(a) for a in fresh)
+        if before is None or oldest != before - 1:
+            skip = set()
+        skip |= {a["id"] for a in page if start_epoch(a) == oldest}
+        before = oldest + 1  # 'before' is exclusive: re-read the boundary second, minus what was seen
+        if len(page) < per_page:
+            return
+
+def start_epoch(a: Dict[str, Any]) -> int:
+    """Activity start as a UTC epoch (0 when missing)"""
+    iso = a.get("start_date")
+    if not iso:
+        return 0
+    return int(datetime.fromisoformat(iso.replace("Z", "+00:00")).timestamp())
+
+def cached_activity(activity_id: int) -> Dict[str, Any] | None:
+    """Activity detail if it is cached (fresh), without calling Strava"""
+    return _details.get((current_athlete_id(), int(activity_id)))
 
 def get_activity(activity_id: int) -> Dict[str, Any]:
-    r = requests.get(f"https://www.strava.com/api/v3/activities/{activity_id}",
-                     headers=_auth_header(),
-                     params={"include_all_efforts": "false"},
-                     timeout=30)
-    if r.status_code == 401:
-        _refresh(); r = requests.get(f"https://www.strava.com/api/v3/activities/{activity_id}",
-                                     headers=_auth_header(),
-                                     params={"include_all_efforts": "false"},
-                                     timeout=30)
-    r.raise_for_status()
-    return r.json()
+    key = (current_athlete_id(), int(activity_id))
+    return _cached(_details, key, lambda: _get(f"/activities/{activity_id}", {"include_all_efforts": "true"}))
+
+def _load_rate(d: Dict[str, Any]) -> None:
+    if d.get("updated_at", 0) > _rate["updated_at"]:
+        _rate.update(d)
+
+# token state is small and never evicted (one client per signed-in athlete); sized per entry,
+# since enforce() asks on every cache insert
+CLIENT_BYTES = 1200  # AthleteClient + its token dict (approx_size of a typical one, + object overhead)
+memory.register("athlete_clients", lambda: CLIENT_BYTES * len(_clients), stats=lambda: {"entries": len(_clients)})
+snapshot.register("rate_limit", lambda: dict(_rate), _load_rate)
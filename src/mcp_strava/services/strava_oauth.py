@@ -1,7 +1,8 @@
 import time
 import urllib.parse
 import requests
-from mcp_strava.settings import STRAVA_CLIENT_ID, STRAVA_CLIENT_SECRET, STRAVA_REDIRECT_URI
+import httpx
+from mcp_strava.settings import STRAVA_CLIENT_ID, STRAVA_CLIENT_SECRET, STRAVA_REDIRECT_URI, STRAVA_OAUTH_URL
 
 CLIENT_ID     = STRAVA_CLIENT_ID
 CLIENT_SECRET = STRAVA_CLIENT_SECRET
@@ -22,24 +23,33 @@ def authorize_url(state: str = "ok") -> str:
         "scope": SCOPES,
         "state": state,
     }
-    return "https://www.strava.com/oauth/authorize?" + urllib.parse.urlencode(params)
+    return f"{STRAVA_OAUTH_URL}/authorize?" + urllib.parse.urlencode(params)
+
+def _code_form(code: str) -> dict:
+    return {
+        "client_id": CLIENT_ID,
+        "client_secret": CLIENT_SECRET,
+        "code": code,
+        "grant_type": "authorization_code",
+    }
 
 def exchange_code(code: str) -> dict:
-    data = _post_form(
-        "https://www.strava.com/oauth/token",
-        {
-            "client_id": CLIENT_ID,
-            "client_secret": CLIENT_SECRET,
-            "code": code,
-            "grant_type": "authorization_code",
-        },
-    )
+    data = _post_form(f"{STRAVA_OAUTH_URL}/token", _code_form(code))
+    data["created_at"] = int(time.time())
+    return data
+
+async def exchange_code_async(code: str, timeout: int = 10) -> dict:
+    """exchange_code for async routes: awaits Strava instead of blocking the event loop"""
+    async with httpx.AsyncClient(timeout=timeout) as client:
+        r = await client.post(f"{STRAVA_OAUTH_URL}/token", data=_code_form(code))
+        r.raise_for_status()
+        data = r.json()
     data["created_at"] = int(time.time())
     return data
 
 def refresh_token(refresh_token_value: str) -> dict:
     data = _post_form(
-        "https://www.strava.com/oauth/token",
+        f"{STRAVA_OAUTH_URL}/token",
         {
             "client_id": CLIENT_ID,
             "client_secret": CLIENT_SECRET,
@@ -1,30 +1,37 @@
 """Strava webhook handlers"""
+import asyncio
+import json
 import os
 import time
-from typing import Dict
-from fastapi import Request
-from fastapi.responses import JSONResponse
+from typing import Any, Dict, Tuple
+from starlette.requests import Request
+from starlette.responses import JSONResponse
 
 from mcp_strava.tools.analyze import analyze_activity
 from mcp_strava.services.poke import send_poke
-from mcp_strava.settings import STRAVA_VERIFY_TOKEN
+from mcp_strava.services.strava_client import (
+    invalidate_activity, resolve_owner, as_athlete, forget_athlete, get_activity, confirm_revoked, expire_tokens,
+)
+from mcp_strava.services import activity_store, admission, db, duplicates
+from mcp_strava.services.shared_state import backend
+from mcp_strava.settings import STRAVA_VERIFY_TOKEN, WEBHOOK_OVERLOAD
 
-# Deduplication cache
-_seen: Dict[str, float] = {}
+# Every accepted event is journaled here and acknowledged at once; drain_journal() processes it
+db.register_schema("""
+CREATE TABLE IF NOT EXISTS webhook_journal (
+    id          INTEGER PRIMARY KEY AUTOINCREMENT,
+    athlete_id  INTEGER NOT NULL,
+    event       TEXT NOT NULL,
+    received_at INTEGER NOT NULL
+);
+""")
+
+_journal_counts = {"journaled": 0, "drained": 0}
+_wake: asyncio.Event | None = None  # set by the webhook route so the drainer starts at once
 
 def _dedupe(key: str, ttl: int = 60) -> bool:
-    """Deduplicate webhook events based on key and TTL"""
-    now = time.time()
-    # Clean expired entries
-    for k, t0 in list(_seen.items()):
-        if now - t0 > ttl:
-            _seen.pop(k, None)
-    
-    if key in _seen:
-        return False
-    
-    _seen[key] = now
-    return True
+    """Deduplicate webhook events based on key and TTL (across workers with the sqlite backend)"""
+    return backend().claim(f"webhook:{key}", ttl)
 
 async def verify_webhook(request: Request):
     q = request.query_params
@@ -41,14 +48,37 @@ async def verify_webhook(request: Request):
 
 
 
-async def handle_webhook_event(request: Request):
-    """Handle Strava webhook events"""
-    try:
-        evt = await request.json()
-    except Exception:
-        evt = {}
-    
-    print("[WEBHOOK] raw event:", evt)
+def _deauthorize(evt: Dict, athlete_id: int) -> None:
+    """
+    Forget an athlete only once Strava confirms the revocation: anyone can POST
+    to the webhook URL. Unknown owners are never mapped to the legacy athlete here.
+    """
+    if resolve_owner(evt.get("owner_id"), exact=True) != athlete_id:
+        print(f"[WEBHOOK] deauthorization ignored: owner_id {evt.get('owner_id')} is not a registered athlete")
+        return
+    revoked = confirm_revoked(athlete_id)
+    if revoked:
+        print(f"[WEBHOOK] athlete {athlete_id} deauthorized (confirmed by Strava)")
+        forget_athlete(athlete_id)
+        activity_store.forget(athlete_id)
+    elif revoked is None:
+        print(f"[WEBHOOK] athlete {athlete_id} deauthorization unconfirmed: tokens marked expired, data kept")
+        expire_tokens(athlete_id)
+    else:
+        print(f"[WEBHOOK] deauthorization ignored: Strava still authorizes athlete {athlete_id}")
+
+def _process_event(evt: Dict, athlete_id: int) -> None:
+    """Handle one event on behalf of its owner (Strava calls are routed to that athlete)"""
+    if evt.get("object_type") == "athlete" and (evt.get("updates") or {}).get("authorized") == "false":
+        _deauthorize(evt, athlete_id)
+        return
+
+    if evt.get("object_type") == "activity" and evt.get("aspect_type") == "delete":
+        try:
+            invalidate_activity(int(evt.get("object_id")))
+            activity_store.delete(int(evt.get("object_id")))
+        except Exception as e:
+            print("[WEBHOOK] bad object_id:", evt.get("object_id"), e)
 
     if evt.get("object_type") == "activity" and evt.get("aspect_type") in {"create", "update"}:
         try:
@@ -58,6 +88,7 @@ async def handle_webhook_event(request: Request):
             act_id = None
 
         if act_id is not None and _dedupe(f"{evt.get('aspect_type')}:{act_id}"):
+            invalidate_activity(act_id)
             print(f"[WEBHOOK] analyzing activity {act_id}")
             try:
                 res = analyze_activity(activity_id=act_id) 
@@ -66,13 +97,116 @@ async def handle_webhook_event(request: Request):
                 print("[WEBHOOK] analyze error:", repr(e))
                 res = {}
 
+            primary = None
+            try:
+                activity_store.upsert(athlete_id, [get_activity(act_id)])  # detail is cached by the analysis
+                primary = duplicates.primary_of(act_id)
+            except Exception as e:
+                print("[WEBHOOK] index error:", repr(e))
+            if primary:
+                print(f"[WEBHOOK] activity {act_id} duplicates {primary}")
+
             if res.get("content"):
                 # Include both content and prompt for better Poke responses
                 message = res["content"]
+                if primary:
+                    message += f"\n(Looks like a second recording of activity {primary}: it is not counted twice in totals.)"
                 if res.get("poke_prompt"):
                     message = f"{res['poke_prompt']}. Here's the data: {message}"
-                send_poke(message)
+                send_poke(message, athlete_id)
             else:
                 print("[POKE] skipped: no content")
 
+
+def _run_event(evt: Dict, athlete_id: int) -> None:
+    with as_athlete(athlete_id):
+        _process_event(evt, athlete_id)
+
+# ========= Journal =========
+def _journal(evt: Dict, athlete_id: int) -> None:
+    db.connect().execute(
+        "INSERT INTO webhook_journal (athlete_id, event, received_at) VALUES (?, ?, ?)",
+        (athlete_id, json.dumps(evt), int(time.time())),
+    )
+    _journal_counts["journaled"] += 1
+
+def _pop_journal() -> Tuple[Dict, int] | None:
+    """Oldest journaled event, removed in the same transaction (one taker across workers)"""
+    with db.transaction() as conn:
+        row = conn.execute("SELECT id, athlete_id, event FROM webhook_journal ORDER BY id LIMIT 1").fetchone()
+        if row is None:
+            return None
+        conn.execute("DELETE FROM webhook_journal WHERE id = ?", (row["id"],))
+    return json.loads(row["event"]), row["athlete_id"]
+
+def _backlog() -> int:
+    return db.connect().execute("SELECT COUNT(*) FROM webhook_journal").fetchone()[0]
+
+def journal_stats() -> Dict[str, Any]:
+    return {"backlog": _backlog(), **_journal_counts}
+
+async def _run_journaled(gate: admission.Gate, evt: Dict, athlete_id: int) -> None:
+    """Process one event on its (already held) gate slot, then free the slot"""
+    t0 = time.perf_counter()
+    try:
+        await asyncio.to_thread(_run_event, evt, athlete_id)
+    except Exception as e:
+        print(f"[WEBHOOK] journaled event failed: {e!r}")
+    finally:
+        gate.release(time.perf_counter() - t0)
+        _journal_counts["drained"] += 1
+        _wake.set()  # a slot is free: take the next event
+
+async def drain_journal(interval: float = 2.0) -> None:
+    """Worker: process journaled events, as many at once as the webhook gate admits"""
+    global _wake
+    _wake = asyncio.Event()
+    gate = admission.gate("webhook")
+    running = set()
+    while True:
+        try:
+            await asyncio.wait_for(_wake.wait(), interval)
+        except asyncio.TimeoutError:
+            pass  # other workers may have journaled events too
+        _wake.clear()
+        while gate.free() > 0:
+            try:
+                # hold the slot before taking the event, so a full gate can never drop it
+                await gate.acquire()
+            except admission.Overloaded:
+                break
+            try:
+                entry = await asyncio.to_thread(_pop_journal)
+            except Exception as e:
+                gate.release()
+                print(f"[WEBHOOK] journal drain error: {e!r}")
+                break
+            if entry is None:
+                gate.release()
+                break
+            task = asyncio.create_task(_run_journaled(gate, *entry))
+            running.add(task)
+            task.add_done_callback(running.discard)
+
+async def handle_webhook_event(request: Request):
+    """Handle Strava webhook events: journal, acknowledge, process in drain_journal()"""
+    try:
+        evt = await request.json()
+    except Exception:
+        evt = {}
+    
+    print("[WEBHOOK] raw event:", evt)
+
+    athlete_id = resolve_owner(evt.get("owner_id"))
+    if athlete_id is None:
+        print(f"[WEBHOOK] skipped: unknown owner_id {evt.get('owner_id')}")
+        return JSONResponse({"ok": True}, status_code=200)
+
+    gate = admission.gate("webhook")
+    if WEBHOOK_OVERLOAD == "reject" and gate.free() == 0 and await asyncio.to_thread(_backlog) >= gate.queue:
+        return JSONResponse({"error": "overloaded"}, status_code=503, headers={"Retry-After": str(gate.retry_after())})
+
+    await asyncio.to_thread(_journal, evt, athlete_id)
+    if _wake is not None:
+        _wake.set()
     return JSONResponse({"ok": True}, status_code=200)
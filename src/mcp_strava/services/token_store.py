@@ -1,20 +1,176 @@
-import json, os, time
-from mcp_strava.settings import TOK_FILE
-
-def save_tokens(data: dict):
-    """Save tokens to file"""
-    data["_saved_at"] = int(time.time())
-    with open(TOK_FILE, "w") as f:
-        json.dump(data, f)
-    print("[TOKENS] saved to", TOK_FILE)
-
-def load_tokens() -> dict | None:
-    """Load tokens from file"""
-    if not os.path.exists(TOK_FILE):
+"""
+Per-athlete token storage (SQLite, keyed by Strava athlete id).
+
+Athlete id 0 is the legacy single-user slot: tokens from env vars or an old
+tokens.json that carry no athlete. tokens.json (TOKEN_FILE) is imported once
+into the database and no longer written.
+"""
+import json, os, time, threading
+from mcp_strava.settings import TOK_FILE, STRAVA_ATHLETE_ID, ALLOWED_ATHLETES
+from mcp_strava.services import db
+
+LEGACY_ATHLETE_ID = 0
+ALLOWED_IDS = [int(x) for x in ALLOWED_ATHLETES.replace(" ", "").split(",") if x]
+
+db.register_schema("""
+CREATE TABLE IF NOT EXISTS athletes (
+    athlete_id    INTEGER PRIMARY KEY,
+    firstname     TEXT,
+    lastname      TEXT,
+    access_token  TEXT,
+    refresh_token TEXT,
+    expires_at    INTEGER,
+    scope         TEXT,
+    created_at    INTEGER,
+    updated_at    INTEGER
+);
+CREATE INDEX IF NOT EXISTS athletes_updated ON athletes(updated_at);
+""")
+
+_migrated = False
+_migrate_lock = threading.Lock()
+_default_id: int | None = None
+
+def _migrate_json() -> None:
+    """Import a pre-existing tokens.json once"""
+    global _migrated
+    if _migrated:
+        return
+    with _migrate_lock:
+        if _migrated:
+            return
+        _migrated = True
+        if not TOK_FILE or not os.path.exists(TOK_FILE):
+            return
+        if db.connect().execute("SELECT 1 FROM athletes LIMIT 1").fetchone():
+            return
+        try:
+            with open(TOK_FILE) as f:
+                data = json.load(f)
+            save_tokens(data)
+            print("[TOKENS] imported", TOK_FILE)
+        except Exception as e:
+            print(f"[TOKENS] could not import {TOK_FILE}: {e}")
+
+def _athlete_id(data: dict, athlete_id: int | None) -> int:
+    if athlete_id is not None:
+        return int(athlete_id)
+    a = data.get("athlete") or {}
+    if a.get("id"):
+        return int(a["id"])
+    return default_athlete_id()
+
+def save_tokens(data: dict, athlete_id: int | None = None) -> int:
+    """Save (or register) an athlete's tokens; returns the athlete id"""
+    global _default_id
+    aid = _athlete_id(data, athlete_id)
+    a = data.get("athlete") or {}
+    now = int(time.time())
+    db.connect().execute(
+        """
+        INSERT INTO athletes (athlete_id, firstname, lastname, access_token, refresh_token, expires_at, scope, created_at, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(athlete_id) DO UPDATE SET
+            firstname     = COALESCE(excluded.firstname, athletes.firstname),
+            lastname      = COALESCE(excluded.lastname, athletes.lastname),
+            access_token  = excluded.access_token,
+            refresh_token = COALESCE(excluded.refresh_token, athletes.refresh_token),
+            expires_at    = excluded.expires_at,
+            scope         = COALESCE(excluded.scope, athletes.scope),
+            updated_at    = excluded.updated_at
+        """,
+        (aid, a.get("firstname"), a.get("lastname"), data.get("access_token"), data.get("refresh_token"),
+         int(data.get("expires_at") or 0), data.get("scope"), now, now),
+    )
+    if a.get("id"):
+        _default_id = None  # a first sign-in sets the default athlete
+    print(f"[TOKENS] saved for athlete {aid}")
+    return aid
+
+def load_tokens(athlete_id: int | None = None) -> dict | None:
+    """Load an athlete's tokens (default athlete when omitted)"""
+    _migrate_json()
+    aid = default_athlete_id() if athlete_id is None else int(athlete_id)
+    row = db.connect().execute("SELECT * FROM athletes WHERE athlete_id = ?", (aid,)).fetchone()
+    if row is None or not row["access_token"]:
         return None
-    with open(TOK_FILE) as f:
-        return json.load(f)
+    return {
+        "athlete_id": row["athlete_id"],
+        "access_token": row["access_token"],
+        "refresh_token": row["refresh_token"],
+        "expires_at": row["expires_at"],
+        "scope": row["scope"],
+        "athlete": {"id": row["athlete_id"], "firstname": row["firstname"], "lastname": row["lastname"]},
+        "_saved_at": row["updated_at"],
+    }
 
-def get_tokens() -> dict | None:
+def get_tokens(athlete_id: int | None = None) -> dict | None:
     """Alias for load_tokens for compatibility"""
-    return load_tokens()
+    return load_tokens(athlete_id)
+
+def delete_athlete(athlete_id: int) -> None:
+    """Forget an athlete (deauthorization)"""
+    global _default_id
+    db.connect().execute("DELETE FROM athletes WHERE athlete_id = ?", (int(athlete_id),))
+    _default_id = None
+    print(f"[TOKENS] deleted athlete {athlete_id}")
+
+def expire_tokens(athlete_id: int) -> None:
+    """Force a refresh on next use, keeping the refresh token"""
+    db.connect().execute("UPDATE athletes SET expires_at = 0 WHERE athlete_id = ?", (int(athlete_id),))
+
+def is_registered(athlete_id: int) -> bool:
+    _migrate_json()
+    return db.connect().execute("SELECT 1 FROM athletes WHERE athlete_id = ?", (int(athlete_id),)).fetchone() is not None
+
+def list_athletes() -> list[dict]:
+    _migrate_json()
+    rows = db.connect().execute("SELECT athlete_id, firstname, lastname, updated_at FROM athletes ORDER BY athlete_id").fetchall()
+    return [dict(r) for r in rows]
+
+def _owner() -> int | None:
+    """The first athlete who signed in (servers without an allow-list belong to them)"""
+    row = db.connect().execute(
+        "SELECT athlete_id FROM athletes WHERE athlete_id != ? ORDER BY created_at, athlete_id LIMIT 1",
+        (LEGACY_ATHLETE_ID,),
+    ).fetchone()
+    return row["athlete_id"] if row else None
+
+def default_athlete_id() -> int:
+    """
+    Athlete used when a request carries none: STRAVA_ATHLETE_ID, else the first
+    registered athlete of ALLOWED_ATHLETES, else the owner, else the legacy slot.
+    Never a later sign-in.
+    """
+    global _default_id
+    if STRAVA_ATHLETE_ID:
+        return int(STRAVA_ATHLETE_ID)
+    if _default_id is None:
+        _migrate_json()
+        aid = next((a for a in ALLOWED_IDS if is_registered(a)), None) if ALLOWED_IDS else _owner()
+        _default_id = LEGACY_ATHLETE_ID if aid is None else aid
+    return _default_id
+
+def may_register(athlete_id: int) -> bool:
+    """Can this athlete sign in? ALLOWED_ATHLETES, else STRAVA_ATHLETE_ID, else the owner only (first sign-in wins)"""
+    aid = int(athlete_id)
+    if ALLOWED_IDS:
+        return aid in ALLOWED_IDS
+    if STRAVA_ATHLETE_ID:
+        return aid == int(STRAVA_ATHLETE_ID)
+    _migrate_json()
+    owner = _owner()
+    return owner is None or owner == aid
+
+def may_notify(athlete_id: int) -> bool:
+    """
+    Can messages about this athlete go to the operator's Poke (POKE_API_KEY)?
+    Same rule as may_register, which also covers athletes registered by older
+    releases that let anyone sign in.
+    """
+    aid = int(athlete_id)
+    if aid == LEGACY_ATHLETE_ID:
+        return True  # tokens from the operator's own env/tokens.json
+    if ALLOWED_IDS:
+        return aid in ALLOWED_IDS
+    return aid == default_athlete_id()
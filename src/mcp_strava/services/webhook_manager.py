@@ -1,10 +1,44 @@
 """Strava webhook subscription management"""
+import asyncio
+import threading
+import time
 import requests
 import httpx
-from typing import Dict, List
-from mcp_strava.settings import STRAVA_CLIENT_ID, STRAVA_CLIENT_SECRET, STRAVA_VERIFY_TOKEN, PUBLIC_URL
+from typing import Any, Dict, List
+from mcp_strava.settings import (
+    STRAVA_CLIENT_ID, STRAVA_CLIENT_SECRET, STRAVA_VERIFY_TOKEN, PUBLIC_URL, STRAVA_API_URL,
+    WEBHOOK_STATUS_INTERVAL,
+)
 
 from typing import Optional
+from mcp_strava.services import lifecycle
+
+# ========= Cached subscription status =========
+# Strava allows one subscription per app, so its state changes only through the
+# functions below; readers get this view instead of asking Strava every time.
+_status: Dict[str, Any] = {"checked_at": None, "subscriptions": []}
+_status_lock = threading.Lock()
+
+def _remember(subscriptions: List[Dict]) -> None:
+    with _status_lock:
+        _status["subscriptions"] = list(subscriptions)
+        _status["checked_at"] = int(time.time())
+
+def subscription_status() -> Dict[str, Any]:
+    """Last known subscription state; active is None until the first check completes"""
+    with _status_lock:
+        subs = list(_status["subscriptions"])
+        checked = _status["checked_at"]
+    return {"active": bool(subs) if checked else None, "subscriptions": subs, "checked_at": checked}
+
+async def refresh_subscription_status() -> Dict[str, Any]:
+    await asyncio.to_thread(list_webhook_subscriptions)
+    return subscription_status()
+
+async def refresh_periodically() -> None:
+    while True:
+        await refresh_subscription_status()
+        await asyncio.sleep(WEBHOOK_STATUS_INTERVAL)
 
 async def create_webhook_subscription_async(callback_override: Optional[str] = None) -> Dict:
     callback_url = (callback_override or f"{PUBLIC_URL}/strava/webhook").rstrip("/")
@@ -31,12 +65,15 @@ async def create_webhook_subscription_async(callback_override: Optional[str] = N
             }
 
             # This await keeps the loop free so your GET /strava/webhook can be answered
-            resp = await client.post("https://www.strava.com/api/v3/push_subscriptions", data=data)
+            resp = await client.post(f"{STRAVA_API_URL}/push_subscriptions", data=data)
             print(f"[WEBHOOK] Create response: {resp.status_code} - {resp.text[:200]}")
 
             if resp.status_code == 201:
-                return {"status": "success", "subscription": resp.json(), "content": f"✅ Subscription OK → {callback_url}"}
+                sub = resp.json()
+                _remember(subscription_status()["subscriptions"] + [sub])
+                return {"status": "success", "subscription": sub, "content": f"✅ Subscription OK → {callback_url}"}
             if resp.status_code == 409:
+                lifecycle.spawn(refresh_subscription_status(), name="webhook_status")  # exists, but we may not know its id yet
                 return {"status": "already_exists", "content": "⚠️ Subscription already exists."}
             return {"status": "error", "error": resp.text, "content": f"❌ {resp.status_code} - {resp.text}"}
 
@@ -54,7 +91,7 @@ def list_webhook_subscriptions() -> Dict:
     
     try:
         response = requests.get(
-            "https://www.strava.com/api/v3/push_subscriptions",
+            f"{STRAVA_API_URL}/push_subscriptions",
             params=params,
             timeout=30
         )
@@ -63,6 +100,7 @@ def list_webhook_subscriptions() -> Dict:
         
         if response.status_code == 200:
             subscriptions = response.json()
+            _remember(subscriptions)
             
             if not subscriptions:
                 return {
@@ -106,7 +144,7 @@ def delete_webhook_subscription(subscription_id: int) -> Dict:
     
     try:
         response = requests.delete(
-            f"https://www.strava.com/api/v3/push_subscriptions/{subscription_id}",
+            f"{STRAVA_API_URL}/push_subscriptions/{subscription_id}",
             params=params,
             timeout=30
         )
@@ -114,6 +152,7 @@ def delete_webhook_subscription(subscription_id: int) -> Dict:
         print(f"[WEBHOOK] Delete response: {response.status_code} - {response.text}")
         
         if response.status_code == 204:
+            _remember([s for s in subscription_status()["subscriptions"] if s.get("id") != subscription_id])
             return {
                 "status": "success",
                 "content": f"✅ Webhook subscription {subscription_id} deleted successfully."
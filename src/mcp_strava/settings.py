@@ -1,8 +1,9 @@
 import os, pathlib
-from dotenv import load_dotenv
 
 ROOT = pathlib.Path(__file__).resolve().parents[2]
-load_dotenv(ROOT / ".env")
+if (ROOT / ".env").exists():  # skip importing python-dotenv when there is nothing to load (Render sets real env vars)
+    from dotenv import load_dotenv
+    load_dotenv(ROOT / ".env")
 
 def env(name: str, default: str | None = None, required: bool = False) -> str | None:
     val = os.environ.get(name, default)
@@ -22,13 +23,65 @@ STRAVA_REFRESH_TOKEN = env("STRAVA_REFRESH_TOKEN")
 STRAVA_EXPIRES_AT    = int(env("STRAVA_EXPIRES_AT", str(0)) or "0")
 STRAVA_VERIFY_TOKEN = env("STRAVA_VERIFY_TOKEN", "prod-verify")
 STRAVA_REDIRECT_URI = env("STRAVA_REDIRECT_URI", "http://localhost/exchange")
+STRAVA_API_URL   = env("STRAVA_API_URL", "https://www.strava.com/api/v3").rstrip("/")
+STRAVA_OAUTH_URL = env("STRAVA_OAUTH_URL", "https://www.strava.com/oauth").rstrip("/")
 
-TOK_FILE = env("TOKEN_FILE", "tokens.json")
+TOK_FILE = env("TOKEN_FILE", "tokens.json")   # legacy single-user file, imported once into DB_FILE
+DB_FILE  = env("DB_FILE", "strava.db")         # SQLite: per-athlete tokens and other persistent state
+STRAVA_ATHLETE_ID = env("STRAVA_ATHLETE_ID")   # athlete served by MCP tools (default: the first allowed athlete)
+# Strava athlete ids allowed to sign in and get Poke messages (comma-separated). Empty: STRAVA_ATHLETE_ID if set,
+# otherwise only the first athlete who signs in (the server's owner)
+ALLOWED_ATHLETES = env("ALLOWED_ATHLETES", "")
 PUBLIC_URL = env("PUBLIC_URL", "https://fastmcp-server-a9wl.onrender.com")
+EXPORT_LINK_TTL = int(env("EXPORT_LINK_TTL", "86400"))  # validity (s) of signed /export/activities links
+WEBHOOK_STATUS_INTERVAL = int(env("WEBHOOK_STATUS_INTERVAL", "3600"))  # s between checks of the Strava subscription
 
 # Poke inbound (optional, to push a message)
 POKE_API_KEY    = env("POKE_API_KEY")
 POKE_INBOUND_URL= env("POKE_INBOUND_URL", "https://poke.com/api/v1/inbound-sms/webhook")
 
+# Scheduled digests pushed to Poke (per athlete, changeable with the set_digest_schedule tool).
+# DIGESTS: kinds on by default ("weekly", "monthly", "weekly,monthly"; "" = opt-in per athlete); local weekday (0 = Monday)
+# and hour; each athlete's send time is offset by a fixed amount in [0, DIGEST_JITTER) seconds
+DIGESTS        = env("DIGESTS", "")
+DIGEST_WEEKDAY = int(env("DIGEST_WEEKDAY", "0"))
+DIGEST_HOUR    = int(env("DIGEST_HOUR", "8"))
+DIGEST_JITTER  = int(env("DIGEST_JITTER", "3600"))
+
+# Strava resilience: request timeout (s), circuit breaker, hedged GETs (percentile, 0 = off)
+STRAVA_TIMEOUT   = float(env("STRAVA_TIMEOUT", "10"))
+BREAKER_FAILURES = int(env("BREAKER_FAILURES", "5"))
+BREAKER_RECOVERY = float(env("BREAKER_RECOVERY", "30"))
+BREAKER_PROBES   = int(env("BREAKER_PROBES", "1"))
+HEDGE_PERCENTILE = float(env("HEDGE_PERCENTILE", "0"))
+BATCH_CONCURRENCY = int(env("BATCH_CONCURRENCY", "8"))  # parallel detail fetches per batch analysis
+
+# Caches and warm-start snapshot (SNAPSHOT_FILE="" disables it)
+ACTIVITY_CACHE_TTL = int(env("ACTIVITY_CACHE_TTL", "21600"))
+LIST_CACHE_TTL     = int(env("LIST_CACHE_TTL", "60"))
+SNAPSHOT_FILE      = env("SNAPSHOT_FILE", "snapshot.bin")
+SNAPSHOT_INTERVAL  = int(env("SNAPSHOT_INTERVAL", "300"))
+MEMORY_BUDGET_MB   = float(env("MEMORY_BUDGET_MB", "128"))  # all in-process caches together (0 = no global cap)
+CACHE_MEMORY_CAPS  = env("CACHE_MEMORY_CAPS", "")  # per-cache caps in MB, e.g. "activities=64,rollups=4"
+INDEX_SYNC_INTERVAL = int(env("INDEX_SYNC_INTERVAL", "900"))  # s between background syncs of the activity index
+SYNC_LOCK_WAIT      = float(env("SYNC_LOCK_WAIT", "2"))  # s a tool call waits for a sync already running before answering stale
+SEGMENT_BACKFILL_BATCH = int(env("SEGMENT_BACKFILL_BATCH", "40"))  # older activities read for segment efforts per sync (0 = off)
+
+# Admission control (per worker): concurrent requests, waiting room, max wait (s) before shedding.
+# Shed MCP requests get MCP_OVERLOAD_STATUS (429 or 503) + Retry-After. Webhooks are journaled, acked
+# and processed by a worker under the webhook gate; with WEBHOOK_OVERLOAD=reject, a backlog past
+# WEBHOOK_MAX_QUEUE while the gate is full is refused with 503 so Strava retries
+MCP_MAX_CONCURRENCY     = int(env("MCP_MAX_CONCURRENCY", "8"))
+MCP_MAX_QUEUE           = int(env("MCP_MAX_QUEUE", "32"))
+MCP_OVERLOAD_STATUS     = int(env("MCP_OVERLOAD_STATUS", "429"))
+WEBHOOK_MAX_CONCURRENCY = int(env("WEBHOOK_MAX_CONCURRENCY", "4"))
+WEBHOOK_MAX_QUEUE       = int(env("WEBHOOK_MAX_QUEUE", "8"))
+WEBHOOK_OVERLOAD        = env("WEBHOOK_OVERLOAD", "journal")
+ADMISSION_MAX_WAIT      = float(env("ADMISSION_MAX_WAIT", "2"))
+
+# Multi-worker deployment: STATE_BACKEND=sqlite shares dedupe/tokens/budget/caches through DB_FILE
+STATE_BACKEND = env("STATE_BACKEND", "memory")
+WORKERS       = int(env("WEB_CONCURRENCY", "1"))
+
 HOST = env("HOST", "0.0.0.0")
 PORT = int(env("PORT", "8000"))
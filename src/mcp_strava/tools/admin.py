@@ -0,0 +1,24 @@
+"""Operator views of the running server"""
+from typing import Any, Dict
+from mcp_strava.services import memory
+
+def _mb(n: int | None) -> str:
+    return "-" if n is None else f"{n / 1024 / 1024:.1f} MB"
+
+def memory_usage(trim: bool = False) -> Dict[str, Any]:
+    freed = memory.trim() if trim else None
+    r = memory.report()
+    top = sorted(r["accounts"].items(), key=lambda kv: -kv[1]["bytes"])
+    lines = [f"Caches use ~{_mb(r['used_bytes'])} of a {_mb(r['budget_bytes']) if r['budget_bytes'] else 'unlimited'} budget"
+             + (f" • process RSS {_mb(r['rss_bytes'])}" if r["rss_bytes"] else "")]
+    for name, a in top[:6]:
+        lines.append(f"• {name}: {_mb(a['bytes'])}" + (f", {a['entries']} entries" if a.get("entries") is not None else ""))
+    if freed is not None:
+        lines.append(f"Trimmed expired entries: {_mb(freed)} freed")
+    return {
+        "status": "ok",
+        **r,
+        "trimmed_bytes": freed,
+        "content": "\n".join(lines),
+        "poke_prompt": "operator asked for server memory usage. report the totals and the biggest caches plainly, no fluff.",
+    }
@@ -1,4 +1,4 @@
-from mcp_strava.services.strava_client import get_activity
+from mcp_strava.services.strava_client import get_activity, reset_stale, annotate_stale
 from mcp_strava.services.metrics import normalize
 
 def analyze_activity(activity_id: int) -> dict:
@@ -6,6 +6,7 @@ def analyze_activity(activity_id: int) -> dict:
     Fetch one Strava activity, normalize metrics, and build a short human message.
     Returns machine-friendly fields + 'content' for direct display in Poke.
     """
+    reset_stale()
     a = get_activity(activity_id)
     act = normalize(a)
 
@@ -48,4 +49,4 @@ def analyze_activity(activity_id: int) -> dict:
         "content": content,
         "poke_prompt": "user just uploaded a new activity to strava. respond in casual poke style - brief and encouraging about their workout. be supportive but not overly formal. highlight something interesting about the performance."
     }
-    return payload
+    return annotate_stale(payload)
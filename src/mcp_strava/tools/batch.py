@@ -0,0 +1,134 @@
+"""Analyze several activities in one call and compare them"""
+import asyncio
+from typing import Any, Dict, List, Optional
+
+from mcp_strava.services import activity_store
+from mcp_strava.services.strava_client import current_athlete_id, cached_activity, rate_budget, reset_stale, stale_as_of
+from mcp_strava.services.metrics import sport_family
+from mcp_strava.services.paging import query_sig, page_size, project, keyset_page, page_info
+from mcp_strava.settings import BATCH_CONCURRENCY, LIST_CACHE_TTL
+from mcp_strava.tools.analyze import analyze_activity
+from mcp_strava.tools.date_activities import parse_date
+
+MAX_BATCH = 50
+BUDGET_RESERVE = 20  # Strava requests left untouched in the 15-minute window for other callers
+
+def _ids_for_range(start_date: str, end_date: Optional[str]) -> List[int]:
+    """Activities on the athlete's local calendar days start_date…end_date, from the index (copies left out)"""
+    first_day = parse_date(start_date).strftime("%Y-%m-%d")
+    last_day = parse_date(end_date).strftime("%Y-%m-%d") if end_date else first_day
+    aid = current_athlete_id()
+    today, _ = activity_store.local_today(aid)
+    activity_store.ready(aid, max_age=LIST_CACHE_TTL if last_day >= today.isoformat() else None,
+                         since=activity_store.day_start_ts(first_day))
+    rows, _ = activity_store.query(aid, first_day=first_day, last_day=last_day, limit=MAX_BATCH)
+    return [r["id"] for r in rows]
+
+def _compare(rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Standouts per sport family: longest, hilliest, fastest, hardest (HR)"""
+    out: Dict[str, Any] = {}
+    for fam in sorted({sport_family(r["sport"]) for r in rows}):
+        group = [r for r in rows if sport_family(r["sport"]) == fam]
+        def best(key, lowest=False):
+            vals = [r for r in group if r.get(key)]
+            if not vals:
+                return None
+            r = (min if lowest else max)(vals, key=lambda x: x[key])
+            return {"id": r["id"], "name": r["name"], key: r[key]}
+        dist = [r["distance_km"] for r in group if r.get("distance_km")]
+        out[fam] = {
+            "count": len(group),
+            "avg_distance_km": round(sum(dist) / len(dist), 2) if dist else None,
+            "longest": best("distance_km"),
+            "hilliest": best("elev_gain_m"),
+            "highest_hr": best("avg_hr"),
+            "fastest": best("pace_min_per_km", lowest=True) if fam == "run"
+                       else best("pace_per_100m_min", lowest=True) if fam == "swim"
+                       else best("avg_speed_kmh"),
+        }
+    return out
+
+def _plan(activity_ids: Optional[List[int]], start_date: Optional[str], end_date: Optional[str]):
+    """(ids, ids without a cached detail, ids deferred to stay within the rate budget, index stale_as_of)"""
+    ids = [int(i) for i in activity_ids] if activity_ids else _ids_for_range(start_date, end_date)
+    ids = list(dict.fromkeys(ids))[:MAX_BATCH]
+    missing = [i for i in ids if cached_activity(i) is None]
+    budget = rate_budget()
+    allowed = max(0, min(budget["remaining_15m"], budget["remaining_day"]) - BUDGET_RESERVE)
+    return ids, missing, set(missing[allowed:]), stale_as_of()  # the thread's staleness does not reach the caller
+
+async def analyze_batch(activity_ids: Optional[List[int]] = None, start_date: Optional[str] = None,
+                        end_date: Optional[str] = None, limit: int = MAX_BATCH, fields: Optional[str] = None,
+                        compact: bool = False, cursor: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Analyze up to MAX_BATCH activities (ids, or every activity in a date range).
+    Cached details are reused; missing ones are fetched BATCH_CONCURRENCY at a
+    time on worker threads (the event loop stays free), never spending the last
+    BUDGET_RESERVE requests of the rate window. The comparison covers the whole
+    batch; `activities` and `analyses` are one page (oldest first).
+    """
+    reset_stale()
+    if activity_ids and start_date:
+        raise ValueError("Use either 'activity_ids' or 'start_date'/'end_date', not both")
+    if not activity_ids and not start_date:
+        raise ValueError("Must specify 'activity_ids' or 'start_date'")
+    ids, missing, deferred, index_stale = await asyncio.to_thread(_plan, activity_ids, start_date, end_date)
+    todo = [i for i in ids if i not in deferred]
+
+    gate = asyncio.Semaphore(max(1, min(BATCH_CONCURRENCY, len(missing) or 1)))
+
+    async def one(activity_id: int) -> Dict[str, Any]:
+        # to_thread runs in a copy of this context (athlete, staleness)
+        async with gate:
+            try:
+                return await asyncio.to_thread(analyze_activity, activity_id)
+            except Exception as e:
+                return {"activity_id": activity_id, "error": str(e)}
+
+    results = dict(zip(todo, await asyncio.gather(*(one(i) for i in todo))))
+
+    analyses, errors = [], []
+    for i in ids:
+        r = results.get(i)
+        if r is None:
+            continue
+        (errors if "error" in r else analyses).append(r)
+    rows = sorted((r["activity"] for r in analyses), key=lambda a: a.get("start_date_utc") or "")
+    stale = sorted([r["stale_as_of"] for r in analyses if r.get("stale_as_of")] + ([index_stale] if index_stale else []))
+
+    comparison = _compare(rows)
+    lines = [f"{len(rows)} activities analyzed"
+             + (f" ({len(ids) - len(missing)} from cache)" if len(ids) != len(missing) else "")]
+    for fam, c in comparison.items():
+        bits = [f"{c['count']} {fam}"]
+        if c["longest"]:
+            bits.append(f"longest {c['longest']['name']} ({c['longest']['distance_km']} km)")
+        if c["fastest"] and c["count"] > 1:
+            bits.append(f"fastest {c['fastest']['name']}")
+        if c["hilliest"] and c["count"] > 1:
+            bits.append(f"hilliest {c['hilliest']['name']} ({c['hilliest']['elev_gain_m']} m)")
+        lines.append(" • ".join(bits))
+    if deferred:
+        lines.append(f"{len(deferred)} skipped to stay within the Strava rate limit, ask again in a few minutes")
+
+    sig = query_sig("batch", current_athlete_id(), ids)
+    page, nxt = keyset_page(rows, page_size(limit, MAX_BATCH), cursor, sig,
+                            key=lambda a: (a.get("start_date_utc") or "", a["id"]), reverse=False)
+    shown = {a["id"] for a in page}
+    payload = {
+        "requested": len(ids),
+        "analyzed": len(analyses),
+        "from_cache": len(ids) - len(missing),
+        "skipped_rate_limit": sorted(deferred),
+        "errors": errors,
+        "activities": project(page, fields, compact),
+        "analyses": [{"activity_id": r["activity_id"], "content": r["content"]} for r in analyses if r["activity_id"] in shown],
+        "page": page_info(nxt, len(page), len(rows)),
+        "comparison": comparison,
+        "content": "\n".join(lines),
+        "poke_prompt": "user asked to compare several workouts. respond in casual poke style: point out the standouts and any clear progression, briefly. don't list every activity.",
+    }
+    if stale:
+        payload["stale_as_of"] = stale[0]
+        payload["content"] = f"⚠️ Strava is unavailable or still syncing; some data is cached as of {stale[0]}.\n{payload['content']}"
+    return payload
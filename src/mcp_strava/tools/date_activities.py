@@ -1,8 +1,13 @@
 """Get Strava activities by date or date range"""
 from datetime import datetime, timezone
 from typing import List, Dict, Optional
-from mcp_strava.services.strava_client import get_activities_list
+from mcp_strava.services import activity_store
+from mcp_strava.services.strava_client import current_athlete_id, reset_stale, annotate_stale
 from mcp_strava.services.metrics import normalize
+from mcp_strava.services.paging import query_sig, page_size, project, keyset_page, page_info
+from mcp_strava.settings import LIST_CACHE_TTL
+
+MAX_RANGE = 5000  # activities summarized per range query (several years of daily training)
 
 def parse_date(date_str: str) -> datetime:
     """Parse date string in various formats to datetime"""
@@ -22,26 +27,64 @@ def parse_date(date_str: str) -> datetime:
     
     raise ValueError(f"Unable to parse date: {date_str}. Supported formats: YYYY-MM-DD, DD/MM/YYYY, DD-MM-YYYY")
 
+def build_payload(activities: List[Dict], date_desc: str) -> Dict:
+    """Summary + response payload for normalized activities matching a date filter"""
+    if not activities:
+        content = f"No activities found {date_desc}"
+    else:
+        total_distance = sum(a.get("distance_km", 0) for a in activities if a.get("distance_km"))
+        total_time = sum(a.get("moving_time_min", 0) for a in activities if a.get("moving_time_min"))
+        sports = list(set(a.get("sport", "Unknown") for a in activities))
+        
+        summary_parts = [
+            f"{len(activities)} activities {date_desc}",
+            f"{total_distance:.1f} km total" if total_distance > 0 else None,
+            f"{total_time:.0f} min total" if total_time > 0 else None,
+            f"Sports: {', '.join(sports)}" if len(sports) <= 3 else f"Sports: {', '.join(sports[:3])} +{len(sports)-3} more"
+        ]
+        content = " • ".join(filter(None, summary_parts))
+    
+    return {
+        "date_filter": date_desc,
+        "count": len(activities),
+        "activities": activities,
+        "summary": {
+            "total_distance_km": round(sum(a.get("distance_km", 0) for a in activities if a.get("distance_km")), 2),
+            "total_time_min": round(sum(a.get("moving_time_min", 0) for a in activities if a.get("moving_time_min")), 1),
+            "sports": list(set(a.get("sport", "Unknown") for a in activities)),
+        },
+        "content": content,
+        "poke_prompt": "user asked about activities on a specific date/range. respond in casual poke style - brief, conversational. highlight key stats naturally. if no activities, keep it simple and direct. don't be formal or verbose."
+    }
+
 def get_activities_by_date(
     date: Optional[str] = None,
     start_date: Optional[str] = None, 
     end_date: Optional[str] = None,
-    limit: int = 30
+    limit: int = 30,
+    fields: Optional[str] = None,
+    compact: bool = False,
+    cursor: Optional[str] = None
 ) -> Dict:
     """
-    Get Strava activities for a specific date or date range.
+    Get Strava activities for a specific date or date range, in the athlete's
+    local calendar (read from the activity index).
     
     Args:
         date: Single date (YYYY-MM-DD, DD/MM/YYYY, or DD-MM-YYYY)
         start_date: Start of date range (same formats)
         end_date: End of date range (same formats)  
-        limit: Maximum number of activities to return
+        limit: Maximum number of activities per page
+        fields: Comma-separated activity keys to return (e.g. "id,name,distance_km")
+        compact: Return a short fixed set of keys per activity
+        cursor: next_cursor from a previous page of the same query
         
     Returns:
         Dict with activities and metadata
     """
     
     print(f"[DATE_ACTIVITIES] Called with: date={date}, start_date={start_date}, end_date={end_date}, limit={limit}")
+    reset_stale()
     
     if date and (start_date or end_date):
         raise ValueError("Use either 'date' for single date or 'start_date'/'end_date' for range, not both")
@@ -49,75 +92,45 @@ def get_activities_by_date(
     if not date and not start_date:
         raise ValueError("Must specify either 'date' or 'start_date'")
     
-    # Handle single date
+    # Dates are the athlete's local calendar days (a 00:30 run belongs to the day it was run)
     if date:
-        parsed_date = parse_date(date)
-        # Get activities for the entire day
-        after_timestamp = int(parsed_date.timestamp())
-        before_timestamp = int((parsed_date.replace(hour=23, minute=59, second=59)).timestamp())
-        date_desc = f"on {parsed_date.strftime('%Y-%m-%d')}"
-    
-    # Handle date range
+        first_day = last_day = parse_date(date).strftime("%Y-%m-%d")
     else:
-        start_dt = parse_date(start_date)
-        if end_date:
-            end_dt = parse_date(end_date)
-            if end_dt < start_dt:
-                raise ValueError("end_date must be after start_date")
-        else:
-            # If no end_date, use same day as start_date
-            end_dt = start_dt.replace(hour=23, minute=59, second=59)
-        
-        after_timestamp = int(start_dt.timestamp())
-        before_timestamp = int(end_dt.replace(hour=23, minute=59, second=59).timestamp())
-        
-        if start_date == end_date or not end_date:
-            date_desc = f"on {start_dt.strftime('%Y-%m-%d')}"
-        else:
-            date_desc = f"from {start_dt.strftime('%Y-%m-%d')} to {end_dt.strftime('%Y-%m-%d')}"
-    
-    # Get activities from Strava API
-    raw_activities = get_activities_list(
-        limit=limit,
-        after=after_timestamp,
-        before=before_timestamp
-    )
-    
-    # Normalize activities
+        first_day = parse_date(start_date).strftime("%Y-%m-%d")
+        last_day = parse_date(end_date).strftime("%Y-%m-%d") if end_date else first_day
+        if last_day < first_day:
+            raise ValueError("end_date must be after start_date")
+    date_desc = f"on {first_day}" if first_day == last_day else f"from {first_day} to {last_day}"
+
+    aid = current_athlete_id()
+    today, _ = activity_store.local_today(aid)
+    # a range reaching today must see the latest uploads: catch up first (one Strava page at most)
+    activity_store.ready(aid, max_age=LIST_CACHE_TTL if last_day >= today.isoformat() else None,
+                         since=activity_store.day_start_ts(first_day))
+    rows, total = activity_store.query(aid, first_day=first_day, last_day=last_day, duplicates=True, limit=MAX_RANGE)
+    truncated = total > len(rows)
+    copies = [r for r in rows if r["duplicate_of"]]  # second recordings of one workout: not counted
+    rows = [r for r in rows if not r["duplicate_of"]]
+
     activities = []
-    for raw_activity in raw_activities:
+    for r in rows:
         try:
-            normalized = normalize(raw_activity)
-            activities.append(normalized)
+            a = normalize(activity_store.as_activity(r))
+            a["start_date_local"] = r["start_local"]
+            activities.append(a)
         except Exception as e:
-            print(f"[DATE_ACTIVITIES] Error normalizing activity {raw_activity.get('id', 'unknown')}: {e}")
+            print(f"[DATE_ACTIVITIES] Error normalizing activity {r.get('id', 'unknown')}: {e}")
             continue
-    
-    # Create summary
-    if not activities:
-        content = f"No activities found {date_desc}"
-    else:
-        total_distance = sum(a.get("distance_km", 0) for a in activities if a.get("distance_km"))
-        total_time = sum(a.get("moving_time_min", 0) for a in activities if a.get("moving_time_min"))
-        sports = list(set(a.get("sport", "Unknown") for a in activities))
-        
-        summary_parts = [
-            f"{len(activities)} activities {date_desc}",
-            f"{total_distance:.1f} km total" if total_distance > 0 else None,
-            f"{total_time:.0f} min total" if total_time > 0 else None,
-            f"Sports: {', '.join(sports)}" if len(sports) <= 3 else f"Sports: {', '.join(sports[:3])} +{len(sports)-3} more"
-        ]
-        content = " • ".join(filter(None, summary_parts))
-    
-    return {
-        "date_filter": date_desc,
-        "count": len(activities),
-        "activities": activities,
-        "summary": {
-            "total_distance_km": round(sum(a.get("distance_km", 0) for a in activities if a.get("distance_km")), 2),
-            "total_time_min": round(sum(a.get("moving_time_min", 0) for a in activities if a.get("moving_time_min")), 1),
-            "sports": list(set(a.get("sport", "Unknown") for a in activities)),
-        },
-        "content": content,
-        "poke_prompt": "user asked about activities on a specific date/range. respond in casual poke style - brief, conversational. highlight key stats naturally. if no activities, keep it simple and direct. don't be formal or verbose."
-    }
+
+    # totals cover the whole range; `activities` is one page (newest first)
+    payload = build_payload(activities, date_desc)
+    sig = query_sig("date_range", aid, first_day, last_day)
+    page, nxt = keyset_page(activities, page_size(limit, 30), cursor, sig)
+    payload["activities"] = project(page, fields, compact)
+    payload["page"] = page_info(nxt, len(page), len(activities))
+    payload["duplicates_excluded"] = [{"id": r["id"], "duplicate_of": r["duplicate_of"]} for r in copies]
+    if copies:
+        payload["content"] += f" • {len(copies)} duplicate recording{'s' if len(copies) > 1 else ''} not counted"
+    if truncated:
+        payload["summary"]["scope"] = f"latest {len(rows) + len(copies)} of {total}"
+    return annotate_stale(payload)
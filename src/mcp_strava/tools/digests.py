@@ -0,0 +1,63 @@
+"""Weekly/monthly digest settings for the current athlete, with an on-demand preview"""
+from datetime import datetime
+from typing import Any, Dict, Optional
+from mcp_strava.services import activity_store, digests
+from mcp_strava.services.strava_client import current_athlete_id, reset_stale, annotate_stale
+
+def _weekday(v: Optional[str]) -> Optional[int]:
+    if v is None:
+        return None
+    s = str(v).strip().lower()
+    if s.isdigit():
+        return int(s)
+    for i, name in enumerate(digests.WEEKDAYS):
+        if s.startswith(name):
+            return i
+    raise ValueError(f"Unknown weekday '{v}' (use mon…sun)")
+
+def _row(aid: int, s: Dict[str, Any]) -> Dict[str, Any]:
+    zone, tz = activity_store.athlete_zone(aid)
+    nxt = datetime.fromtimestamp(s["next_run_ts"], zone).isoformat(timespec="minutes") if s["next_run_ts"] else None
+    return {
+        "kind": s["kind"],
+        "enabled": bool(s["enabled"]),
+        "weekday": digests.WEEKDAYS[s["weekday"]] if s["kind"] == "weekly" else None,
+        "hour": s["hour"],
+        "next_send_local": nxt,
+        "timezone": tz,
+    }
+
+def digest_schedule(kind: Optional[str] = None, enabled: Optional[bool] = None, weekday: Optional[str] = None,
+                    hour: Optional[int] = None, preview: bool = False) -> Dict[str, Any]:
+    """
+    Show the athlete's digest schedules, or change one (kind + enabled/weekday/hour).
+    preview=True renders the digest `kind` would send next, from the activity index.
+    """
+    reset_stale()
+    aid = current_athlete_id()
+    if kind is not None and (enabled is not None or weekday is not None or hour is not None):
+        digests.configure(aid, kind, enabled=enabled, weekday=_weekday(weekday), hour=hour)
+    rows = [_row(aid, s) for s in digests.schedules(aid)]
+    lines = []
+    for r in rows:
+        when = f"{r['weekday']} " if r["weekday"] else "1st of the month "
+        lines.append(f"{r['kind']}: " + (f"on, {when}{r['hour']:02d}h (next {r['next_send_local']})" if r["enabled"] else "off"))
+    out: Dict[str, Any] = {"schedules": rows}
+
+    if preview:
+        k = kind or "weekly"
+        if k not in digests.KINDS:
+            raise ValueError(f"kind must be one of {', '.join(digests.KINDS)}")
+        zone, _ = activity_store.athlete_zone(aid)
+        sched = next((s for s in digests.schedules(aid) if s["kind"] == k), None)
+        run_day = (datetime.fromtimestamp(sched["next_run_ts"], zone).date() if sched and sched["next_run_ts"]
+                   else activity_store.local_today(aid)[0])
+        first, last = digests.period(k, run_day)  # may still be in progress
+        # only the days the digest reads (and the period it compares with) are indexed in-request
+        activity_store.ready(aid, since=activity_store.day_start_ts(digests.previous(k, first)[0].isoformat()))
+        out["preview"] = digests.build(aid, k, first, last)
+        lines.append(out["preview"]["content"])
+
+    out["content"] = "\n".join(lines)
+    out["poke_prompt"] = "user asked about their scheduled strava digests. confirm the schedule in casual poke style, in one or two lines."
+    return annotate_stale(out)
@@ -0,0 +1,37 @@
+"""Signed download links for the streaming activity export"""
+from typing import Any, Dict, Optional
+from mcp_strava.services.export import FORMATS, export_url, parquet_available
+from mcp_strava.services.strava_client import current_athlete_id
+from mcp_strava.settings import EXPORT_LINK_TTL
+from mcp_strava.tools.date_activities import parse_date
+
+def export_activities(
+    format: str = "ndjson",
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    sport: Optional[str] = None,
+) -> Dict[str, Any]:
+    fmt = (format or "ndjson").lower()
+    if fmt not in FORMATS:
+        raise ValueError(f"format must be one of {', '.join(FORMATS)}")
+    if fmt == "parquet" and not parquet_available():
+        raise ValueError("parquet export is not available on this server (pyarrow missing); use ndjson or csv")
+
+    # the athlete's local calendar days, like get_activities_by_date_range
+    first_day = parse_date(start_date).strftime("%Y-%m-%d") if start_date else None
+    last_day = parse_date(end_date).strftime("%Y-%m-%d") if end_date else None
+    if first_day and last_day and last_day < first_day:
+        raise ValueError("end_date must be after start_date")
+
+    url = export_url(current_athlete_id(), fmt, sport=sport, first_day=first_day, last_day=last_day)
+    span = f"{start_date or 'the beginning'} → {end_date or 'today'}"
+    return {
+        "status": "ready",
+        "format": fmt,
+        "download_url": url,
+        "expires_in_s": EXPORT_LINK_TTL,
+        "filters": {"start_date": start_date, "end_date": end_date, "sport": sport},
+        "resume": "each row has a 'cursor'; append &cursor=<last cursor> to the URL to resume an interrupted download",
+        "content": f"📦 Export ready ({fmt}, {span}{', ' + sport if sport else ''}): {url}",
+        "poke_prompt": "user asked to export their strava history. give them the download link in casual poke style, mention it expires in a day. keep it short.",
+    }
@@ -0,0 +1,78 @@
+"""Filter and search the athlete's whole history from the local activity index"""
+from typing import Any, Dict, Optional
+from mcp_strava.services import activity_store
+from mcp_strava.services.metrics import normalize, summarize
+from mcp_strava.services.paging import decode_cursor, encode_cursor, query_sig, page_size, project, page_info
+from mcp_strava.services.strava_client import current_athlete_id, reset_stale, annotate_stale
+from mcp_strava.tools.date_activities import parse_date
+
+def query_activities(
+    sport: Optional[str] = None,
+    min_distance_km: Optional[float] = None,
+    max_distance_km: Optional[float] = None,
+    min_duration_min: Optional[float] = None,
+    max_duration_min: Optional[float] = None,
+    min_elev_m: Optional[float] = None,
+    max_elev_m: Optional[float] = None,
+    min_hr: Optional[float] = None,
+    max_hr: Optional[float] = None,
+    weekday: Optional[str] = None,
+    time_of_day: Optional[str] = None,
+    name: Optional[str] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    include_duplicates: bool = False,
+    sort: str = "recent",
+    limit: int = 20,
+    fields: Optional[str] = None,
+    compact: bool = False,
+    cursor: Optional[str] = None,
+) -> Dict[str, Any]:
+    reset_stale()
+    aid = current_athlete_id()
+    # dates are the athlete's local calendar days, like get_activities_by_date_range
+    first_day = parse_date(start_date).strftime("%Y-%m-%d") if start_date else None
+    last_day = parse_date(end_date).strftime("%Y-%m-%d") if end_date else None
+    index = activity_store.ready(aid, since=activity_store.day_start_ts(first_day) if first_day else None)
+    filters = {k: v for k, v in {
+        "sport": sport, "min_distance_km": min_distance_km, "max_distance_km": max_distance_km,
+        "min_duration_min": min_duration_min, "max_duration_min": max_duration_min,
+        "min_elev_m": min_elev_m, "max_elev_m": max_elev_m, "min_hr": min_hr, "max_hr": max_hr,
+        "weekday": weekday, "time_of_day": time_of_day, "name": name,
+        "start_date": start_date, "end_date": end_date, "include_duplicates": include_duplicates or None,
+    }.items() if v not in (None, "")}
+
+    sig = query_sig("search", aid, filters, sort)
+    after_key = decode_cursor(cursor, sig).get("k") if cursor else None
+    limit = page_size(limit, 20)
+    rows, total = activity_store.query(
+        aid, sport=sport, min_distance_km=min_distance_km, max_distance_km=max_distance_km,
+        min_duration_min=min_duration_min, max_duration_min=max_duration_min,
+        min_elev_m=min_elev_m, max_elev_m=max_elev_m, min_hr=min_hr, max_hr=max_hr,
+        weekdays=activity_store.parse_weekdays(weekday) if weekday else None,
+        time_of_day=(time_of_day or "").lower() or None, text=name, first_day=first_day, last_day=last_day,
+        duplicates=include_duplicates, sort=sort, limit=limit, after_key=after_key,
+    )
+    nxt = encode_cursor({"q": sig, "k": activity_store.sort_key(sort, rows[-1])}) if len(rows) == limit else None
+    activities = [normalize(activity_store.as_activity(r)) for r in rows]
+    for a, r in zip(activities, rows):
+        a["start_date_local"] = r["start_local"]
+        if r["duplicate_of"]:
+            a["duplicate_of"] = r["duplicate_of"]
+
+    if not total:
+        content = "No matching activities"
+    else:
+        shown = f"{len(activities)} of {total}" if total > len(activities) else f"{total}"
+        content = f"{shown} matching activities • " + " | ".join(f"{a['name']}: {a['summary']}" for a in activities[:5])
+    return annotate_stale(activity_store.annotate_indexing({
+        "filters": filters,
+        "total_matches": total,
+        "count": len(activities),
+        "activities": project(activities, fields, compact),
+        "page": page_info(nxt, len(activities), total),
+        "summary": summarize([a for a in activities if not a.get("duplicate_of")]),
+        "index": index,
+        "content": content,
+        "poke_prompt": "user searched their strava history. answer in casual poke style: say how many matched and call out the standouts (longest, hilliest, most recent). keep it short.",
+    }, index))
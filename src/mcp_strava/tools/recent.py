@@ -1,12 +1,27 @@
 from typing import List, Dict, Any
-from mcp_strava.services.strava_client import get_recent_activities
+from mcp_strava.services.strava_client import get_activities_list, reset_stale, annotate_stale
 from mcp_strava.services.metrics import normalize
+from mcp_strava.services.paging import decode_cursor, query_sig, page_size, project, time_cursor, page_info, MAX_PAGE
 
-def recent_activities(limit: int = 5) -> Dict[str, Any]:
-    raw = get_recent_activities(per_page=limit)
+def recent_activities(limit: int = 5, fields: str | None = None, compact: bool = False, cursor: str | None = None) -> Dict[str, Any]:
+    reset_stale()
+    limit = page_size(limit, 5)
+    sig = query_sig("recent")
+    prev = None
+    if cursor:
+        # older pages: slide 'before' past what was already returned
+        prev = decode_cursor(cursor, sig)
+        skip = set(prev.get("s") or [])
+        limit = max(1, min(limit, MAX_PAGE - len(skip)))  # one Strava page (200) holds the skipped ids too
+        raw = get_activities_list(limit=limit + len(skip), before=int(prev["b"]))
+        raw = [a for a in raw if a.get("id") not in skip][:limit]
+    else:
+        raw = get_activities_list(limit=limit)  # not get_recent_activities: it stops at 100
     activities = [normalize(a) for a in raw]
-    return {
-        "activities": activities,
+    nxt = time_cursor(raw, limit, sig, prev)
+    return annotate_stale({
+        "activities": project(activities, fields, compact),
         "count": len(activities),
+        "page": page_info(nxt, len(activities)),
         "poke_prompt": "user asked for recent activities. respond in casual poke style - brief and friendly. mention the activities naturally, maybe highlight something interesting. keep it conversational."
-    }
+    })
@@ -0,0 +1,116 @@
+"""Where-did-I-go questions, answered from the route index"""
+from typing import Any, Dict, List, Optional
+from mcp_strava.services import activity_store, duplicates, route_index
+from mcp_strava.services.metrics import normalize, sport_family, sport_matches
+from mcp_strava.services.strava_client import current_athlete_id, reset_stale, annotate_stale
+from mcp_strava.services.paging import query_sig, page_size, project, keyset_page, page_info
+
+def _activities(aid: int, ids: List[int]) -> Dict[int, Dict[str, Any]]:
+    rows = activity_store.rows_by_id(aid, ids)
+    out = {}
+    for i, r in rows.items():
+        a = normalize(activity_store.as_activity(r))
+        a["start_date_local"] = r["start_local"]
+        out[i] = a
+    return out
+
+def activities_near(
+    lat: float,
+    lng: float,
+    radius_m: float = 500,
+    sport: Optional[str] = None,
+    start_only: bool = False,
+    limit: int = 20,
+    fields: Optional[str] = None,
+    compact: bool = False,
+    cursor: Optional[str] = None,
+) -> Dict[str, Any]:
+    reset_stale()
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        raise ValueError("lat/lng out of range")
+    radius_m = max(10.0, min(float(radius_m), 50_000.0))
+    aid = current_athlete_id()
+    index = activity_store.ready(aid)
+
+    hits = route_index.near(aid, lat, lng, radius_m, start_only=start_only)
+    acts = _activities(aid, [h[0] for h in hits])
+    matches = []
+    for act_id, d in hits:
+        a = acts.get(act_id)
+        if a and sport_matches(a["sport"], sport):
+            matches.append({**a, "distance_from_point_m": round(d)})
+    sig = query_sig("near", aid, lat, lng, radius_m, sport, start_only)
+    rows, nxt = keyset_page(matches, page_size(limit, 20), cursor, sig)
+
+    where = "starting" if start_only else "passing"
+    if matches:
+        content = (f"{len(matches)} activities {where} within {radius_m:.0f} m of ({lat:.5f}, {lng:.5f}) • "
+                   + " | ".join(f"{a['name']} ({(a.get('start_date_local') or '')[:10]}): {a['summary']}" for a in rows[:5]))
+    else:
+        content = f"No activities {where} within {radius_m:.0f} m of ({lat:.5f}, {lng:.5f})"
+    return annotate_stale(activity_store.annotate_indexing({
+        "point": {"lat": lat, "lng": lng, "radius_m": radius_m, "start_only": start_only},
+        "total_matches": len(matches),
+        "activities": project(rows, fields, compact),
+        "page": page_info(nxt, len(rows), len(matches)),
+        "content": content,
+        "poke_prompt": "user asked which workouts went near a place. answer in casual poke style: how many, how recent, maybe the longest one. keep it short.",
+    }, index))
+
+def route_history(activity_id: Optional[int] = None, min_similarity: float = 0.6, limit: int = 50,
+                  fields: Optional[str] = None, compact: bool = False, cursor: Optional[str] = None) -> Dict[str, Any]:
+    reset_stale()
+    aid = current_athlete_id()
+    index = activity_store.ready(aid)
+    if activity_id is None:
+        activity_id = route_index.latest(aid)
+        if activity_id is None:
+            return activity_store.annotate_indexing({
+                "count": 0, "activities": [], "content": "No activities with a GPS route yet",
+                "poke_prompt": "tell the user briefly there are no gps routes to compare yet."}, index)
+    activity_id = duplicates.primary_of(activity_id) or int(activity_id)  # a copy stands for its primary
+    min_similarity = max(0.2, min(float(min_similarity), 1.0))
+
+    similar = route_index.similar(aid, activity_id, min_similarity)
+    acts = _activities(aid, [i for i, _ in similar] + [activity_id])
+    ref = acts.get(activity_id)
+    if ref is None:
+        return activity_store.annotate_indexing({
+            "count": 0, "activities": [], "content": f"Activity {activity_id} has no indexed GPS route",
+            "poke_prompt": "tell the user briefly this activity has no gps route to compare."}, index)
+
+    same = []
+    for i, sim in similar:
+        a = acts.get(i)
+        # same route on a bike and on foot are different efforts
+        if a and sport_family(a["sport"]) == sport_family(ref["sport"]):
+            same.append({**a, "similarity": sim})
+    same.sort(key=lambda a: a.get("start_date") or "")
+
+    times = [a["moving_time_min"] for a in same if a.get("moving_time_min")]
+    fastest = min(same, key=lambda a: a["moving_time_min"] or float("inf")) if same else None
+    trend = None
+    if len(times) >= 4:
+        half = len(times) // 2
+        early, late = sum(times[:half]) / half, sum(times[-half:]) / half
+        trend = round(late - early, 1)  # minutes; negative = getting faster
+
+    content = f"Done this route {len(same)} time{'s' if len(same) != 1 else ''}"
+    if same:
+        content += f" (first {(same[0].get('start_date_local') or '')[:10]}, last {(same[-1].get('start_date_local') or '')[:10]})"
+    if fastest and len(same) > 1:
+        content += f" • fastest: {fastest['moving_time_min']} min on {(fastest.get('start_date_local') or '')[:10]}"
+    if trend is not None:
+        content += f" • recent efforts {abs(trend)} min {'faster' if trend < 0 else 'slower'} than early ones"
+    # oldest first, like a logbook of the route
+    rows, nxt = keyset_page(same, page_size(limit, 50), cursor, query_sig("route", aid, activity_id, min_similarity), reverse=False)
+    return annotate_stale(activity_store.annotate_indexing({
+        "reference": ref,
+        "count": len(same),
+        "fastest": fastest,
+        "trend_min": trend,
+        "activities": project(rows, fields, compact),
+        "page": page_info(nxt, len(rows), len(same)),
+        "content": content,
+        "poke_prompt": "user asked how often they've done this route. answer in casual poke style: count, fastest time, whether they're getting quicker. keep it short.",
+    }, index))
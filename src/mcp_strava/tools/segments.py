@@ -0,0 +1,138 @@
+"""Segment history, personal ranking and trend, answered from the segment index"""
+from typing import Any, Dict, List, Optional
+from mcp_strava.services import activity_store, segment_index
+from mcp_strava.services.metrics import sec_to_mmss
+from mcp_strava.services.strava_client import current_athlete_id, reset_stale, annotate_stale
+from mcp_strava.services.paging import (
+    query_sig, page_size, project, keyset_page, page_info, encode_cursor, decode_cursor,
+)
+
+def _ordinal(n: int) -> str:
+    suffix = "th" if 10 <= n % 100 <= 20 else {1: "st", 2: "nd", 3: "rd"}.get(n % 10, "th")
+    return f"{n}{suffix}"
+
+def _segment_row(s: Dict[str, Any]) -> Dict[str, Any]:
+    best = s.get("best_elapsed_s")
+    return {
+        "id": s["segment_id"],
+        "name": s.get("name"),
+        "activity_type": s.get("activity_type"),
+        "distance_m": s.get("distance_m"),
+        "avg_grade": s.get("avg_grade"),
+        "elev_m": s.get("elev_m"),
+        "city": s.get("city"),
+        "efforts": s.get("efforts"),
+        "best_time": sec_to_mmss(best) if best else None,
+        "best_elapsed_s": best,
+        "best_effort_id": s.get("best_effort_id"),
+        "summary": f"{s.get('efforts')} efforts • best {sec_to_mmss(best) if best else '-'}",
+    }
+
+def _progress(out: Dict[str, Any], index: Dict[str, Any], coverage: Dict[str, int]) -> Dict[str, Any]:
+    """Coverage note while efforts are still being read (in the background), plus the indexing marker"""
+    if coverage["pending"]:
+        note = (f"🔎 Segment efforts read from {coverage['activities_ingested']} of {coverage['activities_with_routes']} "
+                "activities with a route so far; the rest are being read in the background.")
+        out["content"] = f"{note}\n{out['content']}"
+    return annotate_stale(activity_store.annotate_indexing(out, index))
+
+def _list_segments(aid: int, limit: int, fields, compact, cursor) -> Dict[str, Any]:
+    sig = query_sig("segments", aid)
+    after = decode_cursor(cursor, sig).get("k") if cursor else None
+    n = page_size(limit, 20)
+    rows = segment_index.top(aid, n + 1, after)
+    nxt = encode_cursor({"q": sig, "k": [rows[n - 1]["efforts"], rows[n - 1]["segment_id"]]}) if len(rows) > n else None
+    items = [_segment_row(s) for s in rows[:n]]
+    total = segment_index.count(aid)
+    content = (f"{total} segments • most frequent: " + " | ".join(f"{s['name']} ({s['efforts']}×, best {s['best_time']})" for s in items[:5])
+               if items else "No segment efforts indexed yet")
+    return {
+        "total_segments": total,
+        "segments": project(items, fields, compact),
+        "page": page_info(nxt, len(items), total),
+        "content": content,
+        "poke_prompt": "user asked about their strava segments. answer in casual poke style: the ones they do most and their best times. keep it short.",
+    }
+
+def segment_history(segment_id: Optional[int] = None, name: Optional[str] = None, limit: int = 50,
+                    fields: Optional[str] = None, compact: bool = False, cursor: Optional[str] = None) -> Dict[str, Any]:
+    reset_stale()
+    aid = current_athlete_id()
+    index = activity_store.ready(aid)
+    coverage = segment_index.coverage(aid)
+    if coverage["pending"]:
+        activity_store.backfill_in_background(aid)  # details are never read in-request
+
+    if segment_id is None and not name:
+        out = _list_segments(aid, limit, fields, compact, cursor)
+        out["coverage"] = coverage
+        return _progress(out, index, coverage)
+
+    others: List[Dict[str, Any]] = []
+    if segment_id is not None:
+        seg = segment_index.segment(aid, int(segment_id))
+    else:
+        found = segment_index.find(aid, name.strip())
+        seg, others = (found[0], found[1:]) if found else (None, [])
+    if seg is None:
+        what = f"segment {segment_id}" if segment_id is not None else f"a segment matching '{name}'"
+        return _progress({"count": 0, "efforts": [], "coverage": coverage,
+                          "content": f"No efforts on {what}",
+                          "poke_prompt": "tell the user briefly no efforts were found on that segment."}, index, coverage)
+
+    sid = seg["segment_id"]
+    efforts = segment_index.efforts(aid, sid)
+    by_time = sorted(e["elapsed_s"] or 0 for e in efforts)
+    total = len(efforts)
+    best_so_far = None
+    rows = []
+    for e in efforts:  # oldest first: a PR is a best-so-far at the time
+        t = e["elapsed_s"] or 0
+        rank = by_time.index(t) + 1
+        pr = best_so_far is None or t < best_so_far
+        best_so_far = t if pr else best_so_far
+        rows.append({
+            "id": e["id"],
+            "activity_id": e["activity_id"],
+            "name": e.get("activity_name"),
+            "start_ts": e["start_ts"],
+            "start_date_local": e["start_local"],
+            "elapsed_s": t,
+            "time": sec_to_mmss(t),
+            "rank": rank,
+            "pr_at_the_time": pr,
+            "avg_hr": e["avg_hr"],
+            "avg_watts": e["avg_watts"],
+            "summary": f"{sec_to_mmss(t)} ({_ordinal(rank)} of {total})",
+        })
+
+    trend = None
+    if total >= 4:
+        half = total // 2
+        times = [r["elapsed_s"] for r in rows]
+        trend = round(sum(times[-half:]) / half - sum(times[:half]) / half)  # seconds; negative = getting faster
+    latest = rows[-1] if rows else None
+
+    info = _segment_row(seg)
+    content = f"{info['name']}: {total} effort{'s' if total != 1 else ''} • best {info['best_time']}"
+    if latest and total > 1:
+        content += f" • latest {latest['time']} on {(latest['start_date_local'] or '')[:10]}, your {_ordinal(latest['rank'])} best"
+    if trend is not None:
+        content += f" • recent efforts {abs(trend)}s {'faster' if trend < 0 else 'slower'} than early ones"
+
+    # newest first; rank stays relative to the whole history
+    page, nxt = keyset_page(rows, page_size(limit, 50), cursor, query_sig("segment", aid, sid),
+                            key=lambda r: (r["start_ts"] or 0, r["id"]))
+    return _progress({
+        "segment": info,
+        "count": total,
+        "best": next((r for r in rows if r["id"] == seg["best_effort_id"]), None),
+        "latest": latest,
+        "trend_s": trend,
+        "other_matches": [_segment_row(s) for s in others],
+        "efforts": project(page, fields, compact),
+        "page": page_info(nxt, len(page), total),
+        "coverage": coverage,
+        "content": content,
+        "poke_prompt": "user asked how they're doing on a segment. answer in casual poke style: best time, where the latest effort ranks, whether they're getting faster. keep it short.",
+    }, index, coverage)
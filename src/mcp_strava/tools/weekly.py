@@ -1,25 +1,14 @@
-from datetime import timedelta, datetime, timezone
-from mcp_strava.services.strava_client import get_recent_activities
+import time
+from datetime import timedelta
+from mcp_strava.services import activity_store
+from mcp_strava.services.strava_client import current_athlete_id, reset_stale, annotate_stale, stale_as_of
 from mcp_strava.services.metrics import normalize, summarize
+from mcp_strava.services.cache import TTLCache
+from mcp_strava.services.paging import query_sig, page_size, project, keyset_page, page_info
+from mcp_strava.settings import LIST_CACHE_TTL
 
-def _parse_iso_utc(s: str | None):
-    if not s:
-        return None
-    try:
-        if s.endswith("Z"):
-            return datetime.fromisoformat(s.replace("Z", "+00:00")).astimezone(timezone.utc)
-        dt = datetime.fromisoformat(s)
-        return (dt.replace(tzinfo=timezone.utc) if dt.tzinfo is None else dt.astimezone(timezone.utc))
-    except Exception:
-        return None
-
-def _utc_week_window(reference: datetime | None = None):
-    """Semaine courante en UTC: lundi 00:00:00Z → dimanche 23:59:59Z."""
-    now_utc = (reference or datetime.utcnow()).replace(tzinfo=timezone.utc)
-    d0 = now_utc.replace(hour=0, minute=0, second=0, microsecond=0)
-    start = d0 - timedelta(days=d0.weekday())
-    end   = start + timedelta(days=6, hours=23, minutes=59, seconds=59)
-    return start, end
+# Weekly rollups, keyed by (athlete, week start, include_content); cleared with the activity lists
+_rollups = TTLCache("rollups", ttl=LIST_CACHE_TTL, maxsize=16, tags=("activity_lists",))
 
 def _by_sport(acts):
     out = {}
@@ -36,61 +25,82 @@ def _by_sport(acts):
         v["elev_gain_m"] = round(v["elev_gain_m"], 1)
     return out
 
-def weekly_summary(include_content: bool = False):
+def _mmss_to_min(p):
+    if isinstance(p, str) and ":" in p:
+        m, s = p.split(":")
+        return int(m) + int(s)/60
+    return None
+
+def _activity_row(a):
+    return {
+        "id": a["id"],
+        "name": a.get("name"),
+        "sport": a.get("sport"),
+        "start_date_utc": a.get("start_date"),
+        "start_date_local": a.get("start_date_local"),
+        "distance_km": a.get("distance_km"),
+        "moving_time_min": a.get("moving_time_min"),
+        "elev_gain_m": a.get("elev_gain_m"),
+        "avg_hr": a.get("avg_hr"),
+        "pace_min_per_km": _mmss_to_min(a.get("pace_min_per_km")),
+        "avg_speed_kmh": a.get("avg_speed_kmh"),
+        "pace_per_100m_min": _mmss_to_min(a.get("pace_per_100m")),
+    }
+
+def weekly_summary(include_content: bool = False, limit: int = 50, fields: str | None = None,
+                   compact: bool = False, cursor: str | None = None):
     """
-    Machine-friendly summary of the current UTC calendar week (Monday→Sunday).
+    Machine-friendly summary of the current calendar week (Monday→Sunday) in
+    the athlete's local time. Totals cover the whole week; `activities` is one
+    page (newest first).
     """
-    week_start, week_end = _utc_week_window()
+    reset_stale()
+    aid = current_athlete_id()
+    # this week: catch up on the latest uploads first (on first use, index back to last week only)
+    activity_store.ready(aid, max_age=LIST_CACHE_TTL, since=int(time.time()) - 8 * 86400)
+    today, tz = activity_store.local_today(aid)
+    week_start = today - timedelta(days=today.weekday())
+    payload = _rollup(aid, week_start.isoformat(), (week_start + timedelta(days=6)).isoformat(), tz, include_content)
 
-    raw = get_recent_activities(per_page=200)
-    acts = []
-    for a in raw:
-        n = normalize(a)
-        n["_dt"] = _parse_iso_utc(n.get("start_date"))
-        acts.append(n)
+    sig = query_sig("weekly", aid, week_start.isoformat())
+    rows, nxt = keyset_page(payload["activities"], page_size(limit, 50), cursor, sig,
+                            key=lambda a: (a.get("start_date_utc") or "", a["id"]))
+    out = dict(payload)  # the rollup may be cached: never mutate it
+    out["activities"] = project(rows, fields, compact)
+    out["page"] = page_info(nxt, len(rows), total=len(payload["activities"]))
+    return annotate_stale(out)
 
-    def in_week(a):
-        dt = a.get("_dt")
-        return dt is not None and (week_start <= dt <= week_end)
+def _rollup(aid: int, first_day: str, last_day: str, tz: str | None, include_content: bool):
+    key = (aid, first_day, include_content)
+    hit = _rollups.get(key)
+    if hit is not None:
+        return hit
 
-    week_acts = [a for a in acts if in_week(a)]
+    # exact local-calendar lookup on the activity index (day index), newest first
+    rows, _ = activity_store.query(aid, first_day=first_day, last_day=last_day, duplicates=True, limit=1000)
+    copies = [r for r in rows if r["duplicate_of"]]  # second recordings of one workout: not counted
+    week_acts = []
+    for r in rows:
+        if r["duplicate_of"]:
+            continue
+        a = normalize(activity_store.as_activity(r))
+        a["start_date_local"] = r["start_local"]
+        week_acts.append(a)
     stats = summarize(week_acts)
 
     payload = {
-        "window": {
-            "start_utc": week_start.isoformat().replace("+00:00", "Z"),
-            "end_utc":   week_end.isoformat().replace("+00:00", "Z"),
-        },
+        "window": {"start_local": first_day, "end_local": last_day, "timezone": tz},
         "summary": stats,  # {count, distance_km, moving_time_min, elev_gain_m, avg_pace_min_per_km, avg_hr}
         "breakdown_by_sport": _by_sport(week_acts),
-        "activities": [
-            {
-                "id": a["id"],
-                "name": a.get("name"),
-                "sport": a.get("sport"),
-                "start_date_utc": a.get("start_date"),
-                "distance_km": a.get("distance_km"),
-                "moving_time_min": a.get("moving_time_min"),
-                "elev_gain_m": a.get("elev_gain_m"),
-                "avg_hr": a.get("avg_hr"),
-                "pace_min_per_km": (
-                    (lambda p: (int(p.split(':')[0]) + int(p.split(':')[1])/60)
-                     if isinstance(p, str) and ':' in p else None)(a.get("pace_min_per_km"))
-                ),
-                "avg_speed_kmh": a.get("avg_speed_kmh"),
-                "pace_per_100m_min": (
-                    (lambda p: (int(p.split(':')[0]) + int(p.split(':')[1])/60)
-                     if isinstance(p, str) and ':' in p else None)(a.get("pace_per_100m"))
-                ),
-            } for a in week_acts
-        ],
+        "activities": [_activity_row(a) for a in week_acts],
+        "duplicates_excluded": [{"id": r["id"], "duplicate_of": r["duplicate_of"]} for r in copies],
     }
 
     if include_content:
         s = stats
         def fmt(x,u=""): return "—" if x is None else f"{x}{u}"
         payload["content"] = (
-            f"Week {payload['window']['start_utc']} → {payload['window']['end_utc']}\n"
+            f"Week {first_day} → {last_day}\n"
             f"- Activities: {s['count']}\n"
             f"- Distance: {fmt(s['distance_km'],' km')}\n"
             f"- Time: {fmt(s['moving_time_min'],' min')}\n"
@@ -98,6 +108,10 @@ def weekly_summary(include_content: bool = False):
             f"- Avg pace: {fmt(s['avg_pace_min_per_km'],' min/km')}\n"
             f"- Avg HR: {fmt(s['avg_hr'])}"
         )
+        if copies:
+            payload["content"] += f"\n- {len(copies)} duplicate recording{'s' if len(copies) > 1 else ''} not counted"
 
     payload["poke_prompt"] = "user asked for weekly summary. respond in casual poke style - brief and encouraging. highlight the key achievements naturally. keep it conversational, not formal stats dump."
+    if not stale_as_of():  # never cache a rollup built from stale data
+        _rollups.set(key, payload)
     return payload
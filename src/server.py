@@ -1,16 +1,21 @@
 #!/usr/bin/env python3
-import os
-import uvicorn
-from fastapi import FastAPI
-from fastapi.responses import RedirectResponse, HTMLResponse, JSONResponse
-from mcp_strava.settings import HOST, PORT, POKE_API_KEY, STRAVA_VERIFY_TOKEN
+import sys
+
+if __name__ == "__main__" and "--profile-startup" in sys.argv:
+    from mcp_strava.profiling import profile_startup
+    sys.exit(profile_startup())
+
+import asyncio
+from starlette.middleware import Middleware
+from starlette.responses import RedirectResponse, HTMLResponse, JSONResponse, PlainTextResponse
+from mcp_strava.settings import HOST, PORT, POKE_API_KEY, STRAVA_VERIFY_TOKEN, STATE_BACKEND, WORKERS
 
 # ========= MCP Server Setup =========
+# OAuth, token storage and webhook management are imported inside the routes that use them
 from mcp_strava.app import mcp as mcp_server
-from mcp_strava.services.strava_webhook import verify_webhook, handle_webhook_event
-from mcp_strava.services.strava_oauth import authorize_url, exchange_code, refresh_token
-from mcp_strava.services.token_store import save_tokens
-from mcp_strava.services.strava_client import reload_tokens
+from mcp_strava.services.strava_webhook import verify_webhook, handle_webhook_event, drain_journal, journal_stats
+from mcp_strava.services.export import handle_export
+from mcp_strava.services import admission, lifecycle, memory, snapshot
 
 
 print("[MCP] Adding custom routes to FastMCP server")
@@ -19,12 +24,23 @@ print("[MCP] Adding custom routes to FastMCP server")
 # ========= Health & Info Routes =========
 @mcp_server.custom_route("/healthz", methods=["GET"])
 async def healthz(request):
-    return JSONResponse({"status": "healthy"})
+    from mcp_strava.services.strava_client import circuit_status
+    admitted = admission.stats()
+    from mcp_strava.services.digests import stats as digest_stats
+    admitted["webhook"]["journal"] = await asyncio.to_thread(journal_stats)
+    digests = await asyncio.to_thread(digest_stats)
+    return JSONResponse({"status": "healthy", "strava": circuit_status(), "admission": admitted, "digests": digests})
+
+@mcp_server.custom_route("/metrics", methods=["GET"])
+async def metrics(request):
+    # Prometheus text format: memory accounts and caches, then admission gates (this worker only)
+    lines = memory.metrics_lines() + admission.metrics_lines()
+    return PlainTextResponse("\n".join(lines) + "\n", media_type="text/plain; version=0.0.4")
 
 @mcp_server.custom_route("/", methods=["GET"])
 async def root(request):
     print(f"[ROOT] Request from {request.client.host if request.client else 'unknown'}")
-    return JSONResponse({"ok": True, "routes": ["/ (MCP endpoints)", "/strava/webhook", "/healthz"]})
+    return JSONResponse({"ok": True, "routes": [f"{MCP_PATH} (MCP endpoints)", "/strava/webhook", "/export/activities", "/healthz", "/metrics"]})
 
 # ========= Strava Webhook Routes =========
 @mcp_server.custom_route("/strava/webhook", methods=["GET"])
@@ -37,52 +53,80 @@ async def handle_strava_webhook(request):
     print(f"[WEBHOOK] Headers: {dict(request.headers)}")
     return await handle_webhook_event(request)
 
+# ========= Export =========
+@mcp_server.custom_route("/export/activities", methods=["GET"])
+async def export_activities(request):
+    return await handle_export(request)
+
 # ========= OAuth Strava (via MCP custom routes) =========
 @mcp_server.custom_route("/auth/strava/start", methods=["GET"])
 async def auth_start(request):
+    from mcp_strava.services.strava_oauth import authorize_url
     return RedirectResponse(authorize_url(state="ok"))
 
+async def _after_auth(athlete_id: int, athlete_name: str) -> None:
+    """Post sign-in work, off the callback: Poke welcome message, then warm this athlete's data"""
+    from mcp_strava.services.poke import send_poke
+    from mcp_strava.services.strava_client import as_athlete, get_recent_activities
+    from mcp_strava.services import activity_store
+
+    features_message = f"user {athlete_name} connected strava successfully! tell them in casual poke style about available features: weekly summaries, search workouts by date/range, recent activities, and analyze specific workouts. they can ask for weekly stats, activities from specific dates, or workout analysis anytime."
+    send_result = await asyncio.to_thread(send_poke, features_message, athlete_id)
+    print(f"[AUTH] Sent features overview to Poke: {send_result}")
+
+    def warm():
+        with as_athlete(athlete_id):
+            get_recent_activities()
+            activity_store.ensure_synced(athlete_id)
+    try:
+        await asyncio.to_thread(warm)
+        print(f"[AUTH] Warmed caches and activity index for athlete {athlete_id}")
+    except Exception as e:
+        print(f"[AUTH] Warm-up for athlete {athlete_id} failed: {e!r}")
+
 @mcp_server.custom_route("/auth/strava/callback", methods=["GET"])
 async def auth_callback(request):
+    from mcp_strava.services.strava_oauth import exchange_code_async
+    from mcp_strava.services.token_store import save_tokens, may_register
+    from mcp_strava.services.strava_client import reload_tokens
+    from mcp_strava.services.webhook_manager import subscription_status, refresh_subscription_status
+
     code = request.query_params.get("code")
     if not code:
         return HTMLResponse("<h1>Missing ?code</h1>", status_code=400)
     
     try:
         print(f"[AUTH] Exchanging code: {code[:10]}...")
-        data = exchange_code(code)
+        data = await exchange_code_async(code)
         print(f"[AUTH] Got data keys: {list(data.keys())}")
+
+        signing_in = (data.get("athlete") or {}).get("id")
+        if not signing_in or not await asyncio.to_thread(may_register, signing_in):
+            print(f"[AUTH] Refused sign-in of athlete {signing_in}: not in ALLOWED_ATHLETES / not the owner")
+            return HTMLResponse("<h1>Not allowed</h1><p>This server is private: this Strava account can't be connected.</p>",
+                                status_code=403)
         
-        print(f"[AUTH] Saving tokens...")
-        save_tokens(data)
-        print(f"[AUTH] Tokens saved successfully")
-        
-        # Reload tokens in the Strava client
-        reload_tokens()
-        print(f"[AUTH] Tokens reloaded in Strava client")
+        # registers the athlete (keyed by Strava athlete id) and reloads the Strava client
+        athlete_id = await asyncio.to_thread(save_tokens, data)
+        await asyncio.to_thread(reload_tokens, athlete_id)
+        print(f"[AUTH] Tokens saved and reloaded for athlete {athlete_id}")
 
         a = (data.get("athlete") or {})
         athlete_name = f"{a.get('firstname', '')} {a.get('lastname', '')}".strip()
-        
-        # Check if webhook is already configured
-        from mcp_strava.services.webhook_manager import list_webhook_subscriptions
-        from mcp_strava.services.poke import send_poke
-        
-        webhook_status = list_webhook_subscriptions()
-        has_webhook = webhook_status.get("status") == "success" and len(webhook_status.get("subscriptions", [])) > 0
-        
-        # Always send feature overview (no webhook setup via auth)
-        features_message = f"user {athlete_name} connected strava successfully! tell them in casual poke style about available features: weekly summaries, search workouts by date/range, recent activities, and analyze specific workouts. they can ask for weekly stats, activities from specific dates, or workout analysis anytime."
-        
-        send_result = send_poke(features_message)
-        print(f"[AUTH] Sent features overview to Poke: {send_result}")
-        
-        webhook_status_text = "configured" if has_webhook else "not configured (manual setup required)"
+        lifecycle.spawn(_after_auth(athlete_id, athlete_name), name=f"after_auth:{athlete_id}")
+
+        # Cached view, refreshed in the background and on create/delete
+        has_webhook = subscription_status()["active"]
+        if has_webhook is None:
+            lifecycle.spawn(refresh_subscription_status(), name="webhook_status")
+            webhook_status_text = "being checked"
+        else:
+            webhook_status_text = "configured" if has_webhook else "not configured (manual setup required)"
         
         body = f"""
         <h1>Connected ✅</h1>
         <p>Athlete: <b>{athlete_name}</b> (ID {a.get('id')})</p>
-        <p>📱 We've sent a message to Poke with all available features.</p>
+        <p>📱 We're sending a message to Poke with all available features.</p>
         <p>🔗 Webhook status: {webhook_status_text}</p>
         <p>You can close this tab now.</p>
         """
@@ -96,8 +140,39 @@ async def auth_callback(request):
         return HTMLResponse(f"<h1>Auth error</h1><pre>{e}</pre><hr><pre>{tb}</pre>", status_code=500)
 
 
+# ========= Startup =========
+@lifecycle.on_startup
+def warm_tokens():
+    # Read the token file off the event loop once the server is up, instead of at import
+    from mcp_strava.services.strava_client import ensure_tokens_loaded
+    lifecycle.spawn(asyncio.to_thread(ensure_tokens_loaded), name="warm_tokens")
+
+@lifecycle.on_startup
+def start_snapshots():
+    # Caches restore lazily from the snapshot; this only keeps it fresh
+    lifecycle.spawn(snapshot.run_periodic(), name="snapshot")
+
+@lifecycle.on_startup
+def watch_webhook_subscription():
+    from mcp_strava.services.webhook_manager import refresh_periodically
+    lifecycle.spawn(refresh_periodically(), name="webhook_status")
+
+@lifecycle.on_startup
+def start_journal_drainer():
+    lifecycle.spawn(drain_journal(), name="webhook_journal")
+
+@lifecycle.on_startup
+def start_digests():
+    from mcp_strava.services.digests import run_scheduler
+    lifecycle.spawn(run_scheduler(), name="digests")
+
+lifecycle.on_shutdown(snapshot.save)
+
+
 # Create the ASGI app from FastMCP
-app = mcp_server.http_app()
+# MCP requests go through admission control (limits in settings.py)
+MCP_PATH = "/mcp"
+app = lifecycle.wrap_lifespan(mcp_server.http_app(path=MCP_PATH, middleware=[Middleware(admission.MCPAdmission, path=MCP_PATH)]))
 print("[MCP] Created ASGI app from FastMCP server")
 
 if __name__ == "__main__":
@@ -108,10 +183,20 @@ if __name__ == "__main__":
         return v[:4] + f"…(len {len(v)})" if v else None
     
     print(f"[BOOT] Starting server on {host}:{port}")
-    print("  • MCP endpoints: / (root)")
+    print(f"  • MCP endpoints: {MCP_PATH}")
     print("  • Strava webhook: /strava/webhook")
+    print("  • Activity export: /export/activities")
     print("  • Health check: /healthz")
+    print("  • Metrics: /metrics")
     print(f"[ENV] POKE_API_KEY: {_mask(POKE_API_KEY)}")
     print(f"[ENV] STRAVA_VERIFY_TOKEN: {STRAVA_VERIFY_TOKEN}")
     
-    uvicorn.run(app, host=host, port=port)
+    print(f"[ENV] WORKERS: {WORKERS} (STATE_BACKEND={STATE_BACKEND})")
+    if WORKERS > 1 and STATE_BACKEND != "sqlite":
+        print("[BOOT] ⚠️ several workers with STATE_BACKEND=memory: webhook dedupe and token refresh are per process")
+
+    import uvicorn
+    if WORKERS > 1:
+        uvicorn.run("server:app", host=host, port=port, workers=WORKERS)
+    else:
+        uvicorn.run(app, host=host, port=port)